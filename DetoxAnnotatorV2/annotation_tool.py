@@ -1,15 +1,89 @@
+import argparse
 import gradio as gr
-import pandas as pd
-import time
+import itertools
 import os
 import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from columnar import read_table
+from completion_index import CompletionIndex
+from dashboard import ProgressStats, add_dashboard
+from keyboard import HOTKEYS_CSS, hotkeys_js
+from metrics import METRICS, instrument, phase
+from ordering import make_order, stratum_codes
+from prefetch import Prefetcher
+from session import AnnotationSession, RowLocks
+
+from persistence import DatasetPersistence, SqlitePersistence
 
 # ----- CONFIGURATION -----
-CSV_PATH = input("Enter your file name: ")
+# every option comes from the command line, so the tool starts without prompting
+parser = argparse.ArgumentParser(description="Blind comparison of two detoxification models.")
+parser.add_argument("csv_path", help="Dataset to annotate (CSV, Parquet or Arrow), saved back in place.")
+parser.add_argument("--annotator", required=True, help="Your annotator name.")
+parser.add_argument("--store", choices=["wal", "sqlite"], default="wal",
+                    help='"wal": changes are logged to <csv_path>.wal and the CSV is rewritten every '
+                         '--snapshot_interval seconds; "sqlite": changes are committed to annotations.sqlite '
+                         'next to the CSV, shared with the tool in src/, and the CSV is regenerated on exit.')
+parser.add_argument("--snapshot_interval", type=float, default=30,
+                    help="Seconds between two snapshots of the CSV with the wal store.")
+parser.add_argument("--prefetch", type=int, default=5,
+                    help="Number of upcoming examples each session prepares in the background.")
+parser.add_argument("--page_size", type=int, default=1,
+                    help="Examples shown and submitted together (1: one example at a time).")
+parser.add_argument("--keyboard", action="store_true",
+                    help="Hotkeys (a-e: ratings, 1/2: model choices, Enter: submit, left/right arrows: "
+                         "previous/skip) and saves written in the background.")
+parser.add_argument("--order", choices=["file", "stratified", "adaptive"], default="file",
+                    help='Order of the examples in the one-example view: "file", "stratified" (round-robin '
+                         'over the --stratify_by columns) or "adaptive" (strata where the winner of the two '
+                         'models is the least settled first).')
+parser.add_argument("--stratify_by", nargs="+", default=["style_case"],
+                    help="Columns of the strata of the stratified and adaptive orders.")
+parser.add_argument("--dashboard_refresh", type=float, default=5,
+                    help="Seconds between two refreshes of the dashboard tab.")
+parser.add_argument("--metrics_port", type=int, default=None,
+                    help="Port of the Prometheus metrics endpoint (disabled by default).")
+parser.add_argument("--trace", default=None, help="JSONL file the latency of every handler is appended to.")
+ARGS = parser.parse_args()
+CSV_PATH = ARGS.csv_path
+# "wal": changes are logged to CSV_PATH + ".wal" and the CSV is rewritten every SNAPSHOT_INTERVAL
+# seconds; "sqlite": changes are committed to annotations.sqlite next to the CSV, shared with
+# the tool in src/, and the CSV is regenerated on exit
+STORE = ARGS.store
+# seconds between two snapshots of the CSV (changes are logged to CSV_PATH + ".wal" meanwhile)
+SNAPSHOT_INTERVAL = ARGS.snapshot_interval
+# number of upcoming examples each session prepares in the background
+PREFETCH_DEPTH = ARGS.prefetch
+# examples shown and submitted together (1: one example at a time)
+PAGE_SIZE = ARGS.page_size
+# hotkeys and saves written in the background, so the next example shows without waiting on the disk
+KEYBOARD_MODE = ARGS.keyboard
+# order of the examples in the one-example view
+ORDER = ARGS.order
+STRATIFY_BY = ARGS.stratify_by
+# seconds between two refreshes of the dashboard tab
+DASHBOARD_REFRESH = ARGS.dashboard_refresh
+# port of the Prometheus metrics endpoint (None: disabled) and JSONL trace file of the handlers
+METRICS_PORT = ARGS.metrics_port
+TRACE_PATH = ARGS.trace
+
+RATING_DEFINITIONS = """
+**Rating Definitions:**
+- **A**: Excellent - detoxified and preserves meaning/style.
+- **B**: Good - minor issues.
+- **C**: Fair - moderate issues.
+- **D**: Poor - major flaws.
+- **E**: Very Poor - meaning lost or toxic content remains.
+"""
 
 # ----- LOAD OR INITIALIZE DATAFRAME -----
 if os.path.exists(CSV_PATH):
-    df = pd.read_csv(CSV_PATH)
+    # CSV, Parquet or Arrow; the annotated file is saved back in the same format
+    df = read_table(CSV_PATH)
 else:
     raise FileNotFoundError(f"CSV file not found at {CSV_PATH}")
 
@@ -20,7 +94,9 @@ base_columns = {
     "preferred_transformation": "",
     "user_preferred": "",
     "annotator": "",
-    "annotation_time": ""
+    "annotation_time": "",
+    # number of times the answers of the row were saved, every save being kept in the history
+    "revision": ""
 }
 # style-case and swap flag
 if "style_case" not in df.columns:
@@ -36,40 +112,149 @@ for col, default in base_columns.items():
 # total examples count
 TOTAL_EXAMPLES = len(df)
 
-# Prompt for annotator name
-annotator = input("Enter your annotator name: ").strip()
-while annotator == "":
-    annotator = input("Please enter a valid annotator name: ").strip()
+# replays any changes left in the write-ahead log by a crash, or saved in the database
+if STORE == "sqlite":
+    store = SqlitePersistence(df, CSV_PATH, write_behind=KEYBOARD_MODE)
+else:
+    store = DatasetPersistence(df, CSV_PATH, snapshot_interval=SNAPSHOT_INTERVAL, write_behind=KEYBOARD_MODE)
+
+def is_annotated(frame):
+    """
+    Boolean mask of the rows where both model ratings are filled in.
+    """
+    ratings = frame[['rating_model_detox_mian', 'rating_model_detox_lora']]
+    return (ratings.notna() & (ratings != "")).all(axis=1)
+
+
+# done bitmap next to the CSV, keyed by row position
+completion = CompletionIndex(f"{CSV_PATH}.done", TOTAL_EXAMPLES,
+                             lambda: is_annotated(df).to_numpy().nonzero()[0])
+if int(is_annotated(df).sum()) != completion.done_count:
+    # the sidecar missed changes (e.g. crash between saving and marking)
+    completion.rebuild(lambda: is_annotated(df).to_numpy().nonzero()[0])
+
+# progress shown in the dashboard tab, updated on every submit
+stats = ProgressStats(remaining=lambda: TOTAL_EXAMPLES - completion.done_count, fields=())
+for saved in df[is_annotated(df)].to_dict("records"):
+    # the latest answers of the row, counted once however many times they were edited
+    stats.add(dict(saved, revision=1))
+
+
+def revision_of(idx):
+    """
+    Number of the latest saved revision of the answers of row idx, 0 when never saved.
+    """
+    try:
+        return int(float(df.at[idx, 'revision']))
+    except (TypeError, ValueError):
+        return 0
+
+
+def unchanged(idx, values):
+    """
+    Whether saving `values` would leave the answers of row idx as they are.
+    """
+    def cell(value):
+        # empty cells read back from the file are NaN
+        return "" if value is None or value != value else str(value)
+    return all(cell(df.at[idx, col]) == cell(value) for col, value in values.items())
+
 
-# track timer
-current_start_time = None
+def mian_won(values):
+    """
+    1 when model_detox_mian was preferred over model_detox_lora, 0 when lora was, from the
+    preference or else the ratings (0.5 on a tie). None without an answer.
+    """
+    preferred = values.get('preferred_transformation')
+    if preferred:
+        return 1.0 if preferred == 'Model 1' else 0.0
+    rating_mian = values.get('rating_model_detox_mian')
+    rating_lora = values.get('rating_model_detox_lora')
+    if not (rating_mian and rating_lora):
+        return None
+    # A is the best rating
+    return 0.5 if rating_mian == rating_lora else float(rating_mian < rating_lora)
+
+
+# unannotated examples in the order they are shown, shared by the sessions (None: file order)
+ordering = None
+order_lock = threading.Lock()
+if ORDER != "file" and PAGE_SIZE == 1:
+    annotated = is_annotated(df).to_numpy()
+    ordering = make_order(ORDER, (idx for idx in range(TOTAL_EXAMPLES) if not annotated[idx]),
+                          stratum_codes(df, STRATIFY_BY), mian_won,
+                          observed=zip(annotated.nonzero()[0], df[annotated].to_dict("records")))
+
+annotator = ARGS.annotator.strip()
+if not annotator:
+    parser.error("the annotator name is empty")
+
+# sessions touching the same row are serialized, and each submit checks that the row was
+# not saved by another session since it was displayed (optimistic versioning)
+row_locks = RowLocks()
+row_versions = [0] * TOTAL_EXAMPLES
 
 
 def find_resume_index():
     """
     Find the first index where ratings are incomplete.
     """
-    for i, row in df.iterrows():
-        if pd.isna(row['rating_model_detox_mian']) or row['rating_model_detox_mian'] == "" \
-           or pd.isna(row['rating_model_detox_lora']) or row['rating_model_detox_lora'] == "":
-            return i
-    return len(df) - 1
+    idx = next_pending()
+    return len(df) - 1 if idx is None else idx
 
 
-def load_example(idx):
+def next_pending(after=0):
     """
-    Load the example at idx, decide swap_flag if needed, and return display values.
+    Next unannotated example to show, taken from the ordering when there is one, or the
+    first one from `after` on in file order. None once every example is annotated.
     """
-    global current_start_time, df
-    # decide swap once
-    if df.at[idx, 'swap_flag'] == "":
-        df.at[idx, 'swap_flag'] = random.choice([True, False])
-        df.to_csv(CSV_PATH, index=False)
+    if ordering is not None:
+        with order_lock:
+            while ordering:
+                idx = ordering.popleft()
+                if not completion.is_done(idx):
+                    return idx
+    # also catches examples taken from the ordering but never submitted
+    return completion.next_pending(after)
 
-    swapped = df.at[idx, 'swap_flag']
-    row = df.loc[idx]
-    # start timing
-    current_start_time = time.time()
+
+def upcoming(idx):
+    """
+    Examples likely shown after idx, prepared in the background.
+    """
+    if ordering is None:
+        return completion.pending_after(idx, PREFETCH_DEPTH)
+    with order_lock:
+        return list(itertools.islice(ordering, PREFETCH_DEPTH))
+
+
+def give_back(idx, first=True):
+    """
+    Put an example left unannotated back in the ordering, to be shown next or (`first=False`)
+    after the rest of its stratum.
+    """
+    if ordering is not None and not completion.is_done(idx):
+        with order_lock:
+            if first:
+                ordering.appendleft(idx)
+            else:
+                ordering.append(idx)
+
+
+def prepare_example(idx):
+    """
+    Decide swap_flag for the example at idx if needed and build its display values.
+    Returns the row version they were read at, the swap flag and the display values.
+    """
+    with row_locks[idx]:
+        # decide swap once
+        if df.at[idx, 'swap_flag'] == "":
+            store.update(idx, {'swap_flag': random.choice([True, False])})
+
+        swapped = df.at[idx, 'swap_flag']
+        with phase("build"):
+            row = df.loc[idx]
+        version = row_versions[idx]
 
     # raw texts
     original = row['comment']
@@ -95,7 +280,7 @@ def load_example(idx):
         pref = row['preferred_transformation'] or None
         upref = row['user_preferred'] or None
 
-    return (
+    return version, swapped, (
         original,
         text_model1,
         text_model2,
@@ -107,22 +292,31 @@ def load_example(idx):
     )
 
 
+def load_example(session, idx):
+    """
+    Load the example at idx into the session and return display values.
+    The following unannotated examples are prepared in the background meanwhile.
+    """
+    if session.buffer is None:
+        session.buffer = Prefetcher(prepare_example, PREFETCH_DEPTH)
+    # saved answers prepared in advance are only used if nobody saved the row since
+    version, swapped, values = session.buffer.get(idx, fresh=lambda prepared: prepared[0] == row_versions[idx])
+    # start timing
+    session.start(idx, version, swapped)
+    session.buffer.schedule(upcoming(idx))
+    return values
+
+
 def format_index_text(idx):
     return f"Example {idx+1} out of {TOTAL_EXAMPLES}"
 
 
-def submit_annotation(idx, rating1, rating2, preferred, user_preferred):
+def answer_values(swapped, rating1, rating2, preferred, user_preferred):
     """
-    Save the annotation (mapping back if swapped), then load next.
+    Columns to save for the answers given on a (possibly swapped) example.
     """
-    global current_start_time, df, annotator
-    elapsed = time.time() - (current_start_time or time.time())
-    swapped = df.at[idx, 'swap_flag']
-
     # map ratings back to true columns
     if swapped:
-        df.at[idx, 'rating_model_detox_lora'] = rating1 or ""
-        df.at[idx, 'rating_model_detox_mian'] = rating2 or ""
         # flip user prefs back
         real_pref = ''
         real_user = ''
@@ -130,23 +324,70 @@ def submit_annotation(idx, rating1, rating2, preferred, user_preferred):
             real_pref = 'Model 2' if preferred=='Model 1' else 'Model 1'
         if user_preferred:
             real_user = 'Model 2' if user_preferred=='Model 1' else 'Model 1'
-        df.at[idx, 'preferred_transformation'] = real_pref
-        df.at[idx, 'user_preferred'] = real_user
+        values = {
+            'rating_model_detox_lora': rating1 or "",
+            'rating_model_detox_mian': rating2 or "",
+            'preferred_transformation': real_pref,
+            'user_preferred': real_user,
+        }
     else:
-        df.at[idx, 'rating_model_detox_mian'] = rating1 or ""
-        df.at[idx, 'rating_model_detox_lora'] = rating2 or ""
-        df.at[idx, 'preferred_transformation'] = preferred or ""
-        df.at[idx, 'user_preferred'] = user_preferred or ""
+        values = {
+            'rating_model_detox_mian': rating1 or "",
+            'rating_model_detox_lora': rating2 or "",
+            'preferred_transformation': preferred or "",
+            'user_preferred': user_preferred or "",
+        }
+    return values
 
-    df.at[idx, 'annotator'] = annotator
-    df.at[idx, 'annotation_time'] = elapsed
-    df.to_csv(CSV_PATH, index=False)
 
-    # advance
-    next_idx = idx+1 if idx+1 < len(df) else idx
-    (orig, t1, t2, sr1, sr2, sp, sup, style) = load_example(next_idx)
+@instrument
+def submit_annotation(session, rating1, rating2, preferred, user_preferred):
+    """
+    Save the annotation (mapping back if swapped), then load next.
+    """
+    idx = session.index
+    elapsed = session.elapsed()
+    values = answer_values(session.swapped, rating1, rating2, preferred, user_preferred)
+    with row_locks[idx]:
+        conflict = row_versions[idx] != session.version
+        # an example shown again with its answers left as they were is not saved again
+        if not conflict and not unchanged(idx, values):
+            values['annotator'] = session.annotator
+            values['annotation_time'] = elapsed
+            values['revision'] = revision_of(idx) + 1
+            store.update(idx, values)
+            completion.mark(idx, bool(values['rating_model_detox_mian'] and values['rating_model_detox_lora']))
+            row_versions[idx] += 1
+            stats.add(dict(values, timestamp=time.time()))
+            if ordering is not None:
+                with order_lock:
+                    ordering.observe(idx, values)
+
+    if conflict:
+        (orig, t1, t2, sr1, sr2, sp, sup, style) = load_example(session, idx)
+        return (
+            session,
+            format_index_text(idx),
+            orig,
+            t1,
+            t2,
+            sr1,
+            sr2,
+            sp,
+            sup,
+            style,
+            "This example was saved from another session meanwhile, its latest answers are shown. Please submit again."
+        )
+
+    # advance; an example submitted with ratings missing comes back later
+    give_back(idx, first=False)
+    next_idx = next_pending(idx+1)
+    if next_idx is None:
+        next_idx = idx+1 if idx+1 < len(df) else idx
+    session.history.append(idx)
+    (orig, t1, t2, sr1, sr2, sp, sup, style) = load_example(session, next_idx)
     return (
-        next_idx,
+        session,
         format_index_text(next_idx),
         orig,
         t1,
@@ -160,14 +401,20 @@ def submit_annotation(idx, rating1, rating2, preferred, user_preferred):
     )
 
 
-def go_previous(idx):
+@instrument
+def go_previous(session):
     """
     Move back one example and reload.
     """
-    prev_idx = max(0, idx-1)
-    (orig, t1, t2, r1, r2, p, up, style) = load_example(prev_idx)
+    if ordering is None:
+        prev_idx = max(0, session.index-1)
+    else:
+        # the example shown before this one, which is shown again next
+        give_back(session.index)
+        prev_idx = session.history.pop() if session.history else session.index
+    (orig, t1, t2, r1, r2, p, up, style) = load_example(session, prev_idx)
     return (
-        prev_idx,
+        session,
         format_index_text(prev_idx),
         orig,
         t1,
@@ -179,73 +426,248 @@ def go_previous(idx):
         style
     )
 
+
+@instrument
+def go_next(session):
+    """
+    Skip to the next example without saving.
+    """
+    if ordering is None:
+        next_idx = min(len(df) - 1, session.index+1)
+    else:
+        # the skipped example comes back after the rest of its stratum
+        give_back(session.index, first=False)
+        next_idx = next_pending(session.index)
+        if next_idx is None:
+            next_idx = session.index
+        session.history.append(session.index)
+    (orig, t1, t2, r1, r2, p, up, style) = load_example(session, next_idx)
+    return (session, format_index_text(next_idx), orig, t1, t2, r1, r2, p, up, style)
+
+
+@instrument
+def load_initial(session):
+    idx = find_resume_index()
+    (orig, t1, t2, r1, r2, p, up, style) = load_example(session, idx)
+    return (session, format_index_text(idx), orig, t1, t2, r1, r2, p, up, style, "")
+
+
+# ----- BATCHED PAGE VIEW (PAGE_SIZE > 1) -----
+def page_rows(page):
+    return list(range(page * PAGE_SIZE, min((page + 1) * PAGE_SIZE, TOTAL_EXAMPLES)))
+
+
+def format_page_text(page):
+    rows = page_rows(page)
+    return f"Examples {rows[0]+1}-{rows[-1]+1} out of {TOTAL_EXAMPLES}"
+
+
+def load_page(session, page):
+    """
+    Load the examples of `page` into the session and return the outputs of every slot.
+    The next page is prepared in the background meanwhile.
+    """
+    if session.buffer is None:
+        session.buffer = Prefetcher(prepare_example, max(PREFETCH_DEPTH, PAGE_SIZE))
+    shown = {}
+    for idx in page_rows(page):
+        shown[idx] = session.buffer.get(idx, fresh=lambda prepared, idx=idx: prepared[0] == row_versions[idx])
+    session.start_page(list(shown), shown)
+    session.buffer.schedule(page_rows(page + 1))
+
+    outputs = []
+    for slot in range(PAGE_SIZE):
+        if slot < len(session.page):
+            orig, t1, t2, r1, r2, p, up, style = shown[session.page[slot]][2]
+            outputs += [gr.update(visible=True), style, orig, t1, t2, r1, r2, p, up]
+        else:
+            outputs += [gr.update(visible=False), "", "", "", "", None, None, None, None]
+    return outputs
+
+
+@instrument
+def submit_page(session, *answers):
+    """
+    Save every example of the page whose answers changed in one write, then load the next
+    page holding unannotated examples.
+    """
+    page = session.index // PAGE_SIZE
+    changes = []
+    for slot, idx in enumerate(session.page):
+        version, swapped, shown = session.shown[idx]
+        given = answers[slot * 4:(slot + 1) * 4]
+        # examples left as they were shown are not saved again
+        if tuple(answer or None for answer in given) != tuple(shown[3:7]):
+            changes.append((idx, version, answer_values(swapped, *given)))
+
+    elapsed = session.elapsed()
+    with row_locks.many(session.page):
+        saved = [(idx, values) for idx, version, values in changes if row_versions[idx] == version]
+        for idx, values in saved:
+            values['annotator'] = session.annotator
+            values['annotation_time'] = elapsed / len(saved)
+            values['revision'] = revision_of(idx) + 1
+        if saved:
+            store.update_many(saved)
+        for idx, values in saved:
+            completion.mark(idx, bool(values['rating_model_detox_mian'] and values['rating_model_detox_lora']))
+            row_versions[idx] += 1
+            stats.add(dict(values, timestamp=time.time()))
+
+    if len(saved) < len(changes):
+        return [session, format_page_text(page)] + load_page(session, page) + [
+            f"{len(changes) - len(saved)} examples were saved from another session meanwhile, their latest answers "
+            "are shown. Please submit the page again."]
+
+    # advance
+    next_idx = completion.next_pending((page + 1) * PAGE_SIZE)
+    if next_idx is None:
+        next_page = page + 1 if (page + 1) * PAGE_SIZE < TOTAL_EXAMPLES else page
+    else:
+        next_page = next_idx // PAGE_SIZE
+    return [session, format_page_text(next_page)] + load_page(session, next_page) + [
+        f"{len(saved)} annotations saved in {elapsed:.2f} seconds."]
+
+
+@instrument
+def go_previous_page(session):
+    """
+    Move back one page and reload.
+    """
+    prev_page = max(0, session.index // PAGE_SIZE - 1)
+    return [session, format_page_text(prev_page)] + load_page(session, prev_page)
+
+
+@instrument
+def load_initial_page(session):
+    page = find_resume_index() // PAGE_SIZE
+    return [session, format_page_text(page)] + load_page(session, page) + [""]
+
+
 # ----- BUILD THE GRADIO INTERFACE -----
-with gr.Blocks() as demo:
-    current_index_state = gr.State(find_resume_index())
+# keyboard mode of the one-example view
+hotkeys = None
+if KEYBOARD_MODE and PAGE_SIZE == 1:
+    hotkeys = hotkeys_js(
+        [("rating_model1", {key: key.upper() for key in "abcde"}),
+         ("rating_model2", {key: key.upper() for key in "abcde"}),
+         ("preferred_trans", {"1": "Model 1", "2": "Model 2"}),
+         ("user_pref", {"1": "Model 1", "2": "Model 2"})],
+        {"Enter": "submit_btn", "ArrowLeft": "prev_btn", "ArrowRight": "skip_btn"})
+
+with gr.Blocks(css=HOTKEYS_CSS, js=hotkeys) as demo:
+    session_state = gr.State(AnnotationSession(annotator))
     gr.Markdown("## Annotation Tool")
     gr.Markdown(f"Annotator: {annotator}")
 
-    with gr.Row():
-        with gr.Column():
-            style_text    = gr.Textbox(label="Style", interactive=False)
-            original_text = gr.Textbox(label="Original Text", interactive=False, lines=5)
-            model1_text   = gr.Textbox(label="Transformed Text (Model 1)", interactive=False, lines=5)
-            model2_text   = gr.Textbox(label="Transformed Text (Model 2)", interactive=False, lines=5)
-
-        with gr.Column():
-            rating_options = ["A","B","C","D","E"]
-            rating_model1  = gr.Radio(rating_options, label="Rating for Model 1", value=None)
-            rating_model2  = gr.Radio(rating_options, label="Rating for Model 2", value=None)
-            preferred_trans= gr.Radio(["Model 1","Model 2"], label="Which one keeps the semantics better?", value=None)
-            user_pref      = gr.Radio(["Model 1","Model 2"], label="Which one would you prefer for personal usage?", value=None)
-            gr.Markdown(
-                """
-                **Rating Definitions:**
-                - **A**: Excellent - detoxified and preserves meaning/style.
-                - **B**: Good - minor issues.
-                - **C**: Fair - moderate issues.
-                - **D**: Poor - major flaws.
-                - **E**: Very Poor - meaning lost or toxic content remains.
-                """
-            )
-
-    with gr.Row():
-        prev_btn   = gr.Button("Previous")
-        submit_btn = gr.Button("Submit Annotation")
-    current_index_txt = gr.Textbox(label="Current Example Index", interactive=False)
-    annotation_msg    = gr.Markdown("")
+    with gr.Tab("Annotate"):
+        rating_options = ["A","B","C","D","E"]
+        if PAGE_SIZE > 1:
+            page_slots = []
+            for slot in range(PAGE_SIZE):
+                with gr.Group(visible=False) as slot_group:
+                    with gr.Row():
+                        with gr.Column(scale=2):
+                            slot_style    = gr.Textbox(label="Style", interactive=False)
+                            slot_original = gr.Textbox(label=f"Original Text {slot+1}", interactive=False, lines=3)
+                        with gr.Column(scale=2):
+                            slot_model1   = gr.Textbox(label="Transformed Text (Model 1)", interactive=False, lines=3)
+                            slot_model2   = gr.Textbox(label="Transformed Text (Model 2)", interactive=False, lines=3)
+                        with gr.Column(scale=2):
+                            slot_rating1  = gr.Radio(rating_options, label="Rating for Model 1", value=None)
+                            slot_rating2  = gr.Radio(rating_options, label="Rating for Model 2", value=None)
+                            slot_pref     = gr.Radio(["Model 1","Model 2"], label="Which one keeps the semantics better?", value=None)
+                            slot_user     = gr.Radio(["Model 1","Model 2"], label="Which one would you prefer for personal usage?", value=None)
+                page_slots.append((slot_group, [slot_style, slot_original, slot_model1, slot_model2],
+                                   [slot_rating1, slot_rating2, slot_pref, slot_user]))
+            gr.Markdown(RATING_DEFINITIONS)
+
+            with gr.Row():
+                prev_btn   = gr.Button("Previous Page")
+                submit_btn = gr.Button("Submit Page")
+            current_index_txt = gr.Textbox(label="Current Examples", interactive=False)
+            annotation_msg    = gr.Markdown("")
+        else:
+            with gr.Row():
+                with gr.Column():
+                    style_text    = gr.Textbox(label="Style", interactive=False)
+                    original_text = gr.Textbox(label="Original Text", interactive=False, lines=5)
+                    model1_text   = gr.Textbox(label="Transformed Text (Model 1)", interactive=False, lines=5)
+                    model2_text   = gr.Textbox(label="Transformed Text (Model 2)", interactive=False, lines=5)
+
+                with gr.Column():
+                    rating_model1  = gr.Radio(rating_options, label="Rating for Model 1", value=None, elem_id="rating_model1")
+                    rating_model2  = gr.Radio(rating_options, label="Rating for Model 2", value=None, elem_id="rating_model2")
+                    preferred_trans= gr.Radio(["Model 1","Model 2"], label="Which one keeps the semantics better?", value=None,
+                                              elem_id="preferred_trans")
+                    user_pref      = gr.Radio(["Model 1","Model 2"], label="Which one would you prefer for personal usage?", value=None,
+                                              elem_id="user_pref")
+                    gr.Markdown(RATING_DEFINITIONS)
+
+            with gr.Row():
+                prev_btn   = gr.Button("Previous", elem_id="prev_btn")
+                skip_btn   = gr.Button("Skip", elem_id="skip_btn", visible=KEYBOARD_MODE)
+                submit_btn = gr.Button("Submit Annotation", elem_id="submit_btn")
+            current_index_txt = gr.Textbox(label="Current Example Index", interactive=False)
+            annotation_msg    = gr.Markdown("")
+
+    with gr.Tab("Dashboard"):
+        add_dashboard(stats.summary, DASHBOARD_REFRESH)
 
     # callbacks
-    submit_btn.click(
-        submit_annotation,
-        inputs=[current_index_state, rating_model1, rating_model2, preferred_trans, user_pref],
-        outputs=[current_index_state, current_index_txt,
-                 original_text, model1_text, model2_text,
-                 rating_model1, rating_model2, preferred_trans, user_pref,
-                 style_text, annotation_msg]
-    )
-    prev_btn.click(
-        go_previous,
-        inputs=current_index_state,
-        outputs=[current_index_state, current_index_txt,
-                 original_text, model1_text, model2_text,
-                 rating_model1, rating_model2, preferred_trans, user_pref,
-                 style_text]
-    )
-
-    def load_initial():
-        idx = find_resume_index()
-        (orig, t1, t2, r1, r2, p, up, style) = load_example(idx)
-        return (idx, format_index_text(idx), orig, t1, t2, r1, r2, p, up, style, "")
-
-    demo.load(
-        load_initial,
-        inputs=[],
-        outputs=[current_index_state, current_index_txt,
-                 original_text, model1_text, model2_text,
-                 rating_model1, rating_model2, preferred_trans, user_pref,
-                 style_text, annotation_msg]
-    )
+    if PAGE_SIZE > 1:
+        page_outputs = [component for group, texts, answers in page_slots for component in [group] + texts + answers]
+        submit_btn.click(
+            submit_page,
+            inputs=[session_state] + [component for _, _, answers in page_slots for component in answers],
+            outputs=[session_state, current_index_txt] + page_outputs + [annotation_msg]
+        )
+        prev_btn.click(go_previous_page, inputs=session_state, outputs=[session_state, current_index_txt] + page_outputs)
+        demo.load(load_initial_page, inputs=session_state,
+                  outputs=[session_state, current_index_txt] + page_outputs + [annotation_msg])
+    else:
+        submit_btn.click(
+            submit_annotation,
+            inputs=[session_state, rating_model1, rating_model2, preferred_trans, user_pref],
+            outputs=[session_state, current_index_txt,
+                     original_text, model1_text, model2_text,
+                     rating_model1, rating_model2, preferred_trans, user_pref,
+                     style_text, annotation_msg]
+        )
+        prev_btn.click(
+            go_previous,
+            inputs=session_state,
+            outputs=[session_state, current_index_txt,
+                     original_text, model1_text, model2_text,
+                     rating_model1, rating_model2, preferred_trans, user_pref,
+                     style_text]
+        )
+
+        skip_btn.click(
+            go_next,
+            inputs=session_state,
+            outputs=[session_state, current_index_txt,
+                     original_text, model1_text, model2_text,
+                     rating_model1, rating_model2, preferred_trans, user_pref,
+                     style_text]
+        )
+
+        demo.load(
+            load_initial,
+            inputs=session_state,
+            outputs=[session_state, current_index_txt,
+                     original_text, model1_text, model2_text,
+                     rating_model1, rating_model2, preferred_trans, user_pref,
+                     style_text, annotation_msg]
+        )
+
+METRICS.instrument_blocks(demo)
 
 if __name__ == "__main__":
+    if TRACE_PATH:
+        METRICS.trace_to(TRACE_PATH)
+    if METRICS_PORT:
+        METRICS.serve(METRICS_PORT)
+    # handlers of different sessions may run in parallel
+    demo.queue(default_concurrency_limit=None)
     demo.launch()
@@ -0,0 +1,253 @@
+import atexit
+import json
+import os
+import threading
+
+from columnar import write_table
+from committer import BackgroundCommitter
+from metrics import add_bytes, phase
+
+
+def _jsonable(value):
+    # numpy scalars coming from the DataFrame are not JSON serializable
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+class DatasetPersistence:
+    """
+    Persist cell changes of the annotated dataset without rewriting the CSV on every submit.
+
+    Every change is appended to `<csv_path>.wal` as one small JSON line and fsync'd before
+    returning. The full CSV is only rewritten by `snapshot()`, which runs every
+    `snapshot_interval` seconds, after `max_pending` changes and on shutdown, and writes to a
+    temporary file that atomically replaces the CSV. Changes left in the log by a crash are
+    replayed on startup. Before the log is cleared, its lines are appended to
+    `<csv_path>.history`, which keeps every change (each saved revision of the answers) while
+    the CSV only holds the latest one.
+
+    With `write_behind`, the dataset is updated at once but the log is written by a
+    background thread, so `update` never waits on the disk. Changes the log keeps refusing
+    are appended to `<csv_path>.unsaved.jsonl`.
+    """
+
+    def __init__(self, df, csv_path, snapshot_interval=30.0, max_pending=500, write_behind=False):
+        self.df = df
+        self.csv_path = csv_path
+        self.wal_path = f"{csv_path}.wal"
+        self.history_path = f"{csv_path}.history"
+        self.snapshot_interval = snapshot_interval
+        self.max_pending = max_pending
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._committer = BackgroundCommitter(self._log, fallback_path=f"{csv_path}.unsaved.jsonl") \
+            if write_behind else None
+
+        replayed = self._replay()
+        self._wal = open(self.wal_path, "a", encoding="utf-8")
+        if replayed:
+            print(f"Recovered {replayed} unsaved changes from {self.wal_path}")
+            self.snapshot()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._snapshot_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _replay(self):
+        if not os.path.exists(self.wal_path):
+            return 0
+        count = 0
+        with open(self.wal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn last line from a crash in the middle of a write
+                    continue
+                for col, value in record["values"].items():
+                    self.df.at[record["idx"], col] = value
+                count += 1
+        return count
+
+    def update(self, idx, values):
+        """
+        Set `values` ({column: value}) on row `idx` and log the change durably.
+        """
+        self.update_many([(idx, values)])
+
+    def update_many(self, changes):
+        """
+        Apply a list of (idx, values) changes with a single write and fsync of the log.
+        """
+        changes = [(idx, {col: _jsonable(v) for col, v in values.items()}) for idx, values in changes]
+        lines = "".join(json.dumps({"idx": int(idx), "values": values}, ensure_ascii=False) + "\n"
+                        for idx, values in changes)
+        if self._committer is not None:
+            with self._lock:
+                self._apply(changes)
+            self._committer.put(lines)
+            return
+        with phase("write"), self._lock:
+            self._log([lines], snapshot=False)
+            self._apply(changes)
+            if self._pending >= self.max_pending:
+                self.snapshot()
+
+    def _log(self, batches, snapshot=True):
+        """
+        Append the JSON lines of `batches` to the log and fsync it.
+        """
+        lines = "".join(batches)
+        add_bytes(written=len(lines.encode("utf-8")))
+        with self._lock:
+            self._wal.write(lines)
+            self._wal.flush()
+            os.fsync(self._wal.fileno())
+            self._pending += lines.count("\n")
+            if snapshot and self._pending >= self.max_pending:
+                self.snapshot()
+
+    def _apply(self, changes):
+        for idx, values in changes:
+            for col, value in values.items():
+                self.df.at[idx, col] = value
+
+    def snapshot(self):
+        """
+        Atomically write the whole dataset to the CSV and start a fresh log.
+        """
+        with phase("write"), self._lock:
+            tmp_path = f"{self.csv_path}.tmp"
+            write_table(self.df, tmp_path, format_path=self.csv_path)
+            with open(tmp_path, "rb+") as f:
+                os.fsync(f.fileno())
+            add_bytes(written=os.path.getsize(tmp_path))
+            os.replace(tmp_path, self.csv_path)
+            self._keep_history()
+            # replaying a log that is already in the snapshot is harmless, so a crash
+            # between the rename and the truncation loses nothing (the history may then hold
+            # the same lines twice, with the same revision numbers)
+            self._wal.truncate(0)
+            self._wal.seek(0)
+            self._pending = 0
+
+    def _keep_history(self):
+        """
+        Append the lines of the log to the history file, one sequential write per snapshot.
+        """
+        self._wal.flush()
+        with open(self.wal_path, encoding="utf-8") as f:
+            lines = f.read()
+        if not lines:
+            return
+        if not lines.endswith("\n"):
+            # torn last line from a crash: the next lines must start on a line of their own
+            lines += "\n"
+        with open(self.history_path, "a", encoding="utf-8") as history:
+            history.write(lines)
+            history.flush()
+            os.fsync(history.fileno())
+        add_bytes(written=len(lines.encode("utf-8")))
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.snapshot_interval):
+            if self._pending:
+                self.snapshot()
+
+    def close(self):
+        if self._wal.closed:
+            return
+        if self._committer is not None:
+            self._committer.close()
+        self._stop.set()
+        with self._lock:
+            if self._pending:
+                self.snapshot()
+            self._wal.close()
+
+
+class SqlitePersistence:
+    """
+    Same interface as DatasetPersistence, on the SQLite database shared with the tool in src/
+    (`annotations.sqlite` next to the CSV, see src/sqlite_store.py).
+
+    Every change is one committed row of the `annotations` table, so sessions and processes
+    write concurrently without rewriting any file. The CSV is only regenerated by `snapshot()`,
+    on shutdown or with `python src/sqlite_store.py`. With `write_behind`, the commits are made
+    by a background thread, and changes the database keeps refusing are appended to
+    `<csv_path>.unsaved.jsonl`.
+    """
+
+    def __init__(self, df, csv_path, write_behind=False):
+        from sqlite_store import DATABASE_NAME, AnnotationDatabase
+
+        self.df = df
+        self.csv_path = csv_path
+        self.dataset = os.path.basename(csv_path)
+        self.db = AnnotationDatabase(os.path.join(os.path.dirname(os.path.abspath(csv_path)), DATABASE_NAME))
+        self.db.register_dataset(self.dataset, "inplace", df.columns, csv_path)
+        self.db.add_source_rows(self.dataset, df)
+        # annotations are keyed like the source rows: by the `row_id` of the dataset when it
+        # has one (e.g. batches of split.py), else by position
+        self.row_ids = df["row_id"].astype(str).tolist() if "row_id" in df.columns else [str(i) for i in range(len(df))]
+        positions = {row_id: pos for pos, row_id in enumerate(self.row_ids)}
+        self._lock = threading.RLock()
+        self._closed = False
+        self._committer = BackgroundCommitter(self._commit, fallback_path=f"{csv_path}.unsaved.jsonl") \
+            if write_behind else None
+
+        # answers saved since the CSV was last exported
+        for row_id, values in self.db.latest_values(self.dataset).items():
+            if row_id not in positions:
+                continue
+            for col, value in values.items():
+                self.df.at[positions[row_id], col] = value
+        atexit.register(self.close)
+
+    def update(self, idx, values):
+        """
+        Set `values` ({column: value}) on row `idx` and commit the change.
+        """
+        self.update_many([(idx, values)])
+
+    def update_many(self, changes):
+        """
+        Apply a list of (idx, values) changes in one transaction.
+        """
+        changes = [(idx, {col: _jsonable(v) for col, v in values.items()}) for idx, values in changes]
+        if self._committer is not None:
+            with self._lock:
+                self._apply(changes)
+            self._committer.put(changes)
+            return
+        with phase("write"), self._lock:
+            self._commit([changes])
+            self._apply(changes)
+
+    def _commit(self, batches):
+        self.db.add_annotations(self.dataset, [(self.row_ids[int(idx)], values.get("annotator", ""), values)
+                                               for changes in batches for idx, values in changes])
+
+    def _apply(self, changes):
+        for idx, values in changes:
+            for col, value in values.items():
+                self.df.at[idx, col] = value
+
+    def snapshot(self):
+        """
+        Regenerate the CSV from the database.
+        """
+        with self._lock:
+            self.db.export_csv(self.dataset, self.csv_path)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            if self._committer is not None:
+                self._committer.close()
+            self.snapshot()
+            self.db.close()
+            self._closed = True
@@ -0,0 +1,319 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from merge import SEQ, TEXT_COLUMNS, TIME, find_annotation_files, latest, read_lines
+
+# Annotation fields of both tools: (measurement level, ordered categories for ordinal fields)
+FIELDS = {
+    # src/main.py
+    "Rating_Neutral": ("ordinal", ["A", "B", "F"]),
+    "Rating_Formal": ("ordinal", ["A", "B", "F"]),
+    "Rating_Friendly": ("ordinal", ["A", "B", "F"]),
+    "suggested_class": ("nominal", None),
+    "tone_of_text": ("nominal", None),
+    # DetoxAnnotatorV2
+    "rating_model_detox_mian": ("ordinal", ["A", "B", "C", "D", "E"]),
+    "rating_model_detox_lora": ("ordinal", ["A", "B", "C", "D", "E"]),
+    "preferred_transformation": ("nominal", None),
+    "user_preferred": ("nominal", None),
+}
+# values that mean "no judgement"
+MISSING = ["", "nan", "None", "SKIPPING"]
+
+
+def read_annotation_file(path):
+    """
+    Read one annotation file of either tool: one line per (item, annotator) with the
+    annotation fields. The item is the `row_id` (the row position when the file has none)
+    together with the text, so rows of different batches never collide. Files are found and
+    read like in merge.py (CSV, Parquet, Arrow or journals), every value as a string.
+    """
+    columns, lines = read_lines(path, lambda column: True)
+    df = pd.DataFrame(lines, columns=columns, dtype=object)
+    fields = [f for f in FIELDS if f in df.columns]
+    if not fields or "annotator" not in df.columns:
+        return pd.DataFrame(columns=["item", "annotator", "style_case", TIME, "revision"])
+
+    row_id = df["row_id"] if "row_id" in df.columns else pd.Series(np.arange(len(df)).astype(str))
+    text_column = next((c for c in TEXT_COLUMNS if c in df.columns), None)
+    item = row_id.str.cat(df[text_column], sep="\x1f") if text_column else row_id
+
+    wide = pd.DataFrame({
+        "item": item,
+        "annotator": df["annotator"],
+        "style_case": df["style_case"] if "style_case" in df.columns else "",
+        # missing or hand-edited timestamps ("") are left to the revision and line order
+        TIME: pd.to_numeric(df["timestamp"], errors="coerce") if "timestamp" in df.columns else np.nan,
+        "revision": df["revision"] if "revision" in df.columns else "",
+    })
+    wide[fields] = df[fields]
+    return wide[wide["annotator"] != ""]
+
+
+def load_annotations(paths, workers=8):
+    """
+    Load every annotation file in parallel into long format: one line per
+    (item, annotator, field, value). When an annotator answered the same item more than once
+    (e.g. after a resume or an edit), only their latest answer is kept, picked like in
+    merge.py: the latest `timestamp`, then the highest `revision`, then the line read last.
+    """
+    files = find_annotation_files(paths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = list(pool.map(read_annotation_file, files))
+    if not frames:
+        return pd.DataFrame(columns=["item", "annotator", "field", "value", "style_case"])
+    wide = pd.concat(frames, ignore_index=True)
+    # lines of later files, then later lines, win ties
+    wide[SEQ] = np.arange(len(wide))
+    wide = latest(wide, ["item", "annotator"])
+    fields = [f for f in FIELDS if f in wide.columns]
+    long = wide.melt(id_vars=["item", "annotator", "style_case"], value_vars=fields,
+                     var_name="field", value_name="value")
+    long = long[long["value"].notna() & ~long["value"].isin(MISSING)]
+    return long.reset_index(drop=True)
+
+
+def count_matrix(field_long, categories=None):
+    """
+    Items x categories matrix of how many annotators chose each category for each item.
+    """
+    item_codes, items = pd.factorize(field_long["item"])
+    value_codes, values = pd.factorize(field_long["value"])
+    values = list(values)
+    ordered = [c for c in (categories or []) if c in values] + \
+              [c for c in values if c not in (categories or [])]
+    position = np.array([ordered.index(v) for v in values], dtype=np.int64)
+    k = len(ordered)
+    n = np.bincount(item_codes * k + position[value_codes], minlength=len(items) * k)
+    return pd.DataFrame(n.reshape(len(items), k), index=items, columns=ordered)
+
+
+def fleiss_kappa(counts):
+    """
+    Fleiss' kappa over items rated at least twice (the number of raters may vary per item).
+    """
+    n = counts[counts.sum(axis=1) >= 2].to_numpy(dtype=float)
+    if len(n) == 0:
+        return np.nan
+    raters = n.sum(axis=1)
+    p_item = ((n ** 2).sum(axis=1) - raters) / (raters * (raters - 1))
+    p_category = n.sum(axis=0) / raters.sum()
+    p_expected = (p_category ** 2).sum()
+    if p_expected == 1:
+        return np.nan
+    return (p_item.mean() - p_expected) / (1 - p_expected)
+
+
+def krippendorff_alpha(counts, level="nominal"):
+    """
+    Krippendorff's alpha from the coincidence matrix, nominal or ordinal (categories must be
+    in their natural order for the ordinal metric).
+    """
+    n = counts[counts.sum(axis=1) >= 2].to_numpy(dtype=float)
+    if len(n) == 0:
+        return np.nan
+    pairable = n.sum(axis=1) - 1
+    coincidences = (n / pairable[:, None]).T @ n - np.diag((n / pairable[:, None]).sum(axis=0))
+    marginals = coincidences.sum(axis=1)
+    total = marginals.sum()
+
+    k = len(marginals)
+    if level == "ordinal":
+        cumulative = np.cumsum(marginals)
+        low, high = np.minimum.outer(np.arange(k), np.arange(k)), np.maximum.outer(np.arange(k), np.arange(k))
+        between = cumulative[high] - np.concatenate(([0], cumulative))[low]
+        delta = (between - (marginals[:, None] + marginals[None, :]) / 2) ** 2
+    else:
+        delta = 1 - np.eye(k)
+    disagreement_observed = (coincidences * delta).sum()
+    disagreement_expected = (np.outer(marginals, marginals) * delta).sum() / (total - 1)
+    if disagreement_expected == 0:
+        return np.nan
+    return 1 - disagreement_observed / disagreement_expected
+
+
+def cohen_kappa(field_long):
+    """
+    Cohen's kappa for every pair of annotators sharing items, and their mean weighted by the
+    number of shared items.
+    """
+    item_codes = pd.factorize(field_long["item"])[0]
+    annotator_codes, annotators = pd.factorize(field_long["annotator"])
+    value_codes, values = pd.factorize(field_long["value"])
+    left = pd.DataFrame({"item": item_codes, "annotator": annotator_codes, "value": value_codes})
+    pairs = left.merge(left, on="item", suffixes=("_a", "_b"))
+    pairs = pairs[annotators.to_numpy()[pairs["annotator_a"]] < annotators.to_numpy()[pairs["annotator_b"]]]
+    if pairs.empty:
+        return np.nan, pd.DataFrame(columns=["annotator_a", "annotator_b", "items", "kappa"])
+
+    # every pair of annotators and category counted with bincount on integer codes
+    a, b = pairs["annotator_a"].to_numpy(), pairs["annotator_b"].to_numpy()
+    pair_codes, pair_index = pd.factorize(a * len(annotators) + b)
+    n_pairs, k = len(pair_index), len(values)
+    items = np.bincount(pair_codes, minlength=n_pairs)
+    observed = np.bincount(pair_codes, weights=pairs["value_a"].to_numpy() == pairs["value_b"].to_numpy(),
+                           minlength=n_pairs) / items
+    share_a = np.bincount(pair_codes * k + pairs["value_a"].to_numpy(), minlength=n_pairs * k).reshape(n_pairs, k)
+    share_b = np.bincount(pair_codes * k + pairs["value_b"].to_numpy(), minlength=n_pairs * k).reshape(n_pairs, k)
+    expected = (share_a * share_b).sum(axis=1) / items.astype(float) ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kappa = (observed - expected) / (1 - expected)
+
+    per_pair = pd.DataFrame({
+        "annotator_a": annotators.to_numpy()[pair_index // len(annotators)],
+        "annotator_b": annotators.to_numpy()[pair_index % len(annotators)],
+        "items": items,
+        "kappa": kappa,
+    }).sort_values(["annotator_a", "annotator_b"], ignore_index=True)
+    valid = np.isfinite(per_pair["kappa"])
+    if not valid.any():
+        return np.nan, per_pair
+    mean = np.average(per_pair.loc[valid, "kappa"], weights=per_pair.loc[valid, "items"])
+    return mean, per_pair
+
+
+def agreement_table(long):
+    """
+    Cohen's kappa, Fleiss' kappa and Krippendorff's alpha for every annotation field.
+    """
+    rows = []
+    for field, field_long in long.groupby("field"):
+        level, categories = FIELDS.get(field, ("nominal", None))
+        counts = count_matrix(field_long, categories)
+        overlapping = int((counts.sum(axis=1) >= 2).sum())
+        rows.append({
+            "field": field,
+            "items": len(counts),
+            "overlapping_items": overlapping,
+            "annotations": len(field_long),
+            "cohen_kappa": cohen_kappa(field_long)[0],
+            "fleiss_kappa": fleiss_kappa(counts),
+            "krippendorff_alpha": krippendorff_alpha(counts, level),
+        })
+    return pd.DataFrame(rows)
+
+
+def consensus_labels(long):
+    """
+    Majority label of every item and field. Ties on ordinal fields are adjudicated with the
+    median rating; ties on nominal fields are left as "TIE" for manual adjudication.
+    """
+    frames = []
+    for field, field_long in long.groupby("field"):
+        level, categories = FIELDS.get(field, ("nominal", None))
+        counts = count_matrix(field_long, categories)
+        n = counts.to_numpy()
+        top = n.max(axis=1)
+        tied = (n == top[:, None]).sum(axis=1) > 1
+        label = counts.columns.to_numpy()[n.argmax(axis=1)].astype(object)
+        if level == "ordinal":
+            cumulative = np.cumsum(n, axis=1)
+            median = (cumulative >= (n.sum(axis=1, keepdims=True) + 1) / 2).argmax(axis=1)
+            label[tied] = counts.columns.to_numpy()[median[tied]]
+        else:
+            label[tied] = "TIE"
+        frames.append(pd.DataFrame({
+            "item": counts.index,
+            "field": field,
+            "label": label,
+            "annotations": n.sum(axis=1),
+            "agreement": top / n.sum(axis=1),
+            "adjudicated": tied,
+        }))
+    labels = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not labels.empty:
+        split_item = labels["item"].str.split("\x1f", n=1, expand=True)
+        labels.insert(0, "row_id", split_item[0])
+        labels.insert(1, "text", split_item[1] if split_item.shape[1] > 1 else "")
+        labels = labels.drop(columns="item")
+    return labels
+
+
+def bootstrap_mean(scores, n_boot=2000, seed=0, confidence=0.95):
+    """
+    Mean of `scores` with a percentile bootstrap interval. Scores take few distinct values, so
+    each resample is drawn as multinomial counts over those values instead of over the items.
+    """
+    scores = np.asarray(scores, dtype=float)
+    if len(scores) == 0:
+        return np.nan, np.nan, np.nan
+    values, counts = np.unique(scores, return_counts=True)
+    draws = np.random.default_rng(seed).multinomial(len(scores), counts / len(scores), size=n_boot)
+    means = draws @ values / len(scores)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(means, [tail, 100 - tail])
+    return scores.mean(), low, high
+
+
+def win_rates(long, n_boot=2000, seed=0, by="style_case"):
+    """
+    Per-item win rate of model_detox_mian against model_detox_lora (1 win, 0.5 tie, 0 loss) from
+    the ratings and from both preference questions, with bootstrap confidence intervals,
+    overall and per `by` group.
+    """
+    scale = FIELDS["rating_model_detox_mian"][1]
+    rank = {grade: i for i, grade in enumerate(scale)}
+    wide = long[long["field"].isin(["rating_model_detox_mian", "rating_model_detox_lora",
+                                    "preferred_transformation", "user_preferred"])]
+    if wide.empty:
+        return pd.DataFrame()
+    wide = wide.pivot_table(index=["item", "annotator", "style_case"], columns="field",
+                            values="value", aggfunc="last").reset_index()
+
+    scores = {}
+    if {"rating_model_detox_mian", "rating_model_detox_lora"} <= set(wide.columns):
+        mian = wide["rating_model_detox_mian"].map(rank)
+        lora = wide["rating_model_detox_lora"].map(rank)
+        # a better grade has a lower rank
+        scores["ratings"] = np.sign(lora - mian) / 2 + 0.5
+    for question in ("preferred_transformation", "user_preferred"):
+        if question in wide.columns:
+            # stored with Model 1 = model_detox_mian whatever the display order was
+            scores[question] = wide[question].map({"Model 1": 1.0, "Model 2": 0.0})
+
+    rows = []
+    groups = [("all", wide.index)]
+    if by in wide.columns:
+        groups += [(value, index) for value, index in wide.groupby(by).groups.items() if value != ""]
+    for group, index in groups:
+        for measure, score in scores.items():
+            # one score per item: average the annotators of overlapping items
+            per_item = score.loc[index].groupby(wide.loc[index, "item"]).mean().dropna()
+            mean, low, high = bootstrap_mean(per_item, n_boot, seed)
+            rows.append({by: group, "measure": measure, "items": len(per_item),
+                         "mian_win_rate": mean, "ci_low": low, "ci_high": high})
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inter-annotator agreement and aggregated labels over annotation files.")
+    parser.add_argument("paths", nargs="+", help="Annotation files, folders (searched recursively) or glob patterns.")
+    parser.add_argument("--output_dir", type=str, default="analysis", help="Directory for the result tables (default: 'analysis').")
+    parser.add_argument("--n_boot", type=int, default=2000, help="Bootstrap resamples for the win-rate intervals (default: 2000).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the bootstrap (default: 0).")
+    parser.add_argument("--workers", type=int, default=8, help="Files read in parallel (default: 8).")
+    args = parser.parse_args()
+
+    long = load_annotations(args.paths, args.workers)
+    print(f"Loaded {len(long)} judgements from {long['annotator'].nunique()} annotators.")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    agreement = agreement_table(long)
+    agreement.to_csv(os.path.join(args.output_dir, "agreement.csv"), index=False)
+    print(agreement.to_string(index=False))
+
+    consensus_labels(long).to_csv(os.path.join(args.output_dir, "labels.csv"), index=False)
+
+    wins = win_rates(long, args.n_boot, args.seed)
+    if not wins.empty:
+        wins.to_csv(os.path.join(args.output_dir, "win_rates.csv"), index=False)
+        print(wins.to_string(index=False))
+    print(f"Tables written to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
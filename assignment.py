@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+
+def assign_batches(num_rows, num_batches, strata=None, seed=0, overlap_fraction=0.0, overlap_k=2):
+    """
+    Assigns every row of a dataset to batches, stratified and reproducible.
+
+    Rows are shuffled with `seed` inside each stratum and dealt round-robin over the batches
+    (starting at a random batch per stratum), so every batch gets the same share of each
+    stratum up to one row. A stratified `overlap_fraction` of the rows is also given to
+    `overlap_k - 1` other, distinct batches, so those rows are seen by `overlap_k` annotators
+    for inter-annotator agreement. Everything is vectorized with numpy.
+
+    Parameters:
+    - num_rows (int): Number of rows in the dataset.
+    - num_batches (int): Number of batches to create.
+    - strata (Series, DataFrame or None): Stratum of every row, e.g. the `Class` column or the
+      `Class` and `style_case` columns together. None for no stratification.
+    - seed (int): Seed of the random generator.
+    - overlap_fraction (float): Fraction of the rows (0 to 1) annotated by several annotators.
+    - overlap_k (int): Number of batches each overlapping row is assigned to.
+
+    Returns a DataFrame with one line per (row, batch) assignment, sorted by row then batch,
+    with columns `row` (position in the dataset), `batch` (1-based) and `crossval`.
+    """
+    if overlap_fraction and not 2 <= overlap_k <= num_batches:
+        raise ValueError(f"overlap_k must be between 2 and the number of batches ({num_batches})")
+    rng = np.random.default_rng(seed)
+
+    if strata is None:
+        codes = np.zeros(num_rows, dtype=np.int64)
+    else:
+        strata = pd.DataFrame(strata)
+        codes = strata.groupby(list(strata.columns), sort=True, dropna=False).ngroup().to_numpy()
+    num_strata = int(codes.max()) + 1 if num_rows else 0
+
+    # random order inside each stratum, strata kept together
+    order = rng.permutation(num_rows)
+    order = order[np.argsort(codes[order], kind="stable")]
+    stratum = codes[order]
+    counts = np.bincount(stratum, minlength=num_strata)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.arange(num_rows) - starts[stratum]
+
+    # round-robin deal from a random first batch for each stratum
+    first_batch = rng.integers(num_batches, size=num_strata)
+    batch = np.empty(num_rows, dtype=np.int64)
+    batch[order] = (rank + first_batch[stratum]) % num_batches
+
+    # the first rows of each shuffled stratum go to several batches
+    quota = np.round(counts * overlap_fraction).astype(np.int64)
+    overlap = np.zeros(num_rows, dtype=bool)
+    overlap[order] = rank < quota[stratum]
+
+    rows = [np.arange(num_rows)]
+    batches = [batch]
+    overlap_rows = np.flatnonzero(overlap)
+    if len(overlap_rows):
+        # k - 1 distinct non-zero shifts per row, starting at a random shift so pairs of
+        # annotators vary across rows
+        span = num_batches - 1
+        stride = max(1, span // (overlap_k - 1))
+        base = rng.integers(span, size=len(overlap_rows))
+        for j in range(overlap_k - 1):
+            shift = 1 + (base + j * stride) % span
+            rows.append(overlap_rows)
+            batches.append((batch[overlap_rows] + shift) % num_batches)
+
+    assignments = pd.DataFrame({
+        "row": np.concatenate(rows),
+        "batch": np.concatenate(batches) + 1,
+    })
+    assignments["crossval"] = overlap[assignments["row"].to_numpy()]
+    return assignments.sort_values(["row", "batch"], kind="stable", ignore_index=True)
+
+
+def write_manifest(assignments, row_ids, path):
+    """
+    Writes the mapping from each row id to its batches, one line per (row id, batch).
+    """
+    manifest = pd.DataFrame({
+        "row_id": np.asarray(row_ids)[assignments["row"].to_numpy()],
+        "batch": assignments["batch"].to_numpy(),
+        "crossval": assignments["crossval"].to_numpy(),
+    })
+    manifest.to_csv(path, index=False)
@@ -0,0 +1,265 @@
+"""
+Benchmark of the submit path of both annotation tools on synthetic datasets.
+
+Every (tool, size, mode) case runs in its own process, so the module level state of the V2
+tool and the peak RSS of one case never leak into the next. The `direct` mode calls the
+Gradio handlers as plain functions; the `client` mode launches the app headless and drives
+it over HTTP with gradio_client, like a browser tab would.
+
+    python benchmarks/bench_submit.py --sizes 1000 10000 100000 1000000 --submits 200 \\
+        --output benchmarks/results/$(git rev-parse --short HEAD).json
+
+Compare two result files with `python benchmarks/compare.py old.json new.json`.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RATINGS = ["A", "B", "F"]
+GRADES = ["A", "B", "C", "D", "E"]
+
+
+def make_main_dataset(path, n, seed=0):
+    """
+    Batch in the layout read by src/main.py.
+    """
+    rng = np.random.default_rng(seed)
+    ids = pd.Series(np.arange(n)).astype(str)
+    pd.DataFrame({
+        "text": "synthetic toxic text number " + ids,
+        "Neutral": "neutral rewrite of text " + ids,
+        "Formal": "formal rewrite of text " + ids,
+        "Friendly": "friendly rewrite of text " + ids,
+        "Class": rng.choice(["insult", "threat", "obscene", "identity_attack"], n),
+    }).to_csv(path, index=False)
+
+
+def make_v2_dataset(path, n, seed=0):
+    """
+    Dataset in the layout read by DetoxAnnotatorV2.
+    """
+    rng = np.random.default_rng(seed)
+    ids = pd.Series(np.arange(n)).astype(str)
+    pd.DataFrame({
+        "comment": "synthetic toxic comment number " + ids,
+        "model_detox_mian": "mian rewrite of comment " + ids,
+        "model_detox_lora": "lora rewrite of comment " + ids,
+        "style_case": rng.choice(["formal", "friendly", "neutral"], n),
+    }).to_csv(path, index=False)
+
+
+def written_bytes():
+    """
+    Bytes this process passed to write() so far (Linux only, None elsewhere).
+    """
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(folder, name))
+               for folder, _, names in os.walk(path) for name in names)
+
+
+def latency_summary(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(latencies.mean()),
+        "max_ms": float(latencies.max()),
+    }
+
+
+def capture_launch(client):
+    """
+    Replace gr.Blocks.launch so the app built by a tool is returned instead of served forever
+    (or served in the background for the client mode).
+    """
+    import gradio as gr
+
+    demos = []
+    launch = gr.Blocks.launch
+
+    def capture(self, **kwargs):
+        demos.append(self)
+        if client:
+            return launch(self, prevent_thread_lock=True, quiet=True, **kwargs)
+
+    gr.Blocks.launch = capture
+    return demos
+
+
+def timed_calls(call, n):
+    latencies = []
+    for i in range(n):
+        start = time.perf_counter()
+        call(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_main(workdir, size, submits, mode, store):
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+    dataset = os.path.join(workdir, f"batch_{size}.csv")
+    make_main_dataset(dataset, size)
+    demos = capture_launch(mode == "client")
+    import main
+
+    start = time.perf_counter()
+    main.main(annotator_name="bench", examples_batch_folder=dataset, store=store)
+    startup = time.perf_counter() - start
+    demo = demos[0]
+
+    def form(i):
+        return ([], "", "Neutral", RATINGS[i % 3], "", RATINGS[(i + 1) % 3], "", RATINGS[(i + 2) % 3], "")
+
+    if mode == "client":
+        from gradio_client import Client
+        client = Client(demo.local_url, verbose=False)
+        client.predict(api_name="/start_session")
+        submit = lambda i: client.predict(*form(i), api_name="/store_annotation_and_get_next")
+    else:
+        from session import AnnotationSession
+        handlers = {fn.name: fn.fn for fn in demo.fns.values()}
+        session = AnnotationSession("bench")
+        handlers["start_session"](session)
+        submit = lambda i: handlers["store_annotation_and_get_next"](session, *form(i))
+    return startup, {"submit": submit}
+
+
+def bench_v2(workdir, size, submits, mode, store):
+    sys.path.insert(0, os.path.join(ROOT, "DetoxAnnotatorV2"))
+    dataset = os.path.join(workdir, f"v2_{size}.csv")
+    make_v2_dataset(dataset, size)
+    sys.argv = ["annotation_tool.py", dataset, "--annotator", "bench"]
+    demos = capture_launch(mode == "client")
+
+    start = time.perf_counter()
+    import annotation_tool
+    startup = time.perf_counter() - start
+
+    def form(i):
+        return GRADES[i % 5], GRADES[(i + 2) % 5], ["Model 1", "Model 2"][i % 2], ["Model 1", "Model 2"][(i + 1) % 2]
+
+    if mode == "client":
+        annotation_tool.demo.queue(default_concurrency_limit=None)
+        annotation_tool.demo.launch()
+        from gradio_client import Client
+        client = Client(demos[0].local_url, verbose=False)
+        client.predict(api_name="/load_initial")
+        return startup, {"submit": lambda i: client.predict(*form(i), api_name="/submit_annotation")}
+
+    session = copy.deepcopy(annotation_tool.session_state.value)
+    annotation_tool.load_initial(session)
+    return startup, {
+        "submit": lambda i: annotation_tool.submit_annotation(session, *form(i)),
+        "load_example": lambda i: annotation_tool.load_example(session, (i * 7919) % size),
+        "find_resume_index": lambda i: annotation_tool.find_resume_index(),
+    }
+
+
+TOOLS = {"main": bench_main, "v2": bench_v2}
+
+
+def run_case(tool, size, submits, mode, store):
+    """
+    Run one case in this process and return its measurements.
+    """
+    workdir = tempfile.mkdtemp(prefix=f"bench_{tool}_{size}_")
+    os.chdir(workdir)
+    startup, calls = TOOLS[tool](workdir, size, submits, mode, store)
+    startup_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    result = {"tool": tool, "size": size, "mode": mode, "workdir": workdir, "store": store if tool == "main" else None,
+              "submits": submits, "startup_s": startup}
+    folder_before, bytes_before = folder_size(workdir), written_bytes()
+    result["submit"] = latency_summary(timed_calls(calls.pop("submit"), submits))
+    bytes_after = written_bytes()
+    result["bytes_written_per_submit"] = None if bytes_before is None else (bytes_after - bytes_before) / submits
+    result["disk_growth_per_submit"] = (folder_size(workdir) - folder_before) / submits
+    for name, call in calls.items():
+        result[name] = latency_summary(timed_calls(call, submits))
+    # ru_maxrss is in kilobytes on Linux
+    result["startup_rss_mb"] = startup_rss / 1024
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the submit path of the annotation tools.")
+    parser.add_argument("--tools", nargs="+", choices=sorted(TOOLS), default=sorted(TOOLS), help="Tools to benchmark (default: both).")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000, 1000000], help="Dataset sizes in rows.")
+    parser.add_argument("--submits", type=int, default=200, help="Submits measured per case (default: 200).")
+    parser.add_argument("--modes", nargs="+", choices=["direct", "client"], default=["direct", "client"],
+                        help="Call the handlers directly and/or through a headless Gradio client.")
+    parser.add_argument("--store", type=str, default="journal", help="Annotation store of src/main.py (default: journal).")
+    parser.add_argument("--output", type=str, default=None, help="JSON file for the results (default: benchmarks/results/<commit>.json).")
+    parser.add_argument("--case", nargs=3, metavar=("TOOL", "SIZE", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # child process: one case, result as JSON on the last line of stdout
+        tool, size, mode = args.case
+        print(json.dumps(run_case(tool, int(size), args.submits, mode, args.store)))
+        return
+
+    results = []
+    for tool in args.tools:
+        for size in args.sizes:
+            for mode in args.modes:
+                print(f"{tool} {size} rows, {mode}...", flush=True)
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", tool, str(size), mode,
+                                        "--submits", str(args.submits), "--store", args.store],
+                                       capture_output=True, text=True)
+                if child.returncode != 0:
+                    print(child.stderr[-2000:])
+                    results.append({"tool": tool, "size": size, "mode": mode, "error": child.stderr[-2000:]})
+                    continue
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                shutil.rmtree(result.pop("workdir"), ignore_errors=True)
+                print(f"  startup {result['startup_s']:.2f} s, submit p50 {result['submit']['p50_ms']:.1f} ms "
+                      f"p99 {result['submit']['p99_ms']:.1f} ms, peak RSS {result['peak_rss_mb']:.0f} MB")
+                results.append(result)
+
+    commit = git_commit()
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{(commit or 'unknown')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare two result files of bench_submit.py and flag the cases that got slower or bigger.
+
+    python benchmarks/compare.py benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import json
+
+# (label, path in a result) of the measurements compared, lower is better for all of them
+METRICS = [
+    ("startup_s", ("startup_s",)),
+    ("submit_p50_ms", ("submit", "p50_ms")),
+    ("submit_p99_ms", ("submit", "p99_ms")),
+    ("peak_rss_mb", ("peak_rss_mb",)),
+    ("bytes_per_submit", ("bytes_written_per_submit",)),
+]
+
+
+def case_key(result):
+    return result["tool"], result["size"], result["mode"], result.get("store")
+
+
+def metric(result, path):
+    for key in path:
+        if not isinstance(result, dict) or result.get(key) is None:
+            return None
+        result = result[key]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline", help="Results of the reference commit.")
+    parser.add_argument("candidate", help="Results of the commit to check.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative increase reported as a regression (default: 0.2).")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = {case_key(r): r for r in json.load(f)["results"] if "error" not in r}
+    with open(args.candidate) as f:
+        candidate = json.load(f)["results"]
+
+    regressions = 0
+    for result in candidate:
+        if "error" in result or case_key(result) not in baseline:
+            continue
+        tool, size, mode, store = case_key(result)
+        for label, path in METRICS:
+            old, new = metric(baseline[case_key(result)], path), metric(result, path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            flag = ""
+            if change > args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{tool:5} {size:>8} {mode:7} {label:17} {old:12.2f} -> {new:12.2f} ({change:+.0%}){flag}")
+    print(f"{regressions} regressions above {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
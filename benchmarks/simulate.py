@@ -0,0 +1,409 @@
+"""
+Capacity simulation: how many annotators one process of a tool serves before submits slow down.
+
+For every number of annotators, a fresh process of the tool is started and driven by that
+many synthetic annotators, each one a thread that thinks, submits, waits for the answer and
+thinks again. Think times are drawn from a distribution (`--think`) or from the
+`annotation_time` recorded in real annotation files (`--recorded`), divided by `--time_scale`
+so a simulated annotator stands for `time_scale` real ones. Like bench_submit.py, the
+`direct` mode calls the Gradio handlers as plain functions (on at most `--threads` threads at
+once, the size of the thread pool Gradio runs them on) and the `client` mode goes over HTTP
+with gradio_client; everything runs locally.
+
+    python benchmarks/simulate.py --tools server v2 --annotators 1 4 16 64 --duration 30 \\
+        --recorded DetoxAnnotatorV2/dataset.csv --output benchmarks/results/capacity.json
+
+For every case it reports the throughput, the submit latency seen by the annotators, the time
+spent in the handler, the queueing delay (the difference of the two means), the time spent
+writing annotations and waiting for the lock of the store, and the CPU used.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from bench_submit import (GRADES, RATINGS, ROOT, capture_launch, git_commit, latency_summary,
+                          make_main_dataset, make_v2_dataset)
+
+
+def parse_think(spec):
+    """
+    Think time sampler of `rng` from "fixed:SECONDS", "exp:MEAN" or "lognormal:MEDIAN:SIGMA".
+    """
+    kind, *values = spec.split(":")
+    values = [float(v) for v in values]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "exp" and len(values) == 1:
+        return lambda rng: rng.exponential(values[0])
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormal(np.log(values[0]), values[1])
+    raise ValueError(f"Unknown think time {spec!r}, expected fixed:S, exp:MEAN or lognormal:MEDIAN:SIGMA")
+
+
+def recorded_think_times(paths, max_think):
+    """
+    `annotation_time` of every annotation in the files, folders or glob patterns `paths`
+    (e.g. datasets annotated by DetoxAnnotatorV2), without the empty ones and clipped to
+    `max_think` seconds so breaks do not stall an annotator for the whole run.
+    """
+    sys.path.insert(0, ROOT)
+    import pandas as pd
+    from columnar import read_table
+    from merge import find_annotation_files
+
+    times = []
+    for path in find_annotation_files(paths):
+        if path.endswith(".journal"):
+            with open(path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.endswith("\n")]
+            frame = pd.DataFrame(records)
+        else:
+            frame = read_table(path)
+        if "annotation_time" in frame.columns:
+            times.append(pd.to_numeric(frame["annotation_time"], errors="coerce").to_numpy(dtype=float))
+    times = np.concatenate(times) if times else np.array([])
+    times = times[np.isfinite(times) & (times > 0)]
+    if not len(times):
+        raise SystemExit(f"No annotation_time found in {paths}")
+    return np.minimum(times, max_think)
+
+
+class TimedLock:
+    """
+    Lock of a store, recording the time spent waiting for it as the `lock_wait` phase of the
+    handler holding it (see src/metrics.py).
+    """
+
+    def __init__(self, lock, metrics):
+        self._lock = lock
+        self._metrics = metrics
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        self._metrics.observe_phase("lock_wait", time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def time_store_lock(store):
+    from metrics import METRICS
+
+    # the SQLite stores have no lock of their own: waits on the database count as `write`
+    if hasattr(store, "_lock"):
+        store._lock = TimedLock(store._lock, METRICS)
+    return store
+
+
+def main_form(i):
+    return ([], "", "Neutral", RATINGS[i % 3], "", RATINGS[(i + 1) % 3], "", RATINGS[(i + 2) % 3], "")
+
+
+def v2_form(i):
+    return GRADES[i % 5], GRADES[(i + 2) % 5], ["Model 1", "Model 2"][i % 2], ["Model 1", "Model 2"][(i + 1) % 2]
+
+
+def launch_main(dataset, mode, store):
+    """
+    src/main.py: one annotator, every simulated annotator being a tab of their own.
+    """
+    demos = capture_launch(mode == "client")
+    import main
+    from session import AnnotationSession
+
+    open_store = main.open_store
+    main.open_store = lambda *args: time_store_lock(open_store(*args))
+    main.main(annotator_name="sim", examples_batch_folder=dataset, store=store)
+
+    def open_session(k):
+        if mode == "client":
+            client = new_client(demos[0])
+            client.predict(api_name="/start_session")
+            return lambda i: client.predict(*main_form(i), api_name="/store_annotation_and_get_next")
+        handlers = {f.name: f.fn for f in demos[0].fns.values() if f.name}
+        session = AnnotationSession("sim")
+        handlers["start_session"](session)
+        return lambda i: handlers["store_annotation_and_get_next"](session, *main_form(i))
+
+    return "store_annotation_and_get_next", open_session
+
+
+def launch_server(dataset, mode, store):
+    """
+    src/server.py: one shared job, every simulated annotator logging in with their own name.
+    """
+    demos = capture_launch(mode == "client")
+    import server
+    from session import AnnotationSession
+
+    open_store = server.open_store
+    server.open_store = lambda *args: time_store_lock(open_store(*args))
+    server.main(dataset=dataset, store=store)
+
+    def open_session(k):
+        if mode == "client":
+            client = new_client(demos[0])
+            client.predict(f"annotator_{k}", api_name="/login")
+            return lambda i: client.predict(*main_form(i), api_name="/store_annotation_and_get_next")
+        handlers = {f.name: f.fn for f in demos[0].fns.values() if f.name}
+        session = AnnotationSession()
+        handlers["login"](f"annotator_{k}", session)
+        return lambda i: handlers["store_annotation_and_get_next"](session, *main_form(i))
+
+    return "store_annotation_and_get_next", open_session
+
+
+def launch_v2(dataset, mode, store):
+    """
+    DetoxAnnotatorV2: one annotator, every simulated annotator being a tab of their own. The
+    store is the default one of annotation_tool.py (--store).
+    """
+    sys.path.insert(0, os.path.join(ROOT, "DetoxAnnotatorV2"))
+    sys.argv = ["annotation_tool.py", dataset, "--annotator", "sim"]
+    demos = capture_launch(mode == "client")
+    import annotation_tool
+    time_store_lock(annotation_tool.store)
+
+    if mode == "client":
+        annotation_tool.demo.queue(default_concurrency_limit=None)
+        annotation_tool.demo.launch()
+
+    def open_session(k):
+        if mode == "client":
+            client = new_client(demos[0])
+            client.predict(api_name="/load_initial")
+            return lambda i: client.predict(*v2_form(i), api_name="/submit_annotation")
+        session = copy.deepcopy(annotation_tool.session_state.value)
+        annotation_tool.load_initial(session)
+        return lambda i: annotation_tool.submit_annotation(session, *v2_form(i))
+
+    return "submit_annotation", open_session
+
+
+TOOLS = {"main": launch_main, "server": launch_server, "v2": launch_v2}
+# synthetic dataset of each tool
+DATASETS = {"main": make_main_dataset, "server": make_main_dataset, "v2": make_v2_dataset}
+
+
+def new_client(demo):
+    from gradio_client import Client
+
+    # every client has its own Gradio session, like a browser tab
+    return Client(demo.local_url, verbose=False)
+
+
+def read_trace(path, handler):
+    """
+    (seconds, phases) of every call of `handler` in a trace written by src/metrics.py.
+    """
+    calls = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            call = json.loads(line)
+            if call["handler"] == handler and not call["error"]:
+                calls.append((call["seconds"], call["phases"]))
+    return calls
+
+
+def run_case(tool, mode, annotators, args):
+    """
+    Drive one process of `tool` with `annotators` synthetic annotators for `args.duration`
+    seconds and return its measurements.
+    """
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+    from metrics import METRICS
+
+    if args.recorded:
+        recorded = recorded_think_times(args.recorded, args.max_think)
+        think = lambda rng: rng.choice(recorded)
+    else:
+        think = parse_think(args.think)
+
+    workdir = tempfile.mkdtemp(prefix=f"simulate_{tool}_{annotators}_")
+    if args.dataset:
+        # the tools write next to or into the dataset: work on a copy
+        dataset = os.path.join(workdir, os.path.basename(args.dataset))
+        shutil.copy(args.dataset, dataset)
+    else:
+        dataset = os.path.join(workdir, "batch_1.csv")
+        DATASETS[tool](dataset, args.size)
+    os.chdir(workdir)
+    trace_path = os.path.join(workdir, "trace.jsonl")
+    METRICS.trace_to(trace_path)
+    handler, open_session = TOOLS[tool](dataset, mode, args.store)
+    # Gradio runs the handlers on a pool of threads; over HTTP the real one is used
+    workers = threading.Semaphore(args.threads)
+    submits = [open_session(k) for k in range(annotators)]
+    latencies = [[] for _ in range(annotators)]
+    errors = [0] * annotators
+    ready = threading.Barrier(annotators + 1)
+    deadline = None
+
+    def annotate(k):
+        rng = np.random.default_rng([args.seed, k])
+        submit = submits[k]
+        ready.wait()
+        # a random phase so the annotators do not all submit at once
+        time.sleep(think(rng) / args.time_scale * rng.uniform())
+        i = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if mode == "client":
+                    submit(i)
+                else:
+                    with workers:
+                        submit(i)
+                latencies[k].append(time.perf_counter() - start)
+            except Exception:
+                errors[k] += 1
+            i += 1
+            time.sleep(think(rng) / args.time_scale)
+
+    threads = [threading.Thread(target=annotate, args=(k,), daemon=True) for k in range(annotators)]
+    for thread in threads:
+        thread.start()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    begin = time.perf_counter()
+    deadline = begin + args.duration
+    ready.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+    used = resource.getrusage(resource.RUSAGE_SELF)
+
+    latencies = np.concatenate([np.asarray(found) for found in latencies])
+    calls = read_trace(trace_path, handler)
+    result = {"tool": tool, "mode": mode, "annotators": annotators, "workdir": workdir,
+              "store": args.store if tool != "v2" else None, "time_scale": args.time_scale,
+              "equivalent_annotators": annotators * args.time_scale,
+              "duration_s": elapsed, "submits": len(latencies), "errors": sum(errors),
+              "throughput_per_s": len(latencies) / elapsed,
+              "cpu_share": (used.ru_utime + used.ru_stime - usage.ru_utime - usage.ru_stime) / elapsed}
+    if len(latencies):
+        result["latency"] = latency_summary(latencies)
+    if calls:
+        result["service"] = latency_summary([seconds for seconds, _ in calls])
+        for phase in ("write", "lock_wait"):
+            result[phase] = latency_summary([phases.get(phase, 0.0) for _, phases in calls])
+        if len(latencies):
+            # waiting for a worker thread, plus HTTP and serialization in client mode
+            result["queue_ms"] = result["latency"]["mean_ms"] - result["service"]["mean_ms"]
+    return result
+
+
+def capacity(results, slo_ms):
+    """
+    Largest number of annotators of the results of one tool and mode whose submit p99 stayed
+    under `slo_ms` without errors, or None.
+    """
+    passed = [r["annotators"] for r in results
+              if "error" not in r and not r["errors"] and r.get("latency", {}).get("p99_ms", float("inf")) <= slo_ms]
+    return max(passed) if passed else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent annotators to find the capacity of the annotation tools.")
+    parser.add_argument("--tools", nargs="+", choices=sorted(TOOLS), default=["server", "v2"],
+                        help="Tools to simulate (default: server v2).")
+    parser.add_argument("--modes", nargs="+", choices=["direct", "client"], default=["direct"],
+                        help="Call the handlers directly and/or through headless Gradio clients (default: direct).")
+    parser.add_argument("--annotators", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32],
+                        help="Numbers of simulated annotators, one case each.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds every case runs (default: 30).")
+    parser.add_argument("--think", type=str, default="lognormal:20:0.8",
+                        help="Think time between two submits: fixed:S, exp:MEAN or lognormal:MEDIAN:SIGMA, in seconds "
+                             "(default: lognormal:20:0.8).")
+    parser.add_argument("--recorded", nargs="+", default=None,
+                        help="Annotation files, folders or glob patterns whose annotation_time is sampled as the think "
+                             "time instead of --think (e.g. datasets annotated with DetoxAnnotatorV2).")
+    parser.add_argument("--max_think", type=float, default=300, help="Recorded think times are clipped to this many seconds.")
+    parser.add_argument("--time_scale", type=float, default=100,
+                        help="Think times are divided by this, a simulated annotator standing for as many real ones (default: 100).")
+    parser.add_argument("--threads", type=int, default=40,
+                        help="Handlers running at once in direct mode, as the thread pool of Gradio (default: 40).")
+    parser.add_argument("--dataset", type=str, default=None,
+                        help="Dataset in the layout of the tool (default: a synthetic one of --size rows).")
+    parser.add_argument("--size", type=int, default=100000, help="Rows of the synthetic dataset (default: 100000).")
+    parser.add_argument("--store", type=str, default="journal", help="Annotation store of src/main.py and src/server.py (default: journal).")
+    parser.add_argument("--slo_ms", type=float, default=500, help="Submit p99 above which the tool is considered degraded (default: 500).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the think times.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="JSON file for the results (default: benchmarks/results/simulate_<commit>.json).")
+    parser.add_argument("--case", nargs=3, metavar=("TOOL", "MODE", "ANNOTATORS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # child process: one case, result as JSON on the last line of stdout
+        tool, mode, annotators = args.case
+        print(json.dumps(run_case(tool, mode, int(annotators), args)), flush=True)
+        # the launched app and the clients have threads of their own
+        os._exit(0)
+
+    # the children get the same options
+    options = sys.argv[1:]
+    results = []
+    for tool in args.tools:
+        for mode in args.modes:
+            cases = []
+            for annotators in args.annotators:
+                print(f"{tool} {mode}, {annotators} annotators...", flush=True)
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), *options,
+                                        "--case", tool, mode, str(annotators)],
+                                       capture_output=True, text=True)
+                if child.returncode != 0:
+                    print(child.stderr[-2000:])
+                    cases.append({"tool": tool, "mode": mode, "annotators": annotators, "error": child.stderr[-2000:]})
+                    continue
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                shutil.rmtree(result.pop("workdir"), ignore_errors=True)
+                if "latency" in result:
+                    print(f"  {result['throughput_per_s']:.1f} submits/s, latency p50 {result['latency']['p50_ms']:.1f} ms "
+                          f"p99 {result['latency']['p99_ms']:.1f} ms, queue {result.get('queue_ms', 0):.1f} ms, "
+                          f"write p99 {result['write']['p99_ms']:.1f} ms, lock wait p99 {result['lock_wait']['p99_ms']:.1f} ms, "
+                          f"CPU {result['cpu_share']:.0%}, {result['errors']} errors")
+                cases.append(result)
+            found = capacity(cases, args.slo_ms)
+            print(f"{tool} {mode}: " + (f"up to {found} simulated annotators ({found * args.time_scale:.0f} real ones) "
+                                        f"with submit p99 under {args.slo_ms:.0f} ms" if found else
+                                        f"submit p99 above {args.slo_ms:.0f} ms at every load"))
+            results += cases
+
+    commit = git_commit()
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"simulate_{(commit or 'unknown')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "think": "recorded" if args.recorded else args.think,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
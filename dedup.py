@@ -0,0 +1,282 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# texts shorter than this many bytes are padded, so every text has at least one shingle
+SHINGLE_SIZE = 5
+# texts hashed at once by minhash_signatures: their shingles stay in the CPU cache
+MINHASH_CHUNK_ROWS = 4000
+# candidate pairs compared at once by near_representatives
+PAIR_CHUNK = 100000
+
+
+def read_csv(path, **kwargs):
+    # every value kept as the exact string found in the file, as in split.py
+    return pd.read_csv(path, dtype=str, keep_default_na=False, compression="infer", **kwargs)
+
+
+def normalize_texts(texts):
+    """
+    Lower-case the texts and reduce every run of punctuation and spaces to one space, so
+    copies differing only in case, spacing or punctuation compare equal.
+    """
+    return (texts.fillna("").astype(str).str.lower()
+            .str.replace(r"[\W_]+", " ", regex=True).str.strip())
+
+
+def text_hashes(normalized):
+    """
+    64-bit hash of every normalized text.
+    """
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def exact_representatives(hashes):
+    """
+    Position of the first row with the same hash, for every row.
+    """
+    codes, _ = pd.factorize(hashes)
+    _, first = np.unique(codes, return_index=True)
+    return first[codes]
+
+
+def _shingles(texts, size):
+    """
+    The byte `size`-grams of every text as integers, and the index of the first one of each
+    text (texts are padded to `size` bytes, so every text has one).
+    """
+    encoded = [text.encode("utf-8") for text in texts.str.pad(size, side="right")]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    counts = lengths - size + 1
+    text_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    shingle_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    # start of every gram that does not cross into the next text
+    positions = np.repeat(text_starts - shingle_starts, counts) + np.arange(counts.sum())
+    grams = np.zeros(len(positions), dtype=np.uint64)
+    for i in range(size):
+        grams = (grams << np.uint64(8)) | buffer[positions + i]
+    return grams, shingle_starts
+
+
+def minhash_signatures(texts, num_perm=64, shingle_size=SHINGLE_SIZE, seed=0, chunk_rows=MINHASH_CHUNK_ROWS):
+    """
+    MinHash signature (`num_perm` 32-bit values) of the byte shingles of every text.
+
+    The permutations are multiply-add-shift hashes of the shingles, applied in place to every
+    shingle of `chunk_rows` texts at once; the minimum of each text is taken with `reduceat`.
+    The fraction of equal values of two signatures estimates the Jaccard similarity of
+    their texts.
+    """
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for start in range(0, len(texts), chunk_rows):
+        grams, starts = _shingles(texts.iloc[start:start + chunk_rows], shingle_size)
+        hashed = np.empty_like(grams)
+        for perm in range(num_perm):
+            np.multiply(grams, multipliers[perm], out=hashed)
+            np.add(hashed, offsets[perm], out=hashed)
+            np.right_shift(hashed, np.uint64(32), out=hashed)
+            signatures[start:start + len(starts), perm] = np.minimum.reduceat(hashed, starts)
+    return signatures
+
+
+def lsh_bands(num_perm, threshold):
+    """
+    Number of LSH bands whose S-curve threshold, (1 / bands) ** (1 / rows), is the highest
+    one at or below `threshold`, so pairs above the threshold are very likely candidates.
+    """
+    options = [bands for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    below = [bands for bands in options if (1 / bands) ** (bands / num_perm) <= threshold]
+    return min(below, key=lambda bands: threshold - (1 / bands) ** (bands / num_perm)) if below else num_perm
+
+
+def _components(num_nodes, left, right):
+    """
+    Smallest node of the connected component of every node, given the edges (left, right).
+    """
+    labels = np.arange(num_nodes)
+    while True:
+        smallest = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, smallest)
+        np.minimum.at(updated, right, smallest)
+        # pointer jumping, so long chains settle in a few rounds
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def near_representatives(signatures, threshold=0.8, bands=None):
+    """
+    Cluster the rows whose signatures agree on at least `threshold` of their values, with
+    banded LSH: rows sharing a band bucket are compared with the first row of the bucket
+    only, so large buckets cost linear time. Returns the smallest position of the cluster
+    of every row.
+    """
+    num_rows, num_perm = signatures.shape
+    bands = bands or lsh_bands(num_perm, threshold)
+    rows_per_band = num_perm // bands
+    mixers = np.random.default_rng(1).integers(1, 2 ** 63, size=rows_per_band, dtype=np.uint64)
+    left, right = [], []
+    for band in range(bands):
+        block = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype(np.uint64)
+        keys = (block * mixers).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        new_bucket = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+        leaders = order[np.maximum.accumulate(np.where(new_bucket, np.arange(num_rows), 0))]
+        members = ~new_bucket
+        left.append(leaders[members])
+        right.append(order[members])
+    left = np.concatenate(left)
+    right = np.concatenate(right)
+    pairs = np.unique(left.astype(np.int64) * num_rows + right)
+    left, right = pairs // num_rows, pairs % num_rows
+
+    similar = np.empty(len(pairs), dtype=bool)
+    for start in range(0, len(pairs), PAIR_CHUNK):
+        chunk = slice(start, start + PAIR_CHUNK)
+        agreement = (signatures[left[chunk]] == signatures[right[chunk]]).mean(axis=1)
+        similar[chunk] = agreement >= threshold
+    return _components(num_rows, left[similar], right[similar])
+
+
+def find_duplicates(texts, threshold=0.8, num_perm=64, shingle_size=SHINGLE_SIZE, seed=0):
+    """
+    Cluster the exact and near duplicates of `texts`.
+
+    Exact duplicates have the same normalized text (see `normalize_texts`) and are grouped
+    by hash. One text of each exact group is then MinHashed and near duplicates, whose
+    estimated Jaccard similarity of byte shingles is at least `threshold`, are grouped with
+    LSH. Every cluster is represented by its first row.
+
+    Returns a DataFrame with, for every row, the position of its `representative` and its
+    `match` with it: "" for the representative itself, "exact" or "near".
+    """
+    normalized = normalize_texts(pd.Series(texts).reset_index(drop=True))
+    hashes = text_hashes(normalized)
+    exact = exact_representatives(hashes)
+
+    unique = np.flatnonzero(exact == np.arange(len(exact)))
+    representative = np.arange(len(exact))
+    if len(unique) > 1 and num_perm:
+        signatures = minhash_signatures(normalized.iloc[unique], num_perm, shingle_size, seed)
+        representative[unique] = unique[near_representatives(signatures, threshold)]
+    representative = representative[exact]
+
+    match = np.where(hashes == hashes[representative], "exact", "near")
+    match[representative == np.arange(len(exact))] = ""
+    return pd.DataFrame({"representative": representative, "match": match})
+
+
+def deduplicate_file(dataset_path, output_path, clusters_path, text_column=None, threshold=0.8,
+                     num_perm=64, chunksize=None):
+    """
+    Write the dataset without its duplicates, and the cluster map of its rows.
+
+    Parameters:
+    - dataset_path (str): Path to the dataset file (CSV format, optionally .gz or .zst compressed).
+    - output_path (str): CSV file for the representative rows. A `row_id` column (the row
+      position) is added when the dataset has none, so annotations map back to the clusters.
+    - clusters_path (str): CSV file with, for every row, its `row_id`, the `representative_id`
+      of its cluster and the `match` ("", "exact" or "near").
+    - text_column (str): Column compared, `text` or `comment` by default.
+    - threshold (float): Estimated Jaccard similarity above which two texts are near duplicates.
+    - num_perm (int): MinHash values per text; 0 only removes exact duplicates.
+    - chunksize (int): Stream the dataset in chunks of this many rows; only the text (and
+      `row_id`) column is held in memory.
+    """
+    header = read_csv(dataset_path, nrows=0)
+    if text_column is None:
+        text_column = "text" if "text" in header.columns else "comment"
+    has_row_id = "row_id" in header.columns
+    columns = [text_column] + (["row_id"] if has_row_id else [])
+    if chunksize:
+        keys = pd.concat(read_csv(dataset_path, usecols=columns, chunksize=chunksize), ignore_index=True)
+    else:
+        keys = read_csv(dataset_path, usecols=columns)
+    row_ids = keys["row_id"] if has_row_id else pd.Series(np.arange(len(keys))).astype(str)
+
+    clusters = find_duplicates(keys[text_column], threshold=threshold, num_perm=num_perm)
+    keep = clusters["match"].to_numpy() == ""
+    pd.DataFrame({
+        "row_id": row_ids.to_numpy(),
+        "representative_id": row_ids.to_numpy()[clusters["representative"].to_numpy()],
+        "match": clusters["match"],
+    }).to_csv(clusters_path, index=False)
+
+    start = 0
+    with open(output_path, "w", newline="", encoding="utf-8") as output:
+        for chunk in (read_csv(dataset_path, chunksize=chunksize) if chunksize else [read_csv(dataset_path)]):
+            chunk = chunk.reset_index(drop=True)
+            if not has_row_id:
+                chunk["row_id"] = row_ids.to_numpy()[start:start + len(chunk)]
+            chunk[keep[start:start + len(chunk)]].to_csv(output, index=False, header=start == 0)
+            start += len(chunk)
+
+    counts = clusters["match"].value_counts()
+    print(f"{len(clusters)} rows: {counts.get('exact', 0)} exact and {counts.get('near', 0)} near duplicates, "
+          f"{int(keep.sum())} rows kept in {output_path}.")
+    return output_path
+
+
+def propagate(annotations_path, clusters_path, output_path=None):
+    """
+    Copy the annotation of every representative to the other rows of its cluster.
+
+    The copies get the `row_id` of the duplicate and its representative in `propagated_from`,
+    so the annotations of a deduplicated job cover the whole dataset. Written to
+    `output_path` (default: `<annotations>_propagated.csv`).
+    """
+    # ids compared as the strings written: a float column would turn "5" into "5.0"
+    annotations = read_csv(annotations_path)
+    clusters = read_csv(clusters_path)
+    duplicates = clusters[clusters["match"] != ""]
+
+    source = annotations.assign(representative_id=annotations["row_id"])
+    copies = source.drop(columns="row_id").merge(
+        duplicates[["row_id", "representative_id"]], on="representative_id")
+    copies = copies.rename(columns={"representative_id": "propagated_from"})
+    result = pd.concat([annotations, copies], ignore_index=True)[list(annotations.columns) + ["propagated_from"]]
+
+    output_path = output_path or f"{os.path.splitext(annotations_path)[0]}_propagated.csv"
+    result.to_csv(output_path, index=False)
+    print(f"{len(annotations)} annotations and {len(copies)} propagated copies saved to {output_path}.")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find exact and near duplicate texts, and propagate annotations to them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    find = commands.add_parser("find", help="Write the dataset without duplicates and the cluster map.")
+    find.add_argument("dataset_path", type=str, help="Path to the dataset file (CSV format, optionally .gz or .zst).")
+    find.add_argument("--output_dir", type=str, default="dedup", help="Directory for deduplicated.csv and clusters.csv (default: 'dedup').")
+    find.add_argument("--text_column", type=str, default=None, help="Column compared (default: text, or comment).")
+    find.add_argument("--threshold", type=float, default=0.8, help="Similarity of near duplicates (default: 0.8).")
+    find.add_argument("--num_perm", type=int, default=64, help="MinHash values per text, 0 for exact duplicates only (default: 64).")
+    find.add_argument("--chunksize", type=int, default=None, help="Stream the dataset in chunks of this many rows.")
+
+    spread = commands.add_parser("propagate", help="Copy the annotations of representatives to their duplicates.")
+    spread.add_argument("annotations_path", type=str, help="Annotation CSV with a row_id column.")
+    spread.add_argument("clusters_path", type=str, help="clusters.csv written by the find command.")
+    spread.add_argument("--output", type=str, default=None, help="Output CSV (default: <annotations>_propagated.csv).")
+
+    args = parser.parse_args()
+    if args.command == "find":
+        os.makedirs(args.output_dir, exist_ok=True)
+        deduplicate_file(args.dataset_path, os.path.join(args.output_dir, "deduplicated.csv"),
+                         os.path.join(args.output_dir, "clusters.csv"), text_column=args.text_column,
+                         threshold=args.threshold, num_perm=args.num_perm, chunksize=args.chunksize)
+    else:
+        propagate(args.annotations_path, args.clusters_path, args.output)
+
+
+if __name__ == "__main__":
+    main()
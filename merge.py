@@ -0,0 +1,329 @@
+import argparse
+import csv
+import glob
+import gzip
+import io
+import json
+import operator
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from split import batch_boundaries, count_rows, open_output, read_dataset
+
+# columns matched for annotations written before row ids were recorded
+TEXT_COLUMNS = ["text", "comment"]
+# dataset columns read from the annotation files too: the row id and the text to match on
+KEPT_COLUMNS = ["row_id"] + TEXT_COLUMNS
+# files of the annotation folders that hold no annotation lines
+SKIPPED_SUFFIXES = (".done", ".wal", ".tmp", ".history", ".unsaved.jsonl", ".sqlite", ".sqlite-wal", ".sqlite-shm")
+SKIPPED_NAMES = ("manifest.csv", "clusters.csv", "deduplicated.csv")
+# bookkeeping columns of the loaded annotations, dropped from the output
+KEY, TEXT, TIME, SEQ, POS = "_key", "_text", "_time", "_seq", "_pos"
+
+
+def find_annotation_files(paths):
+    """
+    Expand files, folders (searched recursively) and glob patterns into annotation files:
+    CSV (optionally compressed), Parquet, Arrow and `.journal` files of src/main.py. A CSV
+    whose journal is there too is left out, the journal holding every annotation of it.
+    """
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files.update(glob.glob(os.path.join(path, "**", "*"), recursive=True))
+        else:
+            files.update(glob.glob(path))
+    files = {f for f in files if os.path.isfile(f) and not f.endswith(SKIPPED_SUFFIXES)
+             and os.path.basename(f) not in SKIPPED_NAMES}
+    return sorted(f for f in files if f"{f}.journal" not in files)
+
+
+def batch_number(path):
+    """
+    Number of the batch written by split.py an annotation file belongs to, from its name
+    (`annotations_batch_3.csv`, `batch_3_crossval.csv`, ...), or None.
+    """
+    found = re.search(r"batch_(\d+)", os.path.basename(path))
+    return int(found.group(1)) if found else None
+
+
+def _open_text(path):
+    lower = path.lower()
+    if lower.endswith(".gz"):
+        return gzip.open(path, "rt", newline="", encoding="utf-8")
+    if lower.endswith(".zst"):
+        import zstandard  # optional dependency, only needed for zstd files
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True),
+                                newline="", encoding="utf-8")
+    return open(path, newline="", encoding="utf-8")
+
+
+def read_lines(path, keep):
+    """
+    (columns, lines) of an annotation file, with only the columns `keep` accepts and every
+    value as a string ("" when missing). CSV files go through the csv module: for the small
+    files of a batch, the fixed cost of a pandas reader is most of the time.
+    """
+    lower = path.lower()
+    if lower.endswith(".journal"):
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # torn last line from a crash
+                    continue
+        df = pd.DataFrame(records, dtype=object)
+    elif lower.endswith((".parquet", ".arrow", ".feather")):
+        df = (pd.read_parquet(path) if lower.endswith(".parquet") else pd.read_feather(path)).astype(object)
+    else:
+        with _open_text(path) as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            kept = [n for n, column in enumerate(header) if keep(column)]
+            if not kept:
+                return [], []
+            get = operator.itemgetter(*kept) if len(kept) > 1 else (lambda line: (line[kept[0]],))
+            return [header[n] for n in kept], list(map(get, reader))
+    df = df[[c for c in df.columns if keep(c)]]
+    df = df.where(df.notna(), "").astype(str)
+    return list(df.columns), list(df.itertuples(index=False, name=None))
+
+
+def read_annotation_file(path, dataset_columns):
+    """
+    (columns, lines) of one annotation file of any tool: the columns absent from the
+    dataset (the answers), `row_id` and the text columns. Files without `row_id` are either
+    in-place datasets (DetoxAnnotatorV2, no `timestamp`), given their line positions as row
+    ids, or annotations written before row ids were recorded, later matched on their text.
+    None for files that are not annotations.
+    """
+    columns, lines = read_lines(path, lambda column: column not in dataset_columns or column in KEPT_COLUMNS)
+    if "annotator" not in columns or not lines:
+        return None
+    if "row_id" not in columns and "timestamp" not in columns:
+        columns = columns + ["row_id"]
+        lines = [line + (str(n),) for n, line in enumerate(lines)]
+    return tuple(columns), lines
+
+
+def latest(lines, keys):
+    """
+    Keep the latest line of each group of `keys`: the latest `timestamp`, then the highest
+    `revision`, then the one read last. Resolves the same row annotated twice by an
+    annotator, e.g. after a resume by count or an edit.
+    """
+    revision = pd.to_numeric(lines["revision"], errors="coerce") if "revision" in lines.columns else np.nan
+    lines = lines.assign(_revision=revision)
+    lines = lines.sort_values([TIME, "_revision", SEQ], na_position="first", kind="stable")
+    return lines.drop_duplicates(keys, keep="last").drop(columns="_revision")
+
+
+def load_annotations(paths, dataset_columns, ends=None, workers=8, positions=True):
+    """
+    Read every annotation file in parallel and resolve the duplicates.
+
+    Returns the lines keyed by the id of their source row (`_key`, the row position as an
+    integer when `positions`, else the `row_id` string), the lines to match on `_text`, and
+    the answer columns in the order first seen. With `ends` (the batch boundaries of a
+    contiguous split), ids are positions within the batch named by the file and are shifted
+    to positions in the dataset. Everything after reading is vectorized over all the files.
+    """
+    files = find_annotation_files(paths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        read = list(pool.map(lambda path: read_annotation_file(path, dataset_columns), files))
+    # one DataFrame per distinct header rather than one per file
+    headers = {}
+    for n, found in enumerate(read):
+        if found is not None:
+            headers.setdefault(found[0], []).append(n)
+    print(f"{sum(len(found[1]) for found in read if found)} annotation lines read from "
+          f"{sum(map(len, headers.values()))} of {len(files)} files.")
+    if not headers:
+        return None, None, []
+    frames = []
+    for columns, members in headers.items():
+        frame = pd.DataFrame([line for n in members for line in read[n][1]], columns=list(columns), dtype=object)
+        frame["_file"] = np.repeat(members, [len(read[n][1]) for n in members])
+        frames.append(frame)
+    # lines in the order of the files, then of the lines in each file
+    frames = pd.concat(frames, ignore_index=True).sort_values("_file", kind="stable").reset_index(drop=True)
+    frames = frames[frames["annotator"] != ""].reset_index(drop=True)
+    file_index = frames.pop("_file").to_numpy()
+
+    answers = [c for c in frames.columns if c not in dataset_columns and c != "row_id"]
+    lines = frames[answers].fillna("")
+    lines["annotation_file"] = np.array([os.path.basename(f) for f in files], dtype=object)[file_index]
+    lines[TIME] = pd.to_numeric(frames["timestamp"], errors="coerce") if "timestamp" in frames.columns else np.nan
+    # lines of later files, then later lines, win ties
+    lines[SEQ] = np.arange(len(lines))
+
+    ids = frames["row_id"] if "row_id" in frames.columns else pd.Series(np.nan, index=frames.index, dtype=object)
+    ids = ids.where(ids != "")
+    # lines without a row id (read as ""), e.g. legacy rows migrated into a journal
+    legacy = ids.isna()
+    if positions:
+        # positions may have been written as floats ("12.0") by earlier exports
+        ids = pd.to_numeric(ids, errors="coerce")
+        if ends is not None:
+            batches = [batch_number(f) for f in files]
+            starts = np.array([np.nan if b is None else (ends[b - 2] if b > 1 else 0) for b in batches])
+            ids = ids + np.nan_to_num(starts[file_index])
+        ids = ids.where(ids == ids.round())
+    lines[KEY] = ids
+    text_column = next((c for c in TEXT_COLUMNS if c in frames.columns), None)
+    lines[TEXT] = frames[text_column] if text_column else np.nan
+
+    keyed = lines[lines[KEY].notna()]
+    if positions:
+        keyed = keyed.assign(**{KEY: keyed[KEY].astype("int64")})
+    keyed = latest(keyed.drop(columns=TEXT), [KEY, "annotator"])
+    by_text = latest(lines[legacy & lines[TEXT].notna()].drop(columns=KEY), [TEXT, "annotator"])
+    return keyed, by_text, answers
+
+
+class TableWriter:
+    """
+    Write a table chunk by chunk as CSV (optionally gzip/zstd compressed), Parquet or Arrow,
+    every column as strings so all chunks share one schema.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        lower = path.lower()
+        self._writer = None
+        self._output = None
+        if lower.endswith((".parquet", ".arrow", ".feather")):
+            import pyarrow as pa  # needed for Parquet and Arrow output only
+            import pyarrow.parquet as pq
+            self._schema = pa.schema([(column, pa.string()) for column in self.columns])
+            if lower.endswith(".parquet"):
+                self._writer = pq.ParquetWriter(path, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(path, self._schema)
+        else:
+            compression = {".gz": "gzip", ".zst": "zstd"}.get(os.path.splitext(lower)[1])
+            self._output = open_output(path, compression)
+            pd.DataFrame(columns=self.columns).to_csv(self._output, index=False)
+
+    def write(self, df):
+        df = df.reindex(columns=self.columns)
+        if self._writer is None:
+            df.to_csv(self._output, index=False, header=False)
+            return
+        import pyarrow as pa
+        df = df.astype(object).where(df.notna(), None)
+        self._writer.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        else:
+            self._output.close()
+
+
+def merge(dataset_path, annotation_paths, output_path, num_batches=None, clusters_path=None,
+          annotated_only=False, chunksize=100000, workers=8):
+    """
+    Join the annotations of a campaign back onto the dataset split.py cut up, in one pass.
+
+    Parameters:
+    - dataset_path (str): The original dataset (CSV format, optionally .gz or .zst compressed).
+    - annotation_paths (list): Annotation files, folders or glob patterns: the files of
+      src/main.py, server.py and engine.py (their journals when present) and the CSVs
+      annotated in place by DetoxAnnotatorV2.
+    - output_path (str): Merged file, Parquet (.parquet), Arrow (.arrow) or CSV (optionally
+      .gz or .zst). One line per (source row, annotator) in dataset order, with the answer
+      columns and the `annotation_file` they come from; rows nobody annotated appear once
+      with empty answers unless `annotated_only`.
+    - num_batches (int): Number of batches when they were cut with the contiguous strategy
+      from a dataset without `row_id`: row ids are then positions within each batch, found
+      from the `batch_<n>` of the file names. Otherwise row ids are those of the dataset (its
+      `row_id`, else the row position, as written by the stratified strategy and dedup.py).
+    - clusters_path (str): clusters.csv of dedup.py: duplicates get the annotations of the
+      representative of their cluster, which is noted in `propagated_from`.
+    - chunksize (int): Rows of the dataset merged at once, which bounds the memory used
+      besides the annotations.
+    - workers (int): Annotation files read in parallel.
+    """
+    header = read_dataset(dataset_path, nrows=0)
+    dataset_columns = header.columns.tolist()
+    has_row_id = "row_id" in dataset_columns
+    ends = batch_boundaries(count_rows(dataset_path, chunksize), num_batches) if num_batches and not has_row_id else None
+
+    # rows are joined on their position (an integer) unless the dataset has row ids
+    positions = not has_row_id
+    keyed, by_text, answers = load_annotations(annotation_paths, set(dataset_columns), ends, workers, positions)
+    if keyed is None:
+        raise SystemExit("No annotation found.")
+    text_column = next((c for c in TEXT_COLUMNS if c in dataset_columns), None)
+    representatives = None
+    if clusters_path:
+        clusters = read_dataset(clusters_path)
+        clusters = clusters[clusters["match"] != ""]
+        representatives = pd.Series(clusters["representative_id"].to_numpy(), index=clusters["row_id"].to_numpy())
+
+    columns = dataset_columns + ([] if has_row_id else ["row_id"]) + answers + \
+        (["propagated_from"] if clusters_path else []) + ["annotation_file"]
+    writer = TableWriter(output_path, columns)
+    start = 0
+    written = annotated = 0
+    try:
+        for chunk in read_dataset(dataset_path, chunksize=chunksize):
+            chunk = chunk.reset_index(drop=True)
+            chunk[POS] = np.arange(start, start + len(chunk))
+            if not has_row_id:
+                chunk["row_id"] = chunk[POS].astype(str)
+            chunk[KEY] = chunk[POS] if positions else chunk["row_id"]
+            if representatives is not None:
+                found = chunk["row_id"].map(representatives)
+                chunk["propagated_from"] = found.fillna("")
+                if positions:
+                    found = pd.to_numeric(found, errors="coerce")
+                chunk[KEY] = found.where(found.notna(), chunk[KEY]).astype(chunk[KEY].dtype)
+
+            parts = [chunk.merge(keyed, on=KEY)]
+            if text_column and not by_text.empty:
+                parts.append(chunk.merge(by_text, left_on=text_column, right_on=TEXT))
+            lines = latest(pd.concat(parts, ignore_index=True), [POS, "annotator"])
+            annotated += lines[POS].nunique()
+            if not annotated_only:
+                lines = pd.concat([lines, chunk[~chunk[POS].isin(lines[POS])]], ignore_index=True)
+            lines = lines.sort_values([POS, SEQ], kind="stable")
+            writer.write(lines)
+            written += len(lines)
+            start += len(chunk)
+    finally:
+        writer.close()
+    print(f"{annotated} of {start} rows annotated, {written} lines saved to {output_path}.")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the annotation files of a campaign back onto the original dataset.")
+    parser.add_argument("dataset_path", type=str, help="Dataset split.py cut into batches (CSV format, optionally .gz or .zst).")
+    parser.add_argument("annotations", nargs="+", help="Annotation files, folders or glob patterns (both tools).")
+    parser.add_argument("--output", type=str, default="merged.parquet",
+                        help="Merged file: .parquet, .arrow or .csv (optionally .gz or .zst) (default: merged.parquet).")
+    parser.add_argument("--num_batches", type=int, default=None,
+                        help="Number of batches of a contiguous split of a dataset without row_id, whose row ids are "
+                             "positions within each batch.")
+    parser.add_argument("--clusters", type=str, default=None, help="clusters.csv of dedup.py, to annotate the duplicates too.")
+    parser.add_argument("--annotated_only", action="store_true", help="Leave out the rows nobody annotated.")
+    parser.add_argument("--chunksize", type=int, default=100000, help="Dataset rows merged at once (default: 100000).")
+    parser.add_argument("--workers", type=int, default=8, help="Annotation files read in parallel (default: 8).")
+    args = parser.parse_args()
+
+    merge(args.dataset_path, args.annotations, args.output, num_batches=args.num_batches,
+          clusters_path=args.clusters, annotated_only=args.annotated_only, chunksize=args.chunksize,
+          workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,247 @@
+import gzip
+import io
 import os
 import pandas as pd
 import argparse
 import random
 
-def split_into_batches(dataset_path, num_batches, output_dir, crossval_percentage):
+import numpy as np
+
+from assignment import assign_batches, write_manifest
+from dedup import deduplicate_file
+
+OUTPUT_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def read_dataset(dataset_path, **kwargs):
+    """
+    Read a dataset (plain, gzip or zstd compressed CSV) with every value kept as the exact
+    string found in the file, so batches reproduce the input values byte for byte.
+    """
+    return pd.read_csv(dataset_path, dtype=str, keep_default_na=False, compression="infer", **kwargs)
+
+
+def count_rows(dataset_path, chunksize):
+    """
+    Count the rows of a dataset without loading it, reading only its first column.
+    """
+    return sum(len(chunk) for chunk in read_dataset(dataset_path, usecols=[0], chunksize=chunksize))
+
+
+def open_output(path, compression=None):
+    """
+    Open a batch file for writing text, optionally compressed. Gzip output has no timestamp
+    in its header, so the same rows always give the same bytes.
+    """
+    if compression is None:
+        return open(path, "w", newline="", encoding="utf-8")
+    if compression == "gzip":
+        raw = gzip.GzipFile(path, "wb", mtime=0)
+    elif compression == "zstd":
+        import zstandard  # optional dependency, only needed for zstd output
+        raw = zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+    else:
+        raise ValueError(f"Unknown compression '{compression}', choose gzip or zstd")
+    return io.TextIOWrapper(raw, newline="", encoding="utf-8")
+
+
+def batch_boundaries(num_rows, num_batches):
+    """
+    End row (exclusive) of each batch: batches are contiguous and the first
+    `num_rows % num_batches` batches take one extra row.
+    """
+    batch_size = num_rows // num_batches
+    remainder = num_rows % num_batches  # Handle any remainder
+    ends = []
+    end_idx = 0
+    for i in range(1, num_batches + 1):
+        end_idx += batch_size + (1 if i <= remainder else 0)
+        ends.append(end_idx)
+    return ends
+
+
+def split_into_batches(dataset_path, num_batches, output_dir, crossval_percentage, seed=None,
+                       chunksize=None, compression=None):
     """
     Splits a dataset into a specified number of batches and optionally marks some for cross-evaluation.
 
     Parameters:
-    - dataset_path (str): Path to the dataset file (CSV format).
+    - dataset_path (str): Path to the dataset file (CSV format, optionally .gz or .zst compressed).
     - num_batches (int): Number of batches to create.
     - output_dir (str): Directory where batches will be saved.
     - crossval_percentage (float): Percentage of batches to mark for cross-evaluation.
+    - seed (int): Seed for choosing the cross-evaluation batches (random when None).
+    - chunksize (int): When set, stream the dataset in chunks of this many rows instead of
+      loading it, so memory is bounded by the chunk size. The output is identical.
+    - compression (str): Compress the batches with "gzip" or "zstd".
     """
-    # Load the dataset
-    dataset = pd.read_csv(dataset_path)
-
     # Ensure the output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
-    # Calculate batch size
-    batch_size = len(dataset) // num_batches
-    remainder = len(dataset) % num_batches  # Handle any remainder
+    if chunksize:
+        num_rows = count_rows(dataset_path, chunksize)
+    else:
+        # Load the dataset
+        dataset = read_dataset(dataset_path)
+        num_rows = len(dataset)
+    ends = batch_boundaries(num_rows, num_batches)
 
     # Determine the batches to mark for cross-evaluation
     crossval_count = max(1, round(num_batches * (crossval_percentage / 100)))
-    crossval_batches = random.sample(range(1, num_batches + 1), crossval_count)
+    crossval_batches = random.Random(seed).sample(range(1, num_batches + 1), crossval_count)
     print(f"Batches selected for cross-evaluation: {crossval_batches}")
 
-    start_idx = 0
+    batch_filenames = []
     for i in range(1, num_batches + 1):
-        # Calculate the end index for the batch
-        end_idx = start_idx + batch_size + (1 if i <= remainder else 0)
-        
-        # Slice the dataset for the current batch
-        batch = dataset.iloc[start_idx:end_idx]
-        
         # Determine the filename, adding "_crossval" if marked for cross-evaluation
         is_crossval = i in crossval_batches
         batch_suffix = "_crossval" if is_crossval else ""
-        batch_filename = os.path.join(output_dir, f"batch_{i}{batch_suffix}.csv")
-        
-        # Save the batch
-        batch.to_csv(batch_filename, index=False)
-        print(f"Batch {i} ({len(batch)} samples) saved to {batch_filename}.")
-        
-        # Update start index for the next batch
-        start_idx = end_idx
+        batch_filenames.append(os.path.join(output_dir, f"batch_{i}{batch_suffix}.csv{OUTPUT_EXTENSIONS[compression]}"))
+
+    if chunksize:
+        chunks = read_dataset(dataset_path, chunksize=chunksize)
+    else:
+        chunks = [dataset]
+
+    # Columns only, used for the header of every batch
+    header = read_dataset(dataset_path, nrows=0)
+    output = None
+    written = 0
+
+    def finish_batch(i):
+        nonlocal output, written
+        if output is None:
+            # batch left empty
+            output = open_output(batch_filenames[i], compression)
+            header.to_csv(output, index=False)
+        output.close()
+        print(f"Batch {i + 1} ({written} samples) saved to {batch_filenames[i]}.")
+        output = None
+        written = 0
+
+    # Route the rows of every chunk to the batches they belong to
+    batch = 0
+    row_idx = 0
+    for chunk in chunks:
+        offset = 0
+        while offset < len(chunk):
+            while row_idx >= ends[batch]:
+                finish_batch(batch)
+                batch += 1
+            take = min(len(chunk) - offset, ends[batch] - row_idx)
+            if output is None:
+                output = open_output(batch_filenames[batch], compression)
+            chunk.iloc[offset:offset + take].to_csv(output, index=False, header=written == 0)
+            written += take
+            offset += take
+            row_idx += take
+
+    for i in range(batch, num_batches):
+        finish_batch(i)
+
+
+def split_stratified(dataset_path, num_batches, output_dir, stratify_by=None, seed=0,
+                     overlap_fraction=0.0, overlap_k=2, chunksize=None, compression=None):
+    """
+    Splits a dataset into batches with the stratified assignment engine (see assignment.py).
+
+    Every batch gets the same share of each stratum, `overlap_fraction` of the rows is put in
+    `overlap_k` batches, and `manifest.csv` in `output_dir` maps each row id to its batches.
+    Batch files get a `row_id` column (the row position unless the dataset has one) and a
+    `crossval` column marking the overlapping rows. With `chunksize`, only the stratification
+    columns are loaded and the rows are streamed to the batches; the output is identical.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    header = read_dataset(dataset_path, nrows=0)
+    has_row_id = "row_id" in header.columns
+    key_columns = list(stratify_by or []) + (["row_id"] if has_row_id else [])
+    if chunksize:
+        keys = pd.concat(read_dataset(dataset_path, usecols=key_columns or [0], chunksize=chunksize),
+                         ignore_index=True)
+        chunks = read_dataset(dataset_path, chunksize=chunksize)
+    else:
+        dataset = read_dataset(dataset_path)
+        keys = dataset
+        chunks = [dataset]
+    num_rows = len(keys)
+
+    assignments = assign_batches(num_rows, num_batches, keys[list(stratify_by)] if stratify_by else None,
+                                 seed=seed, overlap_fraction=overlap_fraction, overlap_k=overlap_k)
+    row_ids = keys["row_id"].to_numpy() if has_row_id else np.arange(num_rows)
+    write_manifest(assignments, row_ids, os.path.join(output_dir, "manifest.csv"))
+    print(f"{int(assignments['crossval'].sum())} assignments of cross-evaluation rows.")
+
+    assigned_rows = assignments["row"].to_numpy()
+    assigned_batches = assignments["batch"].to_numpy()
+    assigned_crossval = assignments["crossval"].to_numpy()
+    batch_filenames = [os.path.join(output_dir, f"batch_{i}.csv{OUTPUT_EXTENSIONS[compression]}")
+                       for i in range(1, num_batches + 1)]
+    outputs = [open_output(path, compression) for path in batch_filenames]
+    written = [0] * num_batches
+
+    start_idx = 0
+    for chunk in chunks:
+        chunk = chunk.reset_index(drop=True)
+        if not has_row_id:
+            chunk["row_id"] = np.arange(start_idx, start_idx + len(chunk)).astype(str)
+        lo, hi = np.searchsorted(assigned_rows, [start_idx, start_idx + len(chunk)])
+        rows = assigned_rows[lo:hi] - start_idx
+        batches = assigned_batches[lo:hi]
+        crossval = assigned_crossval[lo:hi]
+        for b in np.unique(batches):
+            selected = batches == b
+            part = chunk.iloc[rows[selected]].copy()
+            part["crossval"] = crossval[selected]
+            part.to_csv(outputs[b - 1], index=False, header=written[b - 1] == 0)
+            written[b - 1] += len(part)
+        start_idx += len(chunk)
+
+    columns = header.columns.tolist() + ([] if has_row_id else ["row_id"]) + ["crossval"]
+    for i, output in enumerate(outputs):
+        if written[i] == 0:
+            pd.DataFrame(columns=columns).to_csv(output, index=False)
+        output.close()
+        print(f"Batch {i + 1} ({written[i]} samples) saved to {batch_filenames[i]}.")
+
 
 def main():
     parser = argparse.ArgumentParser(description="Split a dataset into multiple batches with cross-evaluation marking.")
-    parser.add_argument("dataset_path", type=str, help="Path to the dataset file (CSV format).")
+    parser.add_argument("dataset_path", type=str, help="Path to the dataset file (CSV format, optionally .gz or .zst).")
     parser.add_argument("num_batches", type=int, help="Number of batches to create.")
     parser.add_argument("--output_dir", type=str, default="batches", help="Directory to save batches (default: 'batches').")
-    parser.add_argument("--crossval_percentage", type=float, default=0.0, help="Percentage of batches for cross-evaluation (default: 0%).")
-    
+    parser.add_argument("--crossval_percentage", type=float, default=0.0, help="Percentage of batches for cross-evaluation (default: 0%%).")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the cross-evaluation choice (default: random).")
+    parser.add_argument("--chunksize", type=int, default=None, help="Stream the dataset in chunks of this many rows instead of loading it.")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], default=None, help="Compress the batch files.")
+    parser.add_argument("--strategy", choices=["contiguous", "stratified"], default="contiguous",
+                        help="'contiguous' slices the file and marks whole batches for cross-evaluation; "
+                             "'stratified' balances strata across batches and overlaps single rows (default: contiguous).")
+    parser.add_argument("--stratify_by", nargs="*", default=[], help="Columns to stratify on, e.g. Class style_case (stratified only).")
+    parser.add_argument("--overlap_fraction", type=float, default=0.0, help="Fraction of rows given to several annotators (stratified only).")
+    parser.add_argument("--overlap_k", type=int, default=2, help="Number of annotators for each overlapping row (stratified only, default: 2).")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Send one row per cluster of exact and near duplicate texts to annotators; the cluster map is "
+                             "saved to clusters.csv in the output directory (see dedup.py).")
+    parser.add_argument("--dedup_threshold", type=float, default=0.8, help="Similarity of near duplicates (default: 0.8).")
+    parser.add_argument("--text_column", type=str, default=None, help="Column deduplicated (default: text, or comment).")
+
     args = parser.parse_args()
-    
-    split_into_batches(args.dataset_path, args.num_batches, args.output_dir, args.crossval_percentage)
+
+    if args.dedup:
+        os.makedirs(args.output_dir, exist_ok=True)
+        args.dataset_path = deduplicate_file(args.dataset_path, os.path.join(args.output_dir, "deduplicated.csv"),
+                                             os.path.join(args.output_dir, "clusters.csv"),
+                                             text_column=args.text_column, threshold=args.dedup_threshold,
+                                             chunksize=args.chunksize)
+
+    if args.strategy == "stratified":
+        split_stratified(args.dataset_path, args.num_batches, args.output_dir, stratify_by=args.stratify_by,
+                         seed=args.seed or 0, overlap_fraction=args.overlap_fraction, overlap_k=args.overlap_k,
+                         chunksize=args.chunksize, compression=args.compression)
+    else:
+        split_into_batches(args.dataset_path, args.num_batches, args.output_dir, args.crossval_percentage,
+                           seed=args.seed, chunksize=args.chunksize, compression=args.compression)
 
 if __name__ == "__main__":
     main()
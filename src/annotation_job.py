@@ -0,0 +1,149 @@
+import atexit
+import os
+import threading
+
+from committer import BackgroundCommitter
+from completion_index import CompletionIndex
+from metrics import METRICS
+from prefetch import Prefetcher
+
+
+def annotations_path(dataset_name):
+    """
+    Path of the annotations of a dataset, `annotations/annotations_<dataset name>` in the
+    current directory, creating the folder.
+    """
+    annotations_folder = os.path.join(os.getcwd(), "annotations")
+    os.makedirs(annotations_folder, exist_ok=True)
+    return os.path.join(annotations_folder, f"annotations_{dataset_name}")
+
+
+def stored_rows(anns_store, table, text_column=None):
+    """
+    (position in `table`, annotation) of the stored annotations, matched on `row_id`, or on
+    `text_column` for annotations written before row ids were recorded.
+    """
+    rows = anns_store.rows()
+    if not rows:
+        # nothing to match, and no column of a lazily loaded batch needs to be read
+        return
+    # compared as strings: ids read from CSV, Arrow or the journal may differ in type
+    positions = {str(row_id): pos for pos, row_id in enumerate(table["row_id"])}
+    text_positions = None
+    for row in rows:
+        if str(row.get("row_id")) in positions:
+            yield positions[str(row["row_id"])], row
+            continue
+        if text_column is None:
+            continue
+        if text_positions is None:
+            text_positions = {}
+            for pos, text in enumerate(table[text_column]):
+                text_positions.setdefault(text, []).append(pos)
+        for pos in text_positions.get(row.get(text_column), []):
+            yield pos, row
+
+
+def open_completion(anns_store, table, text_column=None):
+    """
+    CompletionIndex of the rows of `table` annotated by anyone, kept next to the annotations
+    (`<annotations>.done`) and rebuilt from the store when annotations were stored after it
+    was last written (e.g. crash in between).
+    """
+    completion = CompletionIndex(f"{anns_store.csv_path}.done", len(table),
+                                 lambda: (pos for pos, _ in stored_rows(anns_store, table, text_column)))
+    revisions = anns_store.revisions
+    # every (row, annotator) pair of a shared store may exceed the rows of the batch: compare
+    # on the annotated rows of the batch, once the cheap count says it may be needed
+    if len(revisions) > completion.done_count and \
+            len(revisions.row_ids() & {str(row_id) for row_id in table["row_id"]}) > completion.done_count:
+        completion.rebuild(lambda: (pos for pos, _ in stored_rows(anns_store, table, text_column)))
+    return completion
+
+
+def lease_next(session, scheduler, prepare, prefetch, holder=None, count=None):
+    """
+    Lease the next row of the session (a list of `count` rows for a page) from `scheduler`,
+    and prepare the following ones in the background with `prepare`. Rows are leased to
+    `holder`, by default the session itself.
+    """
+    holder = session.id if holder is None else holder
+    depth = max(prefetch, count or 1)
+    if session.buffer is None:
+        session.buffer = Prefetcher(prepare, depth)
+    leased = scheduler.lease(holder) if count is None else scheduler.lease_many(holder, count)
+    session.buffer.schedule(scheduler.peek(holder, depth))
+    return leased
+
+
+class AnnotationWriter:
+    """
+    Stores the (position, annotation) pairs of a batch and marks their rows done.
+
+    With `write_behind` (keyboard mode), the store is written by a background thread, so
+    moving to the next example never waits on the disk. Rows are only marked done in the
+    completion index once stored; `annotated_count` counts the queued ones meanwhile, and
+    those the store keeps refusing end up in `<annotations>.unsaved.jsonl`. The CSV in the
+    usual layout is exported when the process exits.
+    """
+
+    def __init__(self, anns_store, completion, write_behind=False):
+        self.anns_store = anns_store
+        self.completion = completion
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._committer = BackgroundCommitter(self._store, fallback_path=f"{anns_store.csv_path}.unsaved.jsonl") \
+            if write_behind else None
+        # keep the CSV up to date for downstream scripts
+        atexit.register(self.close)
+
+    def _store(self, annotations):
+        self.anns_store.append_many([row for _, row in annotations])
+        with self._lock:
+            for pos, _ in annotations:
+                self.completion.mark(pos)
+                self._queued.discard(pos)
+
+    def save(self, annotations):
+        # numbered now, so the Back button finds them before a background write
+        self.anns_store.revisions.assign([row for _, row in annotations])
+        if self._committer is None:
+            self._store(annotations)
+            return
+        with self._lock:
+            self._queued.update(pos for pos, _ in annotations if not self.completion.is_done(pos))
+        for annotation in annotations:
+            self._committer.put(annotation)
+
+    def annotated_count(self):
+        """
+        Rows annotated, those waiting for the background write included.
+        """
+        with self._lock:
+            return self.completion.done_count + len(self._queued)
+
+    def export_csv(self, timeout=60.0):
+        """
+        Export the CSV once the queued annotations are stored, or `timeout` seconds passed.
+        """
+        if self._committer is not None:
+            self._committer.flush(timeout)
+        self.anns_store.export_csv()
+
+    def close(self):
+        if self._committer is not None:
+            self._committer.close()
+        self.anns_store.export_csv()
+
+
+def launch(demo, metrics_port=None, trace=None, **kwargs):
+    """
+    Launch `demo` with the latency of every handler, by phase, served at
+    http://127.0.0.1:<metrics_port>/metrics and appended to `trace` when set.
+    """
+    METRICS.instrument_blocks(demo)
+    if trace:
+        METRICS.trace_to(trace)
+    if metrics_port:
+        METRICS.serve(metrics_port)
+    demo.launch(**kwargs)
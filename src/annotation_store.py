@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+
+import pandas as pd
+
+from columnar import read_table, write_table
+from metrics import add_bytes, phase
+from revisions import RevisionIndex, latest_revisions
+
+
+def _jsonable(value):
+    # numpy scalars coming from DataFrame rows are not JSON serializable
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def write_csv_atomic(df, path):
+    """
+    Write `df` to `path` through a temporary file so readers never see a half written CSV.
+    Paths ending in .parquet or .arrow are written in that format instead.
+    """
+    tmp_path = f"{path}.tmp"
+    with phase("write"):
+        write_table(df, tmp_path, format_path=path)
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        add_bytes(written=os.path.getsize(tmp_path))
+        os.replace(tmp_path, path)
+
+
+class AnnotationStore:
+    """
+    Base class for annotation backends.
+
+    A store receives one dict per validated example and is able to export every stored
+    row to the CSV layout written by the original tool (`annotations/annotations_<batch>`).
+    Stored rows are never changed: annotating a row again appends its next `revision`, and
+    the export keeps the latest revision of each row per annotator.
+    """
+
+    def __init__(self, csv_path, columns):
+        self.csv_path = csv_path
+        self.columns = list(columns)
+        self._revisions = None
+        self._revisions_lock = threading.Lock()
+
+    @property
+    def revisions(self):
+        """
+        RevisionIndex of the stored rows, read from the store on first use.
+        """
+        with self._revisions_lock:
+            if self._revisions is None:
+                self._revisions = RevisionIndex(self.rows())
+            return self._revisions
+
+    def append(self, row):
+        self.append_many([row])
+
+    def append_many(self, rows):
+        """
+        Store several rows at once (a page of the batched view) in a single write, each one
+        numbered as the next revision of its (row_id, annotator).
+        """
+        self.revisions.assign(rows)
+        self._write(rows)
+
+    def _write(self, rows):
+        raise NotImplementedError
+
+    def rows(self):
+        """
+        Every stored row in the order written, all revisions included.
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self.rows())
+
+    def to_dataframe(self):
+        df = pd.DataFrame(latest_revisions(self.rows()))
+        extra = [c for c in df.columns if c not in self.columns]
+        return df.reindex(columns=self.columns + extra)
+
+    def lease_log(self, row_ids):
+        """
+        Where a LeaseScheduler over the rows with these `row_ids` keeps its leases across
+        restarts, or None when the backend cannot (they are then only held in memory).
+        """
+        return None
+
+    def export_csv(self, path=None):
+        """
+        Write the latest revisions to the CSV. Nothing is written while the store is empty:
+        an empty CSV without `revision` would be read back as a legacy file.
+        """
+        if not len(self):
+            return
+        write_csv_atomic(self.to_dataframe(), path or self.csv_path)
+
+    def close(self):
+        pass
+
+
+class CsvStore(AnnotationStore):
+    """
+    Legacy backend: read the whole CSV, add the row and write everything back. The CSV keeps
+    every revision, only exports to another path are resolved to the latest ones.
+    """
+
+    def _write(self, rows):
+        with phase("read"):
+            if os.path.exists(self.csv_path):
+                anns_df = read_table(self.csv_path)
+                add_bytes(read=os.path.getsize(self.csv_path))
+            else:
+                anns_df = pd.DataFrame(columns=self.columns)
+        with phase("build"):
+            anns_df = pd.concat((anns_df, pd.DataFrame(rows)), ignore_index=True)
+        with phase("write"):
+            anns_df.to_csv(self.csv_path, index=False)
+            add_bytes(written=os.path.getsize(self.csv_path))
+
+    def rows(self):
+        if not os.path.exists(self.csv_path):
+            return []
+        return read_table(self.csv_path).to_dict("records")
+
+    def export_csv(self, path=None):
+        # the CSV is always up to date
+        if path and path != self.csv_path and os.path.exists(self.csv_path):
+            super().export_csv(path)
+
+
+class JournalStore(AnnotationStore):
+    """
+    Append-only backend: every annotation is a single JSON line in `<csv_path>.journal`,
+    flushed and fsync'd before returning, so submitting costs the same no matter how many
+    rows were already annotated. `export_csv` compacts the journal into the legacy CSV.
+    """
+
+    def __init__(self, csv_path, columns):
+        super().__init__(csv_path, columns)
+        self.journal_path = f"{csv_path}.journal"
+        self._lock = threading.Lock()
+        migrate = not os.path.exists(self.journal_path) and os.path.exists(self.csv_path)
+        self._file = open(self.journal_path, "a+", encoding="utf-8")
+        self._file.seek(0)
+        self._count = 0
+        tail = ""
+        for line in self._file:
+            self._count += line.endswith("\n")
+            tail = line
+        if tail and not tail.endswith("\n"):
+            # torn last line from a crash in the middle of a write: terminate it so the
+            # next record starts on a line of its own
+            self._file.write("\n")
+        if migrate:
+            # one-time import of annotations written by the legacy backend
+            for row in read_table(self.csv_path).to_dict("records"):
+                self._file.write(self._encode(row))
+                self._count += 1
+        self._sync()
+
+    @staticmethod
+    def _encode(row):
+        return json.dumps({k: _jsonable(v) for k, v in row.items()}, ensure_ascii=False) + "\n"
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _read(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def _write(self, rows):
+        # one fsync for the whole batch
+        lines = "".join(self._encode(row) for row in rows)
+        with phase("write"), self._lock:
+            self._file.write(lines)
+            self._sync()
+            self._count += len(rows)
+        add_bytes(written=len(lines.encode("utf-8")))
+
+    def rows(self):
+        return list(self._read())
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+STORES = {
+    "csv": CsvStore,
+    "journal": JournalStore,
+}
+
+
+def open_store(kind, csv_path, columns):
+    if kind == "sqlite":
+        # SQLite database shared by every batch of the folder, see sqlite_store.py
+        from sqlite_store import SqliteStore
+        return SqliteStore(csv_path, columns)
+    if kind not in STORES:
+        raise ValueError(f"Unknown annotation store '{kind}', choose one of {sorted(STORES) + ['sqlite']}")
+    return STORES[kind](csv_path, columns)
@@ -0,0 +1,188 @@
+import bisect
+import os
+import threading
+from collections import OrderedDict
+
+import fire
+import pandas as pd
+
+from metrics import add_bytes, phase
+
+# file extensions read and written with pyarrow instead of the csv module
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+# columns the interface of src/main.py shows for every example, and their value when missing
+EXAMPLE_DEFAULTS = {"Neutral": "[empty]", "Formal": "[empty]", "Friendly": "[empty]"}
+
+
+def is_columnar(path):
+    return path.lower().endswith(PARQUET_EXTENSIONS + ARROW_EXTENSIONS)
+
+
+def read_table(path, **kwargs):
+    """
+    Read a CSV, Parquet or Arrow IPC file into a DataFrame. Arrow files are memory-mapped.
+    """
+    lower = path.lower()
+    if lower.endswith(PARQUET_EXTENSIONS):
+        return pd.read_parquet(path, **kwargs)
+    if lower.endswith(ARROW_EXTENSIONS):
+        return pd.read_feather(path, memory_map=True, **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def write_table(df, path, format_path=None):
+    """
+    Write `df` to `path` in the format given by the extension of `format_path` (default
+    `path`). Object columns are written as strings in columnar files, since annotation
+    columns can mix numbers, strings and missing values.
+    """
+    lower = (format_path or path).lower()
+    if not lower.endswith(PARQUET_EXTENSIONS + ARROW_EXTENSIONS):
+        df.to_csv(path, index=False)
+        return
+    df = df.apply(lambda column: column.where(column.isna(), column.astype(str)) if column.dtype == object else column)
+    if lower.endswith(PARQUET_EXTENSIONS):
+        df.to_parquet(path, index=False)
+    else:
+        # uncompressed, so readers can memory-map it
+        df.reset_index(drop=True).to_feather(path, compression="uncompressed")
+
+
+class _Rows:
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, pos):
+        return self.table.row(pos)
+
+
+class LazyTable:
+    """
+    Read-only view of a Parquet or Arrow IPC file that only materializes the rows asked for.
+
+    Arrow files are memory-mapped, so a row costs a zero-copy slice; Parquet files are read
+    one row group at a time, keeping the last few groups in memory. Startup only reads the
+    schema, so time and memory do not grow with the number of rows. Missing `defaults`
+    columns and null values in them are filled when a row is read, and the row position is
+    used as `row_id` when the file has none.
+
+    Enough of the DataFrame interface is provided for src/main.py: `len`, `columns`,
+    `iloc[pos]` (a Series) and `table[column]` (reads that single column).
+    """
+
+    def __init__(self, path, defaults=None, cached_groups=4):
+        import pyarrow as pa  # optional dependency, only needed for columnar input
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.defaults = dict(defaults or {})
+        self.iloc = _Rows(self)
+        self._lock = threading.Lock()
+        if path.lower().endswith(PARQUET_EXTENSIONS):
+            self._parquet = pq.ParquetFile(path, memory_map=True)
+            self._table = None
+            sizes = [self._parquet.metadata.row_group(i).num_rows for i in range(self._parquet.num_row_groups)]
+            self._starts = [sum(sizes[:i]) for i in range(len(sizes))]
+            self._groups = OrderedDict()
+            self._cached_groups = cached_groups
+            self._length = self._parquet.metadata.num_rows
+            names = self._parquet.schema_arrow.names
+        else:
+            self._parquet = None
+            self._table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            self._length = self._table.num_rows
+            names = self._table.schema.names
+        self._names = list(names)
+        self._generated_row_id = "row_id" not in self._names
+        self.columns = pd.Index(self._names + [c for c in self.defaults if c not in self._names]
+                                + (["row_id"] if self._generated_row_id else []))
+
+    def __len__(self):
+        return self._length
+
+    def _group(self, i):
+        with self._lock:
+            group = self._groups.pop(i, None)
+            if group is None:
+                group = self._parquet.read_row_group(i)
+                add_bytes(read=group.nbytes)
+            self._groups[i] = group
+            while len(self._groups) > self._cached_groups:
+                self._groups.popitem(last=False)
+        return group
+
+    def row(self, pos):
+        if pos < 0:
+            pos += self._length
+        if not 0 <= pos < self._length:
+            raise IndexError(f"row {pos} out of range for {self._length} rows")
+        with phase("read"):
+            if self._parquet is not None:
+                i = bisect.bisect_right(self._starts, pos) - 1
+                values = self._group(i).slice(pos - self._starts[i], 1).to_pylist()[0]
+            else:
+                values = self._table.slice(pos, 1)
+                add_bytes(read=values.nbytes)
+                values = values.to_pylist()[0]
+        for column, default in self.defaults.items():
+            if values.get(column) is None:
+                values[column] = default
+        if self._generated_row_id:
+            values["row_id"] = pos
+        return pd.Series(values, index=self.columns, name=pos)
+
+    def __getitem__(self, column):
+        if column not in self._names:
+            if column == "row_id" and self._generated_row_id:
+                return pd.Series(range(self._length), name=column)
+            if column in self.defaults:
+                return pd.Series([self.defaults[column]] * self._length, name=column)
+            raise KeyError(column)
+        if self._parquet is not None:
+            values = self._parquet.read(columns=[column]).column(0)
+        else:
+            values = self._table.column(column)
+        values = values.to_pandas()
+        if column in self.defaults:
+            values = values.fillna(self.defaults[column])
+        return values.rename(column)
+
+
+def convert(input_path: str, output_path: str = None, chunksize: int = 100000, row_group_size: int = 10000):
+    """
+    Convert a CSV batch to Parquet or Arrow IPC (`output_path` extension, default `.arrow`
+    next to the input), streaming it in chunks of `chunksize` rows. The example columns are
+    filled and a `row_id` column is added once here, instead of at every launch.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    output_path = output_path or os.path.splitext(input_path)[0] + ".arrow"
+    parquet = output_path.lower().endswith(PARQUET_EXTENSIONS)
+    writer = None
+    start = 0
+    for chunk in pd.read_csv(input_path, dtype=str, chunksize=chunksize):
+        generated_row_id = "row_id" not in chunk.columns
+        for column, default in EXAMPLE_DEFAULTS.items():
+            chunk[column] = chunk[column].fillna(default) if column in chunk.columns else default
+        if generated_row_id:
+            chunk["row_id"] = range(start, start + len(chunk))
+        start += len(chunk)
+        if writer is None:
+            # every value stays the string found in the CSV, so chunks share one schema
+            schema = pa.schema([(c, pa.int64() if c == "row_id" and generated_row_id else pa.string())
+                                for c in chunk.columns])
+            writer = pq.ParquetWriter(output_path, schema) if parquet else pa.ipc.new_file(output_path, schema)
+        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+        if parquet:
+            writer.write_table(table, row_group_size=row_group_size)
+        else:
+            writer.write_table(table)
+    if writer is not None:
+        writer.close()
+    print(f"{start} rows written to {output_path}")
+
+
+if __name__ == "__main__":
+    fire.Fire(convert)
@@ -0,0 +1,116 @@
+import atexit
+import json
+import threading
+
+
+def _jsonable(value):
+    # numpy scalars coming from DataFrame rows are not JSON serializable
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class BackgroundCommitter:
+    """
+    Write-behind queue between the handlers and the annotation store.
+
+    Handlers `put` what they have to store and return at once; a background thread passes
+    everything queued since its last call to `commit`, in order, so annotations submitted in
+    a burst are stored in one batch. A failing commit is retried with exponential backoff, up
+    to `max_retries` times (once when closing); a batch that still fails is appended to
+    `fallback_path` (one JSON line per item) so shutdown is never blocked by a broken store.
+    `flush` waits until everything queued is stored, and `close` runs when the process exits.
+    """
+
+    def __init__(self, commit, fallback_path=None, retry_delay=0.5, max_retry_delay=30.0, max_retries=8,
+                 close_timeout=60.0):
+        self.commit = commit
+        self.fallback_path = fallback_path
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_retries = max_retries
+        self.close_timeout = close_timeout
+        self._items = []
+        self._in_flight = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="committer")
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, item):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BackgroundCommitter is closed")
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def pending(self):
+        """
+        Number of items queued or being committed.
+        """
+        with self._cond:
+            return len(self._items) + self._in_flight
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items and not self._closed:
+                    self._cond.wait()
+                if not self._items:
+                    return
+                batch, self._items = self._items, []
+                self._in_flight = len(batch)
+            self._commit(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _commit(self, batch):
+        delay = self.retry_delay
+        retries = 0
+        while True:
+            try:
+                self.commit(batch)
+                return
+            except Exception as exc:
+                if retries >= self.max_retries or self._closed:
+                    self._give_up(batch, exc)
+                    return
+                print(f"Storing {len(batch)} annotations failed ({exc!r}), retrying in {delay:.1f} s")
+            with self._cond:
+                # closing cuts the wait short
+                self._cond.wait_for(lambda: self._closed, delay)
+            delay = min(delay * 2, self.max_retry_delay)
+            retries += 1
+
+    def _give_up(self, batch, exc):
+        """
+        Append a batch the store keeps refusing to the fallback file.
+        """
+        if self.fallback_path is None:
+            print(f"Storing {len(batch)} annotations failed ({exc!r}), they are lost")
+            return
+        try:
+            with open(self.fallback_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(item, default=_jsonable, ensure_ascii=False) + "\n" for item in batch)
+        except OSError as fallback_exc:
+            print(f"Storing {len(batch)} annotations failed ({exc!r}), and so did writing them to "
+                  f"{self.fallback_path} ({fallback_exc!r}): they are lost")
+            return
+        print(f"Storing {len(batch)} annotations failed ({exc!r}), they were saved to {self.fallback_path}")
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued item is committed. Returns False if `timeout` expired first.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._items and not self._in_flight, timeout)
+
+    def close(self, timeout=None):
+        """
+        Commit what is queued, trying each batch once more at most, and stop the thread.
+        Waits `close_timeout` seconds at most when `timeout` is not given.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(self.close_timeout if timeout is None else timeout)
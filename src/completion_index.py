@@ -0,0 +1,99 @@
+import os
+import threading
+
+from metrics import add_bytes
+
+
+class CompletionIndex:
+    """
+    Persistent "done" bitmap over the rows of a dataset.
+
+    The sidecar file holds one byte per row (row position in the source file), so marking a
+    row is a single one-byte write and finding the next unannotated row is a C-level scan
+    from a cursor instead of a pass over the annotations. Rows can be completed in any order.
+    """
+
+    def __init__(self, path, n_rows, done_positions=None):
+        """
+        Open the bitmap at `path`. When it does not exist or does not match `n_rows`, it is
+        rebuilt from `done_positions` (an iterable of row positions, or a callable returning one).
+        """
+        self.path = path
+        self.n_rows = n_rows
+        if os.path.exists(path) and os.path.getsize(path) == n_rows:
+            with open(path, "rb") as f:
+                self._bits = bytearray(f.read())
+        else:
+            self.rebuild(done_positions)
+        self._file = open(path, "r+b")
+        self._done = self._bits.count(1)
+        self._cursor = self._bits.find(0)
+        self._lock = threading.Lock()
+
+    def rebuild(self, done_positions):
+        if callable(done_positions):
+            done_positions = done_positions()
+        self._bits = bytearray(self.n_rows)
+        for pos in done_positions if done_positions is not None else ():
+            self._bits[pos] = 1
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self._bits)
+        os.replace(tmp_path, self.path)
+        if hasattr(self, "_file"):
+            self._file.close()
+            self._file = open(self.path, "r+b")
+            self._done = self._bits.count(1)
+            self._cursor = self._bits.find(0)
+
+    def mark(self, pos, done=True):
+        value = 1 if done else 0
+        with self._lock:
+            if self._bits[pos] == value:
+                return
+            self._bits[pos] = value
+            self._done += 1 if done else -1
+            self._file.seek(pos)
+            self._file.write(bytes((value,)))
+            self._file.flush()
+            add_bytes(written=1)
+            if done and pos == self._cursor:
+                self._cursor = self._bits.find(0, pos + 1)
+            elif not done and (self._cursor == -1 or pos < self._cursor):
+                self._cursor = pos
+
+    def is_done(self, pos):
+        return bool(self._bits[pos])
+
+    def next_pending(self, start=None):
+        """
+        First unannotated row at or after `start` (wrapping around), or the first one overall
+        when `start` is None. Returns None once every row is done.
+        """
+        if self._cursor == -1:
+            return None
+        if start is None or start <= self._cursor:
+            return self._cursor
+        pos = self._bits.find(0, start)
+        return self._cursor if pos == -1 else pos
+
+    def pending_after(self, start, n):
+        """
+        Up to `n` unannotated rows after `start`, in file order (without wrapping).
+        """
+        rows = []
+        pos = self._bits.find(0, start + 1)
+        while pos != -1 and len(rows) < n:
+            rows.append(pos)
+            pos = self._bits.find(0, pos + 1)
+        return rows
+
+    @property
+    def done_count(self):
+        return self._done
+
+    def __len__(self):
+        return self.n_rows
+
+    def close(self):
+        self._file.close()
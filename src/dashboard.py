@@ -0,0 +1,265 @@
+import glob
+import heapq
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+import fire
+import gradio as gr
+import pandas as pd
+
+# grades compared for the running agreement of the tool in main.py
+RATING_FIELDS = ("Rating_Neutral", "Rating_Formal", "Rating_Friendly")
+
+
+class RunningMedian:
+    """
+    Median of a growing list of numbers, kept in two heaps so each value costs O(log n).
+    """
+
+    def __init__(self):
+        self._low = []  # max-heap (negated) of the lower half
+        self._high = []  # min-heap of the upper half
+
+    def add(self, value):
+        if self._low and value > -self._low[0]:
+            heapq.heappush(self._high, value)
+        else:
+            heapq.heappush(self._low, -value)
+        if len(self._low) > len(self._high) + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+        elif len(self._high) > len(self._low):
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+
+    def value(self):
+        if not self._low:
+            return None
+        if len(self._low) > len(self._high):
+            return -self._low[0]
+        return (-self._low[0] + self._high[0]) / 2
+
+
+def _truthy(value):
+    return str(value).strip().lower() in ("true", "1", "1.0", "yes")
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value
+
+
+class ProgressStats:
+    """
+    Progress and agreement statistics updated one annotation at a time.
+
+    Every `add` costs O(log n) at most, so the dashboard reads counters instead of rescanning
+    the annotation files. Agreement is Fleiss-style kappa over the pairs of annotators who
+    rated the same cross-evaluation row: observed agreement is the share of agreeing pairs,
+    chance agreement comes from the overall share of each grade.
+    """
+
+    def __init__(self, total=None, remaining=None, fields=RATING_FIELDS, window=900):
+        """
+        `total` is the number of annotations the job needs, or `remaining` a callable giving
+        what is left when the caller tracks it better (e.g. a completion index). Throughput
+        and ETA are measured over the last `window` seconds.
+        """
+        self.total = total
+        self._remaining = remaining
+        self.fields = fields
+        self.window = window
+        self._lock = threading.Lock()
+        self.count = 0
+        self._per_annotator = defaultdict(lambda: {"count": 0, "last": None, "recent": deque(),
+                                                   "time": RunningMedian()})
+        self._recent = deque()
+        self._time = RunningMedian()
+        # cross-evaluation rows: grades given so far and agreeing / total annotator pairs
+        self._seen = set()
+        self._votes = {field: defaultdict(Counter) for field in fields}
+        self._pairs = Counter()
+        self._agreeing = Counter()
+        self._grades = {field: Counter() for field in fields}
+
+    def add(self, row, crossval=None):
+        """
+        Account for one stored annotation (a dict with at least `annotator`). Rows count for
+        agreement when `crossval` is true, by default when their `crossval` value is. Rows of a
+        `revision` above 1 edit an annotation already accounted for and are skipped.
+        """
+        if (_number(row.get("revision")) or 1) > 1:
+            # an edit of an annotation already counted
+            return
+        annotator = row.get("annotator") or ""
+        # rows without a timestamp (e.g. loaded at startup) do not count for throughput
+        timestamp = _number(row.get("timestamp"))
+        seconds = _number(row.get("annotation_time"))
+        if crossval is None:
+            crossval = _truthy(row.get("crossval"))
+        with self._lock:
+            self.count += 1
+            stats = self._per_annotator[annotator]
+            stats["count"] += 1
+            if timestamp is not None:
+                stats["last"] = max(stats["last"] or timestamp, timestamp)
+                stats["recent"].append(timestamp)
+                self._recent.append(timestamp)
+            if seconds is not None:
+                stats["time"].add(seconds)
+                self._time.add(seconds)
+            if crossval:
+                self._add_votes(row, annotator)
+
+    def _add_votes(self, row, annotator):
+        item = (str(row.get("row_id", "")), str(row.get("text", row.get("comment", ""))))
+        if (item, annotator) in self._seen:
+            # a resubmission of the same row by the same annotator is not a new judgement
+            return
+        self._seen.add((item, annotator))
+        for field in self.fields:
+            grade = row.get(field)
+            if grade is None or grade != grade or grade == "":
+                continue
+            votes = self._votes[field][item]
+            # the new grade forms a pair with every earlier grade of the row
+            self._pairs[field] += sum(votes.values())
+            self._agreeing[field] += votes[grade]
+            votes[grade] += 1
+            self._grades[field][grade] += 1
+
+    def _prune(self, now):
+        start = now - self.window
+        while self._recent and self._recent[0] < start:
+            self._recent.popleft()
+        for stats in self._per_annotator.values():
+            while stats["recent"] and stats["recent"][0] < start:
+                stats["recent"].popleft()
+
+    def remaining(self):
+        if self._remaining is not None:
+            return self._remaining()
+        if self.total is None:
+            return None
+        return max(self.total - self.count, 0)
+
+    def agreement(self):
+        """
+        Running kappa of every field with at least one pair of annotators.
+        """
+        kappas = {}
+        for field in self.fields:
+            if not self._pairs[field]:
+                continue
+            observed = self._agreeing[field] / self._pairs[field]
+            grades = sum(self._grades[field].values())
+            expected = sum((n / grades) ** 2 for n in self._grades[field].values())
+            kappas[field] = (observed - expected) / (1 - expected) if expected < 1 else float("nan")
+        return kappas
+
+    def summary(self):
+        """
+        Markdown overview of the job and a table with one line per annotator.
+        """
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            per_hour = len(self._recent) * 3600 / self.window
+            remaining = self.remaining()
+            median = self._time.value()
+            lines = [f"**{self.count}** annotations stored, **{per_hour:.0f}**/hour over the last {self.window // 60} minutes"]
+            if remaining is not None:
+                eta = f"{remaining / per_hour:.1f} hours" if per_hour else "unknown"
+                lines.append(f"**{remaining}** annotations left, ETA {eta}")
+            if median is not None:
+                lines.append(f"Median annotation time: **{median:.1f}** s")
+            for field, kappa in self.agreement().items():
+                lines.append(f"Agreement on {field}: kappa **{kappa:.3f}** ({self._pairs[field]} pairs)")
+            annotators = pd.DataFrame([
+                {
+                    "annotator": annotator,
+                    "annotations": stats["count"],
+                    "per_hour": round(len(stats["recent"]) * 3600 / self.window, 1),
+                    "median_time_s": stats["time"].value(),
+                    "last_seen_min_ago": round((now - stats["last"]) / 60, 1) if stats["last"] else None,
+                }
+                for annotator, stats in sorted(self._per_annotator.items())
+            ], columns=["annotator", "annotations", "per_hour", "median_time_s", "last_seen_min_ago"])
+        return "  \n".join(lines), annotators
+
+
+class JournalTail:
+    """
+    Reads the records appended to an annotation journal since the last call, remembering the
+    byte offset so each refresh only reads what is new.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def read_new(self):
+        if not os.path.exists(self.path):
+            return []
+        if os.path.getsize(self.path) < self.offset:
+            # truncated or replaced: start over
+            self.offset = 0
+        records = []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # record still being written, read it on the next call
+                    break
+                self.offset += len(line)
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+
+def add_dashboard(summary, refresh=5):
+    """
+    Add the dashboard components to the Blocks being built; `summary` (e.g.
+    `ProgressStats.summary`) fills them every `refresh` seconds.
+    """
+    overview = gr.Markdown("")
+    table = gr.Dataframe(interactive=False)
+    gr.Timer(refresh).tick(summary, outputs=[overview, table])
+    return [overview, table]
+
+
+def main(annotations_folder: str = "annotations", total: int = None, refresh: int = 5,
+         server_name: str = None, server_port: int = None):
+    """
+    Serve a live dashboard of every `*.journal` in `annotations_folder`, written by main.py or
+    server.py. Journals are tailed, so each refresh only reads the annotations added since the
+    last one. `total` is the number of annotations the job needs, for the remaining count and ETA.
+    """
+    stats = ProgressStats(total)
+    tails = {}
+    lock = threading.Lock()
+
+    def refresh_stats():
+        with lock:
+            for path in glob.glob(os.path.join(annotations_folder, "*.journal")):
+                tail = tails.setdefault(path, JournalTail(path))
+                for record in tail.read_new():
+                    stats.add(record)
+        return stats.summary()
+
+    with gr.Blocks(theme=gr.themes.Soft()) as demo:
+        gr.Markdown(f"#### Annotation progress: {os.path.abspath(annotations_folder)}\n")
+        dashboard = add_dashboard(refresh_stats, refresh)
+        demo.load(refresh_stats, outputs=dashboard)
+
+    demo.launch(server_name=server_name, server_port=server_port)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,215 @@
+import os
+import time
+
+import fire
+import gradio as gr
+
+from annotation_job import AnnotationWriter, annotations_path, launch, lease_next, open_completion, stored_rows
+from annotation_store import open_store
+from columnar import LazyTable, is_columnar, read_table
+from dashboard import ProgressStats, add_dashboard
+from keyboard import HOTKEYS_CSS, hotkeys_js
+from metrics import instrument, phase
+from ordering import make_order, stratum_codes
+from scheduler import LeaseScheduler
+from session import AnnotationSession
+from task import load_task
+
+CSS = """
+body, input, textarea, button {
+    font-family: Arial, sans-serif;
+}
+"""
+
+# runs in the browser: the Validate button is enabled once every required field has a value
+ENABLE_BUTTON_JS = """
+(...values) => ({__type__: "update", interactive: values.every((value) =>
+    value !== null && value !== undefined && value !== "" && !(Array.isArray(value) && !value.length))})
+"""
+
+
+def load_dataset(path, task):
+    """
+    Read the rows to annotate, with the `defaults` of the task filled in and a `row_id`
+    column. Parquet and Arrow files are opened lazily, only the rows shown are read.
+    """
+    if is_columnar(path):
+        return LazyTable(path, defaults=task.defaults)
+    df = read_table(path)
+    for column, default in task.defaults.items():
+        df[column] = df[column].fillna(default) if column in df.columns else default
+    if "row_id" not in df.columns:
+        df["row_id"] = range(len(df))
+    return df
+
+
+def empty_value(item):
+    """
+    Value of a cleared input.
+    """
+    return {"multi_choice": [], "text": ""}.get(item["type"])
+
+
+def build_form(task):
+    """
+    Components of the task form laid out in its columns: the textboxes of the shown items
+    (in the order of `task.display`) and the inputs of the fields (in the order of
+    `task.fields`).
+    """
+    components = {}
+    with gr.Row():
+        for column in sorted({item.get("column", 1) for item in task.items}):
+            with gr.Column():
+                for n, item in enumerate(task.items):
+                    if item.get("column", 1) != column:
+                        continue
+                    if "markdown" in item:
+                        gr.Markdown(item["markdown"])
+                    elif "field" not in item:
+                        components[n] = gr.Textbox(label=item.get("label", item.get("show", "")),
+                                                   lines=item.get("lines", 1), interactive=False)
+                    else:
+                        elem_id = f"field_{task.fields.index(item)}"
+                        if item["type"] in ("choice", "pair_choice"):
+                            components[n] = gr.Radio(item["choices"], label=item["label"], value=None, elem_id=elem_id)
+                        elif item["type"] == "multi_choice":
+                            components[n] = gr.CheckboxGroup(choices=item["choices"], label=item["label"], elem_id=elem_id)
+                        else:
+                            components[n] = gr.Textbox(label=item["label"], lines=item.get("lines", 1),
+                                                       interactive=True, elem_id=elem_id)
+    shown = [components[n] for n, item in enumerate(task.items) if n in components and "field" not in item]
+    inputs = [components[n] for n, item in enumerate(task.items) if "field" in item]
+    return shown, inputs
+
+
+def main(task: str = "", dataset: str = "", annotator: str = "", store: str = "journal", order: str = "file",
+         stratify_by: str = None, prefetch: int = 5, keyboard: bool = False, refresh: int = 5,
+         metrics_port: int = None, trace: str = None, server_name: str = None, server_port: int = None):
+    """
+    Annotate `dataset` for the task declared in the `task` config (see tasks/).
+
+    Annotations are written to `annotations/annotations_<dataset name>` with the `store`
+    backend, and annotating resumes at the first row without one. Rows are shown in file
+    `order`, or "stratified" / "adaptive" over the `stratify_by` columns (default: those of
+    the task). Everything is given on the command line, nothing is asked interactively.
+
+    Tasks are shown one example at a time; the page view, Back/Forward editing and in-place
+    output of src/main.py and DetoxAnnotatorV2 stay in those tools.
+    """
+    assert task, "Task config MISSING. Pass it with --task, e.g. --task=tasks/detox_tones.yaml"
+    assert dataset, "Dataset MISSING. Pass it with --dataset"
+    assert annotator, "Annotator name MISSING. Pass it with --annotator"
+
+    task = load_task(task)
+    table = load_dataset(dataset, task)
+    dataset_name = os.path.basename(dataset)
+
+    columns = [column for column in table.columns if column not in task.output_columns] + task.output_columns
+    anns_store = open_store(store, annotations_path(dataset_name), columns)
+    completion = open_completion(anns_store, table)
+
+    pending = [pos for pos in range(len(table)) if not completion.is_done(pos)]
+    if order != "file":
+        if stratify_by is None:
+            stratify_by = task.stratify_by
+        stratify_by = [stratify_by] if isinstance(stratify_by, str) else list(stratify_by)
+        pending = make_order(order, pending, stratum_codes(table, stratify_by), task.outcome,
+                             observed=stored_rows(anns_store, table))
+    # rows still to annotate are leased to the open tabs, so two tabs never show the same example
+    scheduler = LeaseScheduler([0 if completion.is_done(pos) else 1 for pos in range(len(table))],
+                               lease_timeout=3600, order=pending)
+    print(f"Task {task.name}: {len(table)} rows, {scheduler.remaining()} left to annotate")
+
+    # agreement on the required ratings (both columns of the pair ratings)
+    graded = [item["field"] for item in task.required if item["type"] == "choice"]
+    graded = [column for field in graded for column in (field if isinstance(field, list) else [field])]
+    stats = ProgressStats(remaining=lambda: len(table) - completion.done_count, fields=tuple(dict.fromkeys(graded)))
+    for row in anns_store.rows():
+        stats.add(row)
+
+    # keyboard mode: annotations are stored by a background thread
+    writer = AnnotationWriter(anns_store, completion, write_behind=keyboard)
+
+    def prepare_example(pos):
+        with phase("build"):
+            row = table.iloc[pos]
+            swapped = task.swapped(row)
+            return swapped, task.display(row, swapped)
+
+    def next_example(session):
+        """
+        Lease the next row for the session and prepare the following ones in the background.
+        """
+        index = lease_next(session, scheduler, prepare_example, prefetch)
+        swapped, shown = session.buffer.get(index) if index is not None else (None, None)
+        session.start(index, swapped=swapped)
+        return shown
+
+    def status(session):
+        if session.index is None:
+            return "End of dataset"
+        return f"{writer.annotated_count()} of {len(table)} examples annotated"
+
+    @instrument
+    def start_session(session):
+        shown = next_example(session)
+        return [session, status(session)] + (shown or ["End of dataset"] * len(shown_components))
+
+    @instrument
+    def submit(session, *values):
+        # The button is only enabled with the required fields filled, but API calls skip that check
+        if session.index is None or task.missing(values):
+            return [session, gr.update(interactive=not task.required), status(session)] + \
+                [gr.update()] * len(shown_components) + list(values)
+
+        with phase("build"):
+            row = table.iloc[session.index].to_dict()
+            row.update(task.answers(values, session.swapped))
+            if task.blind_pair:
+                row[task.swap_column] = session.swapped
+            row["timestamp"] = time.time()
+            row["annotator"] = annotator
+            row["annotation_time"] = session.elapsed()
+        writer.save([(session.index, row)])
+        stats.add(row)
+        scheduler.complete(session.id, session.index, row)
+
+        shown = next_example(session)
+        if shown is None:
+            writer.export_csv()
+            shown = ["End of dataset"] * len(shown_components)
+        return [session, gr.update(interactive=not task.required), status(session)] + shown + \
+            [empty_value(item) for item in task.fields]
+
+    hotkeys = hotkeys_js(task.hotkeys(), {"Enter": "validate"}) if keyboard else None
+
+    with gr.Blocks(theme=gr.themes.Soft(), css=CSS + HOTKEYS_CSS, js=hotkeys, title=task.title) as demo:
+        session = gr.State(AnnotationSession(annotator))
+        gr.Markdown(f"## {task.title}\n#### Annotating: {dataset_name} as {annotator}")
+
+        with gr.Tab("Annotate"):
+            progress = gr.Markdown("")
+            shown_components, inputs = build_form(task)
+            eval_btn = gr.Button("Validate", interactive=not task.required, elem_id="validate")
+
+        with gr.Tab("Dashboard"):
+            add_dashboard(stats.summary, refresh)
+
+        # enable the Validate button in the browser once every required field is filled
+        required = [component for component, item in zip(inputs, task.fields) if item.get("required")]
+        for component in required:
+            component.change(None, inputs=required, outputs=eval_btn, js=ENABLE_BUTTON_JS,
+                             queue=False, show_progress="hidden")
+
+        eval_btn.click(submit, inputs=[session] + inputs,
+                       outputs=[session, eval_btn, progress] + shown_components + inputs)
+        demo.load(start_session, inputs=session, outputs=[session, progress] + shown_components)
+
+        # handlers of different sessions may run in parallel
+        demo.queue(default_concurrency_limit=None)
+
+    launch(demo, metrics_port, trace, server_name=server_name, server_port=server_port)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
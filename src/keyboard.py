@@ -0,0 +1,72 @@
+import json
+
+# outline of the field the next hotkey fills
+HOTKEYS_CSS = """
+.hotkey-cursor {
+    outline: 2px solid var(--color-accent);
+    outline-offset: 2px;
+}
+"""
+
+_HOTKEYS_JS = """
+() => {
+    const config = CONFIG;
+    let cursor = 0;
+
+    const element = (id) => document.getElementById(id);
+    const choose = (id, choice) => {
+        const label = [...(element(id)?.querySelectorAll("label") || [])]
+            .find((label) => label.textContent.trim() === choice);
+        label?.querySelector("input")?.click();
+    };
+    const press = (id) => {
+        let button = element(id);
+        if (button && button.tagName !== "BUTTON") button = button.querySelector("button");
+        if (button && !button.disabled) button.click();
+    };
+    const show = () => {
+        config.fields.forEach((field, i) => element(field.id)?.classList.toggle("hotkey-cursor", i === cursor));
+    };
+
+    document.addEventListener("keydown", (event) => {
+        const target = event.target;
+        const typing = target.tagName === "TEXTAREA" || (target.tagName === "INPUT" && target.type === "text");
+        if (typing || event.ctrlKey || event.metaKey || event.altKey) return;
+        const key = event.key.length === 1 ? event.key.toLowerCase() : event.key;
+
+        if (key in config.buttons) {
+            press(config.buttons[key]);
+            cursor = 0;
+        } else if (key === "Backspace") {
+            cursor = Math.max(0, cursor - 1);
+        } else {
+            // the first field from the cursor on that has a choice for this key
+            const i = config.fields.findIndex((field, i) => i >= cursor && key in field.keys);
+            if (i === -1) return;
+            choose(config.fields[i].id, config.fields[i].keys[key]);
+            cursor = Math.min(i + 1, config.fields.length - 1);
+        }
+        event.preventDefault();
+        show();
+    });
+    show();
+}
+"""
+
+
+def hotkeys_js(fields, buttons):
+    """
+    Script installing the hotkeys of the keyboard mode, run by the browser when the page loads.
+
+    `fields` lists (elem_id, {key: choice}) for the radios, filled in that order: a key picks
+    its choice in the first field from the cursor that accepts it and moves the cursor past
+    it, Backspace moves the cursor back. `buttons` maps keys (e.g. "Enter", "ArrowLeft") to
+    the elem_id of the button they click, which also moves the cursor back to the first field.
+    Keys typed in text boxes are left alone.
+    """
+    config = {
+        "fields": [{"id": elem_id, "keys": {key.lower(): choice for key, choice in keys.items()}}
+                   for elem_id, keys in fields],
+        "buttons": {(key.lower() if len(key) == 1 else key): elem_id for key, elem_id in buttons.items()},
+    }
+    return _HOTKEYS_JS.replace("CONFIG", json.dumps(config))
@@ -1,155 +1,35 @@
+import itertools
 import os
+import re
 import time
 import gradio as gr
 import pandas as pd
 import fire
 
-def get_start_index(anns_filepath, start_index):
-    anns_df = pd.read_csv(anns_filepath)
-    return max([start_index] + anns_df.index.tolist()) + 1
-
-def main(current_index: int = 0, annotator_name: str = "", examples_batch_folder: str = ''):
-    css = """
-    body, input, textarea, button { 
-        font-family: Arial, sans-serif; 
-    }
-    """
-
-    assert annotator_name, "Annotator name MISSING. Set it when you launch the script"
-    assert examples_batch_folder, "Examples' batch MISSING. Set it when you launch the script"
-
-    _, dataset_filename = os.path.split(examples_batch_folder)
-    chunk_df = pd.read_csv(examples_batch_folder)
-    
-    # Ensure 'Neutral', 'Formal', 'Friendly' columns exist and fill NaN with '[empty]'
-    for col in ['Neutral', 'Formal', 'Friendly']:
-        if col not in chunk_df.columns:
-            chunk_df[col] = '[empty]'
-        else:
-            chunk_df[col] = chunk_df[col].fillna('[empty]')
-
-    annotations_folder = os.path.join(os.getcwd(), "annotations")
-    anns_filepath = os.path.join(annotations_folder, f"annotations_{dataset_filename}")
-
-    if os.path.exists(anns_filepath):
-        current_index = get_start_index(anns_filepath, current_index)
-    else:
-        os.makedirs(annotations_folder, exist_ok=True)
-
-    print(f"Resume annotations process from {current_index}")
-    df_row = chunk_df.iloc[current_index]
-
-    # Function to store annotations and get the next data entry
-    def store_annotation_and_get_next(curr_idx, selected_classes, comments, selected_tone,
-                                      rating_neutral, suggested_transformation_neutral,
-                                      rating_formal, suggested_transformation_formal,
-                                      rating_friendly, suggested_transformation_friendly):
-        # Check if any rating is missing
-        if any(rating is None or rating == '' for rating in [rating_neutral, rating_formal, rating_friendly]):
-            # Optionally, display a warning message
-            # gr.warning("Please select ratings for all transformed texts.")
-            return [curr_idx, gr.update(interactive=False), df_row['text'], 
-                    df_row['Neutral'], df_row['Formal'], df_row['Friendly'], df_row.get('Class', ''), 
-                    selected_classes, comments, selected_tone,
-                    rating_neutral, suggested_transformation_neutral,
-                    rating_formal, suggested_transformation_formal,
-                    rating_friendly, suggested_transformation_friendly]
-
-        # Process suggested classes
-        if not selected_classes:
-            suggested_class = "[Correct Classification]"
-        else:
-            suggested_class = ''.join(f"[{cls}]" for cls in selected_classes)
-
-        if not comments:
-            comments = "No Comments"    
-        
-        # Handle suggested transformations
-        if not suggested_transformation_neutral:
-            suggested_transformation_neutral = "No Suggestion"
-        if not suggested_transformation_formal:
-            suggested_transformation_formal = "No Suggestion"
-        if not suggested_transformation_friendly:
-            suggested_transformation_friendly = "No Suggestion"
-
-        if os.path.exists(anns_filepath):
-            anns_df = pd.read_csv(anns_filepath)
-        else:
-            cols = chunk_df.columns.tolist()
-            additional_cols = ["timestamp", "annotator", "suggested_class", "tone_of_text", "comments",
-                               "Rating_Neutral", "Suggested_Transformation_Neutral",
-                               "Rating_Formal", "Suggested_Transformation_Formal",
-                               "Rating_Friendly", "Suggested_Transformation_Friendly"]
-            cols.extend(additional_cols)
-            anns_df = pd.DataFrame(columns=cols)
-
-        row = chunk_df.iloc[curr_idx].to_dict()
-        row["timestamp"] = time.time()
-        row["annotator"] = annotator_name
-        row["suggested_class"] = suggested_class
-        row["tone_of_text"] = selected_tone
-        row["comments"] = comments 
-        row["Rating_Neutral"] = rating_neutral
-        row["Suggested_Transformation_Neutral"] = suggested_transformation_neutral
-        row["Rating_Formal"] = rating_formal
-        row["Suggested_Transformation_Formal"] = suggested_transformation_formal
-        row["Rating_Friendly"] = rating_friendly
-        row["Suggested_Transformation_Friendly"] = suggested_transformation_friendly
-
-        anns_df = pd.concat((anns_df, pd.DataFrame(row, index=[0])), ignore_index=True)
-        anns_df.to_csv(anns_filepath, index=False)
-
-        next_idx = curr_idx + 1
-        if next_idx < len(chunk_df):
-            next_df_row = chunk_df.iloc[next_idx]
-            return [next_idx, gr.update(interactive=False), next_df_row['text'], 
-                    next_df_row['Neutral'], next_df_row['Formal'], next_df_row['Friendly'], next_df_row.get('Class', ''), 
-                    [], '', None,
-                    None, '', None, '', None, '']
-        else:
-            return [curr_idx, gr.update(interactive=False), "End of dataset", 
-                    "End of dataset", "End of dataset", "End of dataset", "End of dataset", 
-                    [], "End of dataset", None,
-                    None, "End of dataset", None, "End of dataset", None, "End of dataset"]
-
-    # Function to enable or disable the Validate button based on ratings
-    def enable_button(rating_neutral_value, rating_formal_value, rating_friendly_value):
-        if all([rating_neutral_value, rating_formal_value, rating_friendly_value]):
-            return gr.update(interactive=True)
-        else:
-            return gr.update(interactive=False)
-
-    with gr.Blocks(theme=gr.themes.Soft(), css=css) as demo:
-        index = gr.Number(value=current_index, visible=False, precision=0)
-
-        gr.Markdown(f"#### Annotating: {dataset_filename}\n")
-        with gr.Row():
-            with gr.Column():
-                # Display the original text and class
-                text = gr.Textbox(label="Text", interactive=False, value=df_row['text'])
-                Class = gr.Textbox(label="Class", interactive=False, value=df_row.get('Class', ''))
-
-                # Suggested class and comments
-                suggested_class = gr.CheckboxGroup(
-                    choices=[
-                        "Insult",
-                        "Threat",
-                        "Obscene",
-                        "Identity_attack",
-                        "Sexual_explicit",
-                        "Not Toxic"
-                    ], 
-                    label="Suggested Class"
-                )
-                comments = gr.Textbox(label="Comments")
-                tone_selection = gr.Radio(
-                    ['Neutral', 'Friendly', 'Formal'], 
-                    label='Tone of the Text'
-                )
-
-                # Validate button (will be enabled based on ratings)
-                eval_btn = gr.Button("Validate", interactive=False)
-                markdown_content = """
+from annotation_job import AnnotationWriter, annotations_path, launch, lease_next, open_completion, stored_rows
+from annotation_store import open_store
+from columnar import EXAMPLE_DEFAULTS, LazyTable, is_columnar
+from metrics import instrument, phase
+from keyboard import HOTKEYS_CSS, hotkeys_js
+from ordering import make_order, stratum_codes
+from scheduler import LeaseScheduler
+from session import AnnotationSession
+
+ANNOTATION_COLUMNS = ["timestamp", "annotator", "suggested_class", "tone_of_text", "comments",
+                      "Rating_Neutral", "Suggested_Transformation_Neutral",
+                      "Rating_Formal", "Suggested_Transformation_Formal",
+                      "Rating_Friendly", "Suggested_Transformation_Friendly", "annotation_time"]
+
+CSS = """
+body, input, textarea, button { 
+    font-family: Arial, sans-serif; 
+}
+"""
+
+CLASS_CHOICES = ["Insult", "Threat", "Obscene", "Identity_attack", "Sexual_explicit", "Not Toxic"]
+RATING_CHOICES = ["A", "B", "F", "SKIPPING"]
+
+CLASS_DEFINITIONS = """
 ### **Class Definitions and Descriptions**
 
 #### **1. Obscene**
@@ -179,34 +59,9 @@ def main(current_index: int = 0, annotator_name: str = "", examples_batch_folder
 #### **5. Sexual Explicit**
 - **Definition**: Content that is overtly sexual in nature or depicts sexual acts in an explicit manner.
 - **Description**: Sexual explicit material includes graphic or suggestive descriptions of sexual acts, imagery, or innuendo. This class covers anything from crude sexual remarks to explicit depictions that are inappropriate in many contexts.
-"""         
+"""
 
-                gr.Markdown(markdown_content)
-
-
-            with gr.Column():
-                # Transformed texts and their ratings
-                transformed_neutral = gr.Textbox(value=df_row['Neutral'], label="Transformed Neutral", interactive=False)
-                rating_neutral = gr.Radio(
-                    ["A", "B", "F", "SKIPPING"], 
-                    label="Rating Neutral"
-                )
-                suggested_transformation_neutral = gr.Textbox(label="Suggested Transformation Neutral", interactive=True)
-
-                transformed_formal = gr.Textbox(value=df_row['Formal'], label="Transformed Formal", interactive=False)
-                rating_formal = gr.Radio(
-                    ["A", "B", "F", "SKIPPING"], 
-                    label="Rating Formal"
-                )
-                suggested_transformation_formal = gr.Textbox(label="Suggested Transformation Formal", interactive=True)
-
-                transformed_friendly = gr.Textbox(value=df_row['Friendly'], label="Transformed Friendly", interactive=False)
-                rating_friendly = gr.Radio(
-                    ["A", "B", "F", "SKIPPING"], 
-                    label="Rating Friendly"
-                )
-                suggested_transformation_friendly = gr.Textbox(label="Suggested Transformation Friendly", interactive=True)
-                markdown_content_v2 = """
+RATING_DEFINITIONS = """
 ### **Ratings Definitions**
 
 #### **Rating-A**: *Gold Standard*  
@@ -226,51 +81,511 @@ def main(current_index: int = 0, annotator_name: str = "", examples_batch_folder
 
 #### **SKIPPING**  
 - Skip this entry if you cannot provide a rating.
-"""             
-               
-                gr.Markdown(markdown_content_v2)
-
-                # Function to update the Validate button based on ratings
-                def update_validate_button(rating_neutral_value, rating_formal_value, rating_friendly_value):
-                    return enable_button(rating_neutral_value, rating_formal_value, rating_friendly_value)
-
-                # Attach change events to ratings
-                rating_neutral.change(
-                    update_validate_button,
-                    inputs=[rating_neutral, rating_formal, rating_friendly],
-                    outputs=eval_btn
-                )
-                rating_formal.change(
-                    update_validate_button,
-                    inputs=[rating_neutral, rating_formal, rating_friendly],
-                    outputs=eval_btn
-                )
-                rating_friendly.change(
-                    update_validate_button,
-                    inputs=[rating_neutral, rating_formal, rating_friendly],
-                    outputs=eval_btn
-                )
+"""
 
-            # Click event for the Validate button
-            eval_btn.click(
-                store_annotation_and_get_next,
-                inputs=[
-                    index, suggested_class, comments, tone_selection,
+
+def load_examples(path):
+    """
+    Read a batch of examples and normalize the columns the interface relies on. Parquet and
+    Arrow batches are opened lazily, only the rows shown are read.
+    """
+    if is_columnar(path):
+        return LazyTable(path, defaults=EXAMPLE_DEFAULTS)
+    return prepare_examples(pd.read_csv(path))
+
+
+def prepare_examples(chunk_df):
+    # Ensure 'Neutral', 'Formal', 'Friendly' columns exist and fill NaN with '[empty]'
+    for col in ['Neutral', 'Formal', 'Friendly']:
+        if col not in chunk_df.columns:
+            chunk_df[col] = '[empty]'
+        else:
+            chunk_df[col] = chunk_df[col].fillna('[empty]')
+    # stable id of each source row, written along with its annotation
+    if "row_id" not in chunk_df.columns:
+        chunk_df["row_id"] = range(len(chunk_df))
+    return chunk_df
+
+
+def make_annotation(df_row, annotator_name, selected_classes, comments, selected_tone,
                     rating_neutral, suggested_transformation_neutral,
                     rating_formal, suggested_transformation_formal,
-                    rating_friendly, suggested_transformation_friendly
-                ],
-                outputs=[
-                    index, eval_btn, text,
-                    transformed_neutral, transformed_formal, transformed_friendly, 
+                    rating_friendly, suggested_transformation_friendly):
+    """
+    Build the stored annotation for `df_row` from the values of the form.
+    """
+    # Process suggested classes
+    if not selected_classes:
+        suggested_class = "[Correct Classification]"
+    else:
+        suggested_class = ''.join(f"[{cls}]" for cls in selected_classes)
+
+    if not comments:
+        comments = "No Comments"    
+    
+    # Handle suggested transformations
+    if not suggested_transformation_neutral:
+        suggested_transformation_neutral = "No Suggestion"
+    if not suggested_transformation_formal:
+        suggested_transformation_formal = "No Suggestion"
+    if not suggested_transformation_friendly:
+        suggested_transformation_friendly = "No Suggestion"
+
+    row = df_row.to_dict()
+    row["timestamp"] = time.time()
+    row["annotator"] = annotator_name
+    row["suggested_class"] = suggested_class
+    row["tone_of_text"] = selected_tone
+    row["comments"] = comments 
+    row["Rating_Neutral"] = rating_neutral
+    row["Suggested_Transformation_Neutral"] = suggested_transformation_neutral
+    row["Rating_Formal"] = rating_formal
+    row["Suggested_Transformation_Formal"] = suggested_transformation_formal
+    row["Rating_Friendly"] = rating_friendly
+    row["Suggested_Transformation_Friendly"] = suggested_transformation_friendly
+    return row
+
+
+def form_values(annotation):
+    """
+    Values of the form (in the order make_annotation takes them) that give `annotation`, to
+    show a stored answer again.
+    """
+    def given(value, default):
+        return "" if value is None or value != value or value == default else value
+
+    classes = given(annotation.get("suggested_class"), "[Correct Classification]")
+    values = [re.findall(r"\[([^\]]*)\]", classes), given(annotation.get("comments"), "No Comments"),
+              annotation.get("tone_of_text") or None]
+    for tone in ("Neutral", "Formal", "Friendly"):
+        values += [annotation.get(f"Rating_{tone}") or None,
+                   given(annotation.get(f"Suggested_Transformation_{tone}"), "No Suggestion")]
+    return values
+
+
+def ratings_missing(*ratings):
+    return any(rating is None or rating == '' for rating in ratings)
+
+
+def transformations_passed(annotation):
+    """
+    Share of the rated transformations of an annotation rated A or B, None when all three
+    were skipped. Scores the annotations for the adaptive order.
+    """
+    ratings = [annotation.get(f"Rating_{tone}") for tone in ("Neutral", "Formal", "Friendly")]
+    rated = [rating for rating in ratings if rating in ("A", "B", "F")]
+    if not rated:
+        return None
+    return sum(rating != "F" for rating in rated) / len(rated)
+
+
+# runs in the browser: the Validate button is enabled once the three ratings are chosen,
+# so picking a rating never waits for a server round-trip behind the queue
+ENABLE_BUTTON_JS = """
+(rating_neutral, rating_formal, rating_friendly) =>
+    ({__type__: "update", interactive: Boolean(rating_neutral && rating_formal && rating_friendly)})
+"""
+
+
+def gate_button(button, ratings):
+    """
+    Enable `button` only when every rating radio has a value, client-side.
+    """
+    for rating in ratings:
+        rating.change(None, inputs=ratings, outputs=button, js=ENABLE_BUTTON_JS,
+                      queue=False, show_progress="hidden")
+
+
+# same check for every example of a page: (text, three ratings) per slot, empty slots are skipped
+ENABLE_PAGE_BUTTON_JS = """
+(...values) => {
+    let shown = 0;
+    for (let i = 0; i < values.length; i += 4) {
+        if (!values[i]) continue;
+        if (!(values[i + 1] && values[i + 2] && values[i + 3])) return {__type__: "update", interactive: false};
+        shown += 1;
+    }
+    return {__type__: "update", interactive: shown > 0};
+}
+"""
+
+# form of an example in the order make_annotation takes it, once cleared
+EMPTY_FORM = [[], '', None, None, '', None, '', None, '']
+
+
+def build_page_view(page_size):
+    """
+    Components of the batched view: one group per example of the page, with the texts shown
+    (text, neutral, formal, friendly, class) and the form (in the order make_annotation takes
+    it). Returns a list of (group, texts, form).
+    """
+    slots = []
+    for slot in range(page_size):
+        with gr.Group(visible=False) as group:
+            with gr.Row():
+                with gr.Column(scale=2):
+                    text = gr.Textbox(label=f"Text {slot + 1}", interactive=False)
+                    Class = gr.Textbox(label="Class", interactive=False)
+                transformed, ratings = [], []
+                for tone in ("Neutral", "Formal", "Friendly"):
+                    with gr.Column(scale=1):
+                        transformed.append(gr.Textbox(label=f"Transformed {tone}", interactive=False))
+                        ratings.append(gr.Radio(RATING_CHOICES, label=f"Rating {tone}"))
+            with gr.Accordion("Suggestions and comments", open=False):
+                with gr.Row():
+                    suggested_class = gr.CheckboxGroup(choices=CLASS_CHOICES, label="Suggested Class")
+                    tone_selection = gr.Radio(['Neutral', 'Friendly', 'Formal'], label='Tone of the Text')
+                    comments = gr.Textbox(label="Comments")
+                with gr.Row():
+                    suggestions = [gr.Textbox(label=f"Suggested Transformation {tone}", interactive=True)
+                                   for tone in ("Neutral", "Formal", "Friendly")]
+        form = [suggested_class, comments, tone_selection]
+        for rating, suggestion in zip(ratings, suggestions):
+            form += [rating, suggestion]
+        slots.append((group, [text] + transformed + [Class], form))
+    return slots
+
+
+def gate_page_button(button, slots):
+    """
+    Enable `button` only when every example shown on the page is rated, client-side.
+    """
+    inputs = []
+    for _, texts, form in slots:
+        inputs += [texts[0]] + form[3::2]
+    for _, _, form in slots:
+        for rating in form[3::2]:
+            rating.change(None, inputs=inputs, outputs=button, js=ENABLE_PAGE_BUTTON_JS,
+                          queue=False, show_progress="hidden")
+
+
+def main(current_index: int = 0, annotator_name: str = "", examples_batch_folder: str = '', store: str = "journal",
+         prefetch: int = 5, page_size: int = 1, keyboard: bool = False, order: str = "file",
+         stratify_by: str = "Class", metrics_port: int = None, trace: str = None):
+    assert annotator_name, "Annotator name MISSING. Set it when you launch the script"
+    assert examples_batch_folder, "Examples' batch MISSING. Set it when you launch the script"
+
+    _, dataset_filename = os.path.split(examples_batch_folder)
+    chunk_df = load_examples(examples_batch_folder)
+
+    anns_filepath = annotations_path(dataset_filename)
+    anns_store = open_store(store, anns_filepath, chunk_df.columns.tolist() + ANNOTATION_COLUMNS)
+
+    # latest revision of each annotated row, read once here so going back never reads the store
+    revisions = anns_store.revisions
+    # which rows are done (annotations written before row ids were recorded are matched on
+    # their text), so resuming does not depend on the number of annotations
+    completion = open_completion(anns_store, chunk_df, text_column="text")
+
+    next_pending = completion.next_pending(current_index)
+    current_index = len(chunk_df) - 1 if next_pending is None else next_pending
+    print(f"Resume annotations process from {current_index}")
+
+    # rows still to annotate, from the resume point on, in the order of the chosen strategy
+    pending = [pos for pos in itertools.chain(range(current_index, len(chunk_df)), range(current_index))
+               if not completion.is_done(pos)]
+    if order != "file":
+        stratify_by = [stratify_by] if isinstance(stratify_by, str) else list(stratify_by)
+        pending = make_order(order, pending, stratum_codes(chunk_df, stratify_by), transformations_passed,
+                             observed=stored_rows(anns_store, chunk_df, text_column="text"))
+    # rows still to annotate are leased to the open tabs, so two tabs never show the same example
+    scheduler = LeaseScheduler([0 if completion.is_done(pos) else 1 for pos in range(len(chunk_df))],
+                               lease_timeout=3600, order=pending)
+
+    # keyboard mode: annotations are stored by a background thread, so moving to the next
+    # example never waits on the disk
+    writer = AnnotationWriter(anns_store, completion, write_behind=keyboard)
+
+    def prepare_example(pos):
+        with phase("build"):
+            df_row = chunk_df.iloc[pos]
+            return [df_row['text'], df_row['Neutral'], df_row['Formal'], df_row['Friendly'], df_row.get('Class', '')]
+
+    def next_example(session):
+        session.start(lease_next(session, scheduler, prepare_example, prefetch))
+
+    def example_outputs(session):
+        if session.index is None:
+            return ["End of dataset"] * 5
+        return list(session.buffer.get(session.index))
+
+    def previous_answer(session):
+        """
+        Latest stored annotation of the row the Back button shows again.
+        """
+        pos = session.history[session.revisit]
+        return revisions.latest(chunk_df.iloc[pos]["row_id"], session.annotator)
+
+    def revisit_outputs(session):
+        """
+        Validate button, status, texts and form of the row shown: a row annotated before
+        with its latest answer, or the new row with a cleared form.
+        """
+        if session.revisit is None:
+            form = EMPTY_FORM if session.index is not None else \
+                [[], "End of dataset", None, None, "End of dataset", None, "End of dataset", None, "End of dataset"]
+            return [gr.update(interactive=False), ""] + example_outputs(session) + form
+        previous = previous_answer(session)
+        status = (f"Editing your annotation {session.revisit + 1} of {len(session.history)} "
+                  f"(revision {previous['revision']}): Validate saves it as a new revision.")
+        return [gr.update(interactive=True), status] + list(session.buffer.get(session.history[session.revisit])) + \
+            form_values(previous)
+
+    def move(session, step):
+        """
+        Move `step` rows back (-1) or forward (+1) in the rows annotated by the session,
+        ending on the new row after the last one.
+        """
+        revisit = len(session.history) if session.revisit is None else session.revisit
+        revisit = min(max(revisit + step, 0), len(session.history))
+        session.revisit = None if revisit == len(session.history) else revisit
+        if session.revisit is None and session.index is not None:
+            # renews the lease of the new row, held meanwhile
+            next_example(session)
+        else:
+            session.start(session.index)
+
+    @instrument
+    def start_session(session):
+        next_example(session)
+        return [session] + example_outputs(session)
+
+    @instrument
+    def go_back(session):
+        move(session, -1)
+        return [session] + revisit_outputs(session)
+
+    @instrument
+    def go_forward(session):
+        move(session, 1)
+        return [session] + revisit_outputs(session)
+
+    # Function to store annotations and get the next data entry
+    @instrument
+    def store_annotation_and_get_next(session, selected_classes, comments, selected_tone,
+                                      rating_neutral, suggested_transformation_neutral,
+                                      rating_formal, suggested_transformation_formal,
+                                      rating_friendly, suggested_transformation_friendly):
+        form = [selected_classes, comments, selected_tone,
+                rating_neutral, suggested_transformation_neutral,
+                rating_formal, suggested_transformation_formal,
+                rating_friendly, suggested_transformation_friendly]
+        # The button is only enabled with every rating chosen, but API calls skip that check
+        if (session.index is None and session.revisit is None) or \
+                ratings_missing(rating_neutral, rating_formal, rating_friendly):
+            # Optionally, display a warning message
+            # gr.warning("Please select ratings for all transformed texts.")
+            return [session, gr.update(interactive=False), gr.update()] + [gr.update()] * 5 + form
+
+        if session.revisit is not None:
+            # edit of a row annotated before: stored as its next revision, unless unchanged
+            pos = session.history[session.revisit]
+            if form != form_values(previous_answer(session)):
+                with phase("build"):
+                    row = make_annotation(chunk_df.iloc[pos], session.annotator, *form)
+                row["annotation_time"] = session.elapsed()
+                writer.save([(pos, row)])
+            move(session, 1)
+            return [session] + revisit_outputs(session)
+
+        curr_idx = session.index
+        with phase("build"):
+            row = make_annotation(chunk_df.iloc[curr_idx], session.annotator, selected_classes, comments, selected_tone,
+                                  rating_neutral, suggested_transformation_neutral,
+                                  rating_formal, suggested_transformation_formal,
+                                  rating_friendly, suggested_transformation_friendly)
+        row["annotation_time"] = session.elapsed()
+        writer.save([(curr_idx, row)])
+        scheduler.complete(session.id, curr_idx, row)
+        session.history.append(curr_idx)
+
+        next_example(session)
+        if session.index is None:
+            writer.export_csv()
+        return [session] + revisit_outputs(session)
+
+    def next_page(session):
+        session.start_page(lease_next(session, scheduler, prepare_example, prefetch, count=page_size))
+
+    def page_status(session):
+        if not session.page:
+            return "End of dataset"
+        return f"{writer.annotated_count()} of {len(chunk_df)} examples annotated"
+
+    def page_outputs(session, form=True):
+        outputs = []
+        for slot in range(page_size):
+            if slot < len(session.page):
+                outputs += [gr.update(visible=True)] + list(session.buffer.get(session.page[slot]))
+            else:
+                outputs += [gr.update(visible=False)] + [""] * 5
+            if form:
+                outputs += EMPTY_FORM
+        return outputs
+
+    @instrument
+    def start_page(session):
+        next_page(session)
+        return [session, page_status(session)] + page_outputs(session, form=False)
+
+    @instrument
+    def store_page_and_get_next(session, *forms):
+        """
+        Store every example of the page in one write and show the next page.
+        """
+        forms = [forms[slot * len(EMPTY_FORM):(slot + 1) * len(EMPTY_FORM)] for slot in range(len(session.page))]
+        if not session.page or any(ratings_missing(*form[3::2]) for form in forms):
+            # the button is only enabled once the page is rated, API calls skip that check
+            return [session, gr.update(), "Please rate every example of the page."] + \
+                [gr.update()] * (page_size * (6 + len(EMPTY_FORM)))
+
+        # the time spent on the page is shared by its examples
+        annotation_time = session.elapsed() / len(session.page)
+        rows = []
+        with phase("build"):
+            for pos, form in zip(session.page, forms):
+                row = make_annotation(chunk_df.iloc[pos], session.annotator, *form)
+                row["annotation_time"] = annotation_time
+                rows.append(row)
+        writer.save(list(zip(session.page, rows)))
+        for pos, row in zip(session.page, rows):
+            scheduler.complete(session.id, pos, row)
+
+        next_page(session)
+        if not session.page:
+            writer.export_csv()
+        return [session, gr.update(interactive=False), page_status(session)] + page_outputs(session)
+
+    # a: A, b: B, f: F, s: SKIPPING for the three ratings in turn, Enter validates, the left
+    # and right arrows go back and forward in the annotated rows
+    hotkeys = hotkeys_js([(f"rating_{tone}", {"a": "A", "b": "B", "f": "F", "s": "SKIPPING"})
+                          for tone in ("neutral", "formal", "friendly")],
+                         {"Enter": "validate", "ArrowLeft": "back", "ArrowRight": "forward"}) if keyboard else None
+
+    with gr.Blocks(theme=gr.themes.Soft(), css=CSS + HOTKEYS_CSS, js=hotkeys) as demo:
+        session = gr.State(AnnotationSession(annotator_name))
+
+        gr.Markdown(f"#### Annotating: {dataset_filename}\n")
+        if page_size > 1:
+            # batched view: `page_size` examples validated together
+            status = gr.Markdown("")
+            slots = build_page_view(page_size)
+            eval_btn = gr.Button("Validate page", interactive=False)
+            with gr.Row():
+                gr.Markdown(CLASS_DEFINITIONS)
+                gr.Markdown(RATING_DEFINITIONS)
+            gate_page_button(eval_btn, slots)
+
+            eval_btn.click(
+                store_page_and_get_next,
+                inputs=[session] + [component for _, _, form in slots for component in form],
+                outputs=[session, eval_btn, status] + [component for group, texts, form in slots
+                                                       for component in [group] + texts + form]
+            )
+            demo.load(
+                start_page,
+                inputs=session,
+                outputs=[session, status] + [component for group, texts, _ in slots for component in [group] + texts]
+            )
+        else:
+            with gr.Row():
+                with gr.Column():
+                    # Display the original text and class
+                    text = gr.Textbox(label="Text", interactive=False)
+                    Class = gr.Textbox(label="Class", interactive=False)
+
+                    # Suggested class and comments
+                    suggested_class = gr.CheckboxGroup(
+                        choices=CLASS_CHOICES, 
+                        label="Suggested Class"
+                    )
+                    comments = gr.Textbox(label="Comments")
+                    tone_selection = gr.Radio(
+                        ['Neutral', 'Friendly', 'Formal'], 
+                        label='Tone of the Text'
+                    )
+
+                    # Validate button (will be enabled based on ratings)
+                    eval_btn = gr.Button("Validate", interactive=False, elem_id="validate")
+                    # go back to the rows annotated before to see or edit the answers given
+                    review = gr.Markdown("")
+                    with gr.Row():
+                        back_btn = gr.Button("Back", elem_id="back")
+                        forward_btn = gr.Button("Forward", elem_id="forward")
+
+                    gr.Markdown(CLASS_DEFINITIONS)
+
+
+                with gr.Column():
+                    # Transformed texts and their ratings
+                    transformed_neutral = gr.Textbox(label="Transformed Neutral", interactive=False)
+                    rating_neutral = gr.Radio(
+                        RATING_CHOICES, 
+                        label="Rating Neutral",
+                        elem_id="rating_neutral"
+                    )
+                    suggested_transformation_neutral = gr.Textbox(label="Suggested Transformation Neutral", interactive=True)
+
+                    transformed_formal = gr.Textbox(label="Transformed Formal", interactive=False)
+                    rating_formal = gr.Radio(
+                        RATING_CHOICES, 
+                        label="Rating Formal",
+                        elem_id="rating_formal"
+                    )
+                    suggested_transformation_formal = gr.Textbox(label="Suggested Transformation Formal", interactive=True)
+
+                    transformed_friendly = gr.Textbox(label="Transformed Friendly", interactive=False)
+                    rating_friendly = gr.Radio(
+                        RATING_CHOICES, 
+                        label="Rating Friendly",
+                        elem_id="rating_friendly"
+                    )
+                    suggested_transformation_friendly = gr.Textbox(label="Suggested Transformation Friendly", interactive=True)
+
+                    gr.Markdown(RATING_DEFINITIONS)
+
+                    # Enable the Validate button in the browser once every rating is chosen
+                    gate_button(eval_btn, [rating_neutral, rating_formal, rating_friendly])
+
+                # Click event for the Validate button
+                eval_btn.click(
+                    store_annotation_and_get_next,
+                    inputs=[
+                        session, suggested_class, comments, tone_selection,
+                        rating_neutral, suggested_transformation_neutral,
+                        rating_formal, suggested_transformation_formal,
+                        rating_friendly, suggested_transformation_friendly
+                    ],
+                    outputs=[
+                        session, eval_btn, review, text,
+                        transformed_neutral, transformed_formal, transformed_friendly, 
+                        Class, suggested_class, comments, tone_selection,
+                        rating_neutral, suggested_transformation_neutral,
+                        rating_formal, suggested_transformation_formal,
+                        rating_friendly, suggested_transformation_friendly
+                    ]
+                )
+                navigation_outputs = [
+                    session, eval_btn, review, text,
+                    transformed_neutral, transformed_formal, transformed_friendly,
                     Class, suggested_class, comments, tone_selection,
                     rating_neutral, suggested_transformation_neutral,
                     rating_formal, suggested_transformation_formal,
                     rating_friendly, suggested_transformation_friendly
                 ]
-            )
+                back_btn.click(go_back, inputs=session, outputs=navigation_outputs)
+                forward_btn.click(go_forward, inputs=session, outputs=navigation_outputs)
+
+                demo.load(
+                    start_session,
+                    inputs=session,
+                    outputs=[session, text, transformed_neutral, transformed_formal, transformed_friendly, Class]
+                )
+
+        # handlers of different sessions may run in parallel
+        demo.queue(default_concurrency_limit=None)
 
-        demo.launch()
+    launch(demo, metrics_port, trace)
 
 if __name__ == "__main__":
     fire.Fire(main)
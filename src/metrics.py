@@ -0,0 +1,221 @@
+import bisect
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Cumulative latency histogram in the Prometheus layout (fixed buckets, sum and count).
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Metrics:
+    """
+    Latency histograms and byte counters of the Gradio handlers.
+
+    `instrument` wraps a handler: its total time goes to `handler_seconds`, and the time spent
+    in `phase(...)` blocks run while it executes (reading annotations, building the example,
+    writing the annotation) goes to `phase_seconds` under the same handler. Bytes read and
+    written are counted the same way. Recording costs a few `perf_counter` calls and one lock,
+    so it can stay on in production. Work done outside a handler (e.g. prefetching in the
+    background) is recorded under the `background` handler.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.handler_seconds = defaultdict(Histogram)
+        self.phase_seconds = defaultdict(Histogram)
+        self.calls = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.bytes_read = defaultdict(int)
+        self.bytes_written = defaultdict(int)
+        self._trace = None
+
+    def trace_to(self, path):
+        """
+        Also append one JSON line per handler call, with its phases and bytes, to `path`.
+        """
+        self._trace = open(path, "a", encoding="utf-8", buffering=1)
+
+    def _current(self):
+        return getattr(self._local, "call", None)
+
+    def instrument(self, fn):
+        """
+        Decorator recording the latency of the handler `fn`, keeping its name and signature
+        so Gradio sees the same function.
+        """
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            outer = self._current()
+            call = self._local.call = {"handler": fn.__name__, "phases": defaultdict(float),
+                                       "read": 0, "written": 0}
+            start = time.perf_counter()
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._local.call = outer
+                self._finish(call, time.perf_counter() - start, failed)
+
+        return wrapper
+
+    def _finish(self, call, seconds, failed):
+        handler = call["handler"]
+        with self._lock:
+            self.handler_seconds[handler].observe(seconds)
+            self.calls[handler] += 1
+            self.errors[handler] += failed
+            for phase, phase_seconds in call["phases"].items():
+                self.phase_seconds[handler, phase].observe(phase_seconds)
+            self.bytes_read[handler] += call["read"]
+            self.bytes_written[handler] += call["written"]
+            if self._trace is not None:
+                self._trace.write(json.dumps({
+                    "time": time.time(), "handler": handler, "seconds": seconds, "error": failed,
+                    "phases": call["phases"], "bytes_read": call["read"], "bytes_written": call["written"],
+                }) + "\n")
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the enclosed block as phase `name` of the running handler. A phase nested in a
+        phase of the same name (e.g. a snapshot written while logging a change) counts once.
+        """
+        active = self._local.__dict__.setdefault("phases", set())
+        if name in active:
+            yield
+            return
+        active.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            active.discard(name)
+            self.observe_phase(name, time.perf_counter() - start)
+
+    def observe_phase(self, name, seconds, handler=None):
+        call = self._current()
+        if call is not None and handler is None:
+            call["phases"][name] += seconds
+            return
+        with self._lock:
+            self.phase_seconds[handler or "background", name].observe(seconds)
+
+    def add_bytes(self, read=0, written=0):
+        call = self._current()
+        if call is not None:
+            call["read"] += read
+            call["written"] += written
+            return
+        with self._lock:
+            self.bytes_read["background"] += read
+            self.bytes_written["background"] += written
+
+    def instrument_blocks(self, demo):
+        """
+        Record the time Gradio spends serializing the outputs of every handler of `demo`
+        (the `serialize` phase), which runs after the handler returned.
+        """
+        postprocess_data = demo.postprocess_data
+
+        async def timed_postprocess_data(block_fn, predictions, state):
+            start = time.perf_counter()
+            try:
+                return await postprocess_data(block_fn, predictions, state)
+            finally:
+                self.observe_phase("serialize", time.perf_counter() - start, handler=block_fn.name)
+
+        demo.postprocess_data = timed_postprocess_data
+        return demo
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def histogram(name, help_text, histograms):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in sorted(histograms.items()):
+                label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+                cumulative = 0
+                for bound, count in zip(hist.buckets + ("+Inf",), hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{label_text}}} {hist.sum}")
+                lines.append(f"{name}_count{{{label_text}}} {hist.count}")
+
+        def counter(name, help_text, values):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for handler, value in sorted(values.items()):
+                lines.append(f'{name}{{handler="{handler}"}} {value}')
+
+        with self._lock:
+            histogram("annotation_handler_seconds", "Time spent in each Gradio handler.",
+                      {(("handler", h),): hist for h, hist in self.handler_seconds.items()})
+            histogram("annotation_phase_seconds", "Time spent in each phase of a handler.",
+                      {(("handler", h), ("phase", p)): hist for (h, p), hist in self.phase_seconds.items()})
+            counter("annotation_handler_calls_total", "Handler calls.", self.calls)
+            counter("annotation_handler_errors_total", "Handler calls that raised.", self.errors)
+            counter("annotation_bytes_read_total", "Bytes read from annotation and dataset files.", self.bytes_read)
+            counter("annotation_bytes_written_total", "Bytes written to annotation and dataset files.", self.bytes_written)
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve `render()` at http://host:port/metrics from a background thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+        print(f"Metrics served at http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+
+# shared by every module of the process
+METRICS = Metrics()
+instrument = METRICS.instrument
+phase = METRICS.phase
+add_bytes = METRICS.add_bytes
@@ -0,0 +1,172 @@
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+ORDERS = ("file", "stratified", "adaptive")
+
+
+def stratum_codes(table, columns):
+    """
+    Stratum number of every row of `table` (a DataFrame or a LazyTable), from the values of
+    `columns`.
+    """
+    values = pd.DataFrame({column: table[column].astype(str).to_numpy() for column in columns})
+    return values.groupby(list(columns), sort=True).ngroup().to_numpy()
+
+
+class StratifiedOrder:
+    """
+    Queue of rows dealt round-robin over their strata, e.g. one row of each `Class` in turn,
+    keeping the given order inside each stratum.
+
+    It can replace the deque of rows in LeaseScheduler: `popleft` hands the next row out,
+    rows given back with `appendleft` / `extendleft` (expired leases, skipped candidates) are
+    handed out first, `append` puts a row back at the end of its stratum, and iterating
+    previews the upcoming rows without taking them. Not thread-safe, callers hold their lock.
+    """
+
+    def __init__(self, strata, rows):
+        """
+        `strata` holds the stratum of every row of the dataset, `rows` the rows to queue.
+        """
+        self._strata = strata
+        rows = np.fromiter(rows, dtype=np.int64)
+        codes = np.asarray(strata)[rows]
+        order = np.argsort(codes, kind="stable")
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        self._queues = {int(codes[part[0]]): deque(rows[part].tolist())
+                        for part in np.split(order, bounds) if len(part)}
+        self._remaining = {stratum: len(queue) for stratum, queue in self._queues.items()}
+        self._turn = deque(sorted(self._queues))
+        self._front = deque()
+
+    def _pick(self, turn, remaining):
+        """
+        Stratum the next row is taken from, moved to the back of `turn`; None when every
+        stratum is empty.
+        """
+        for _ in range(len(turn)):
+            stratum = turn[0]
+            turn.rotate(-1)
+            if remaining[stratum]:
+                return stratum
+        return None
+
+    def popleft(self):
+        if self._front:
+            return self._front.popleft()
+        stratum = self._pick(self._turn, self._remaining)
+        if stratum is None:
+            raise IndexError("pop from an empty queue")
+        self._remaining[stratum] -= 1
+        return self._queues[stratum].popleft()
+
+    def appendleft(self, row):
+        self._front.appendleft(row)
+
+    def extendleft(self, rows):
+        self._front.extendleft(rows)
+
+    def append(self, row):
+        stratum = int(self._strata[row])
+        self._queues.setdefault(stratum, deque()).append(row)
+        self._remaining[stratum] = self._remaining.get(stratum, 0) + 1
+        if stratum not in self._turn:
+            self._turn.append(stratum)
+
+    def observe(self, row, annotation):
+        """
+        Called with every stored annotation; the round-robin order does not depend on them.
+        """
+
+    def __len__(self):
+        return len(self._front) + sum(self._remaining.values())
+
+    def __iter__(self):
+        yield from self._front
+        turn = deque(self._turn)
+        remaining = dict(self._remaining)
+        rows = {stratum: iter(queue) for stratum, queue in self._queues.items()}
+        while True:
+            stratum = self._pick(turn, remaining)
+            if stratum is None:
+                return
+            remaining[stratum] -= 1
+            yield next(rows[stratum])
+
+
+class AdaptiveOrder(StratifiedOrder):
+    """
+    Stratified queue re-ranked as annotations arrive.
+
+    `outcome(annotation)` scores every stored annotation between 0 and 1 (e.g. 1 when the
+    first model won the comparison, 0 when the second did) or returns None when it says
+    nothing. Each stratum keeps a Beta posterior of its rate, and the next row comes from the
+    stratum where it is the least settled: the highest probability that the rate lies on the
+    other side of 0.5 than estimated, with fewer observations first on ties. Strata already
+    decided are only served once the others are, so the budget goes where an answer can
+    still change the result. Picking a row costs one pass over the strata.
+    """
+
+    def __init__(self, strata, rows, outcome, observed=()):
+        """
+        `observed` lists the (row, annotation) pairs stored before the queue was built.
+        """
+        super().__init__(strata, rows)
+        self.outcome = outcome
+        self._wins = {}
+        self._counts = {}
+        self._keys = {}
+        for row, annotation in observed:
+            self.observe(row, annotation)
+
+    def uncertainty(self, stratum):
+        """
+        Probability that the rate of `stratum` is on the other side of 0.5 than its estimate
+        (0.5 without observations), with a normal approximation of the posterior.
+        """
+        count = self._counts.get(stratum, 0)
+        if not count:
+            return 0.5
+        mean = (self._wins[stratum] + 1) / (count + 2)
+        z = abs(mean - 0.5) / math.sqrt(mean * (1 - mean) / (count + 3))
+        return 0.5 * math.erfc(z / math.sqrt(2))
+
+    def _key(self, stratum):
+        return self._keys.get(stratum, (0.5, 0))
+
+    def _pick(self, turn, remaining):
+        best = None
+        for stratum in turn:
+            if remaining[stratum] and (best is None or self._key(stratum) > self._key(best)):
+                best = stratum
+        if best is not None:
+            # equally uncertain strata are served in turn
+            turn.remove(best)
+            turn.append(best)
+        return best
+
+    def observe(self, row, annotation):
+        value = self.outcome(annotation)
+        if value is None:
+            return
+        stratum = int(self._strata[row])
+        self._wins[stratum] = self._wins.get(stratum, 0) + value
+        self._counts[stratum] = self._counts.get(stratum, 0) + 1
+        self._keys[stratum] = (self.uncertainty(stratum), -self._counts[stratum])
+
+
+def make_order(order, rows, strata=None, outcome=None, observed=()):
+    """
+    Queue of `rows` for the `order` strategy: "file" (as given), "stratified" (round-robin
+    over `strata`) or "adaptive" (see AdaptiveOrder, scored by `outcome`).
+    """
+    if order == "file":
+        return deque(rows)
+    if order == "stratified":
+        return StratifiedOrder(strata, rows)
+    if order == "adaptive":
+        return AdaptiveOrder(strata, rows, outcome, observed)
+    raise ValueError(f"Unknown order {order!r}, expected one of {', '.join(ORDERS)}")
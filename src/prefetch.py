@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# shared by every session: preparing an example is short and mostly waits on I/O
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+class Prefetcher:
+    """
+    Per-session buffer of upcoming examples prepared off the request path.
+
+    `prepare(key)` builds everything needed to display an example; `schedule` starts it in
+    the background for the next few keys and `get` returns the prepared result, or prepares
+    it inline when it was not scheduled (or is no longer `fresh`).
+    """
+
+    def __init__(self, prepare, depth=5):
+        self.prepare = prepare
+        self.depth = depth
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schedule(self, keys):
+        with self._lock:
+            for n, key in enumerate(keys):
+                if n >= self.depth:
+                    break
+                if key not in self._futures:
+                    self._futures[key] = _executor.submit(self.prepare, key)
+            while len(self._futures) > self.depth:
+                self._futures.popitem(last=False)
+
+    def get(self, key, fresh=None):
+        with self._lock:
+            future = self._futures.pop(key, None)
+        if future is not None:
+            try:
+                prepared = future.result()
+            except Exception:
+                # retried inline below, so the error surfaces on the request path
+                prepared = None
+            if prepared is not None and (fresh is None or fresh(prepared)):
+                return prepared
+        return self.prepare(key)
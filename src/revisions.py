@@ -0,0 +1,111 @@
+import threading
+
+
+def revision_key(row):
+    """
+    (row_id, annotator) an annotation is a revision of, or None for annotations written
+    before row ids were recorded.
+    """
+    row_id = row.get("row_id")
+    if row_id is None or row_id != row_id or row_id == "":
+        return None
+    return str(row_id), str(row.get("annotator") or "")
+
+
+def _revision_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else int(number)
+
+
+class RevisionIndex:
+    """
+    Latest revision of every (row_id, annotator), kept in memory.
+
+    Annotations are append-only events: editing a row stores a new annotation with the next
+    `revision` number (1 for the first one) instead of changing the stored one, so the
+    history stays in the store. Looking up the latest answer of a row, e.g. to show it when
+    the annotator goes back, is one dict access. Thread-safe.
+    """
+
+    def __init__(self, rows=()):
+        self._latest = {}
+        # annotations without a row id, which are never revised
+        self._unkeyed = 0
+        self._lock = threading.Lock()
+        for row in rows:
+            self._add(row)
+
+    def _add(self, row):
+        key = revision_key(row)
+        if key is None:
+            self._unkeyed += 1
+            return
+        current = self._latest.get(key)
+        revision = _revision_number(row.get("revision"))
+        if revision is None:
+            # written before revisions were numbered: they come in order
+            revision = current[0] + 1 if current else 1
+        if current is None or revision >= current[0]:
+            self._latest[key] = (revision, row)
+
+    def assign(self, rows):
+        """
+        Number the rows without a `revision` as the next revision of their row, and index
+        them all. Rows already numbered (e.g. a retried write) keep their number.
+        """
+        with self._lock:
+            for row in rows:
+                key = revision_key(row)
+                if key is not None and _revision_number(row.get("revision")) is None:
+                    current = self._latest.get(key)
+                    row["revision"] = current[0] + 1 if current else 1
+                self._add(row)
+
+    def latest(self, row_id, annotator):
+        """
+        Latest annotation of the row by the annotator, or None.
+        """
+        found = self._latest.get((str(row_id), str(annotator or "")))
+        return found[1] if found else None
+
+    def revision(self, row_id, annotator):
+        """
+        Number of the latest revision of the row by the annotator, 0 when not annotated.
+        """
+        found = self._latest.get((str(row_id), str(annotator or "")))
+        return found[0] if found else 0
+
+    def row_ids(self):
+        """
+        Row ids annotated by at least one annotator.
+        """
+        with self._lock:
+            return {row_id for row_id, _ in self._latest}
+
+    def __len__(self):
+        """
+        Number of annotated (row_id, annotator) pairs, revisions counted once.
+        """
+        return len(self._latest) + self._unkeyed
+
+
+def latest_revisions(rows):
+    """
+    The annotations left when every (row_id, annotator) keeps only its latest revision, at
+    the place of its first one so edits do not reorder the export.
+    """
+    rows = list(rows)
+    index = RevisionIndex(rows)
+    seen = set()
+    resolved = []
+    for row in rows:
+        key = revision_key(row)
+        if key is None:
+            resolved.append(row)
+        elif key not in seen:
+            seen.add(key)
+            resolved.append(index.latest(*key))
+    return resolved
@@ -0,0 +1,190 @@
+import heapq
+import threading
+import time
+from collections import deque
+
+
+class LeaseScheduler:
+    """
+    Central work queue handing dataset rows out to many annotators at once.
+
+    Each row needs `required[row]` annotations from distinct annotators (1 for a regular row,
+    k for a cross-evaluation row). A row is leased to an annotator for `lease_timeout`
+    seconds; leases that expire without an annotation go back to the front of the queue so
+    stragglers do not block the job. All methods are thread-safe.
+
+    With a `leases` log (sqlite_store.LeaseLog), leases are also written to the store and
+    those still running are granted again when the scheduler is rebuilt, e.g. by a restarted
+    server.
+    """
+
+    def __init__(self, required, lease_timeout=900, completed=(), order=None, leases=None):
+        """
+        `required` holds the number of annotations each row needs and `completed` the
+        (row, annotator) pairs already stored, e.g. when the server restarts. `order` lists
+        the rows in the order they are handed out (file order by default), or is a queue from
+        ordering.py that decides it as annotations arrive.
+        """
+        self.lease_timeout = lease_timeout
+        self._needed = list(required)
+        self._annotated_by = {}
+        self._leases = {}        # row -> {annotator: expiry}
+        self._held = {}          # annotator -> rows leased to them, in lease order
+        self._expiries = []      # heap of (expiry, row, annotator)
+        self._lock = threading.Lock()
+        self._remaining = sum(self._needed)
+        for row, annotator in completed:
+            self._record(row, annotator)
+        if order is None:
+            order = range(len(self._needed))
+        if hasattr(order, "popleft"):
+            # satisfied rows it still holds are dropped when they come up
+            self._open = order
+        else:
+            self._open = deque(row for row in order if self._needed[row] > 0)
+        self._log = leases
+        if leases is not None:
+            now = time.time()
+            for row, annotator, leased_at in sorted(leases.active(), key=lambda lease: lease[2]):
+                if leased_at + lease_timeout > now and self._free_slots(row) > 0 \
+                        and annotator not in self._annotated_by.get(row, ()):
+                    self._grant(row, annotator, leased_at)
+
+    def _record(self, row, annotator):
+        done_by = self._annotated_by.setdefault(row, set())
+        if annotator not in done_by:
+            done_by.add(annotator)
+            if self._needed[row] > 0:
+                self._needed[row] -= 1
+                self._remaining -= 1
+
+    def _free_slots(self, row):
+        return self._needed[row] - len(self._leases.get(row, ()))
+
+    def _expire(self, now):
+        while self._expiries and self._expiries[0][0] <= now:
+            expiry, row, annotator = heapq.heappop(self._expiries)
+            if self._leases.get(row, {}).get(annotator) != expiry:
+                # renewed or completed since
+                continue
+            del self._leases[row][annotator]
+            self._unhold(annotator, row)
+            if self._free_slots(row) == 1:
+                # the row was fully leased, reassign it first
+                self._open.appendleft(row)
+
+    def _grant(self, row, annotator, now):
+        expiry = now + self.lease_timeout
+        self._leases.setdefault(row, {})[annotator] = expiry
+        held = self._held.setdefault(annotator, [])
+        if row not in held:
+            held.append(row)
+        heapq.heappush(self._expiries, (expiry, row, annotator))
+        return row
+
+    def _unhold(self, annotator, row):
+        held = self._held.get(annotator)
+        if held and row in held:
+            held.remove(row)
+            if not held:
+                del self._held[annotator]
+
+    def _take(self, annotator, now):
+        skipped = []
+        row = None
+        while self._open:
+            candidate = self._open.popleft()
+            if self._free_slots(candidate) <= 0:
+                # satisfied or fully leased, expiries/releases reopen it
+                continue
+            if annotator in self._annotated_by.get(candidate, ()) \
+                    or annotator in self._leases.get(candidate, ()):
+                skipped.append(candidate)
+                continue
+            row = candidate
+            break
+        self._open.extendleft(reversed(skipped))
+        if row is None:
+            return None
+        self._grant(row, annotator, now)
+        if self._free_slots(row) > 0:
+            # cross-evaluation row still needs other annotators
+            self._open.appendleft(row)
+        return row
+
+    def lease(self, annotator):
+        """
+        Row the annotator should work on next, or None when nothing is left for them.
+        Calling it again before completing the row renews and returns the same lease.
+        """
+        rows = self.lease_many(annotator, 1)
+        return rows[0] if rows else None
+
+    def lease_many(self, annotator, n):
+        """
+        Up to `n` rows for the annotator to work on at once (a page of the batched view).
+        Rows they already hold are renewed and returned first, then new ones are leased.
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            rows = [self._grant(row, annotator, now) for row in list(self._held.get(annotator, ()))[:n]]
+            while len(rows) < n:
+                row = self._take(annotator, now)
+                if row is None:
+                    break
+                rows.append(row)
+        if self._log is not None and rows:
+            self._log.leased(annotator, rows, now)
+        return rows
+
+    def peek(self, annotator, n):
+        """
+        Up to `n` rows the annotator is likely to be leased next, without leasing them.
+        """
+        rows = []
+        with self._lock:
+            for row in self._open:
+                if len(rows) >= n:
+                    break
+                if self._free_slots(row) > 0 and row not in self._held.get(annotator, ()) \
+                        and annotator not in self._annotated_by.get(row, ()) \
+                        and annotator not in self._leases.get(row, ()):
+                    rows.append(row)
+        return rows
+
+    def complete(self, annotator, row, annotation=None):
+        """
+        Record that `annotator` stored an annotation for `row`, even if the lease expired.
+        The `annotation` is passed on to an ordering queue that re-ranks the rows.
+        """
+        with self._lock:
+            observe = getattr(self._open, "observe", None)
+            if observe is not None and annotation is not None:
+                observe(row, annotation)
+            was_full = self._free_slots(row) <= 0
+            self._leases.get(row, {}).pop(annotator, None)
+            self._unhold(annotator, row)
+            self._record(row, annotator)
+            if was_full and self._free_slots(row) > 0:
+                self._open.appendleft(row)
+
+    def release(self, annotator):
+        """
+        Give the annotator's current rows back to the queue (e.g. when they log out).
+        """
+        with self._lock:
+            released = self._held.pop(annotator, [])
+            for row in reversed(released):
+                was_full = self._free_slots(row) <= 0
+                self._leases.get(row, {}).pop(annotator, None)
+                if was_full and self._free_slots(row) > 0:
+                    self._open.appendleft(row)
+        if self._log is not None and released:
+            self._log.released(annotator, released)
+
+    def remaining(self):
+        """
+        Number of annotations still needed over the whole dataset.
+        """
+        return self._remaining
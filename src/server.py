@@ -0,0 +1,239 @@
+import atexit
+import glob
+import os
+import random
+import re
+
+import fire
+import gradio as gr
+import pandas as pd
+
+from annotation_job import annotations_path, launch, lease_next, stored_rows
+from annotation_store import open_store
+from columnar import read_table
+from dashboard import ProgressStats, add_dashboard
+from metrics import instrument, phase
+from main import (ANNOTATION_COLUMNS, CLASS_CHOICES, CLASS_DEFINITIONS, CSS, RATING_CHOICES,
+                  RATING_DEFINITIONS, gate_button, make_annotation, prepare_examples, ratings_missing,
+                  transformations_passed)
+from ordering import make_order, stratum_codes
+from scheduler import LeaseScheduler
+from session import AnnotationSession
+
+
+def _batch_number(path):
+    match = re.search(r"batch_(\d+)", os.path.basename(path))
+    return int(match.group(1)) if match else 0
+
+
+def load_dataset(dataset, crossval_percentage=0.0, crossval_k=2, seed=0):
+    """
+    Load the rows to annotate and the number of annotators each row needs.
+
+    `dataset` is either one CSV, or a folder of batches written by split.py, in which case
+    the rows of `_crossval` batches are annotated by `crossval_k` annotators. For a single
+    CSV, `crossval_percentage` percent of the rows (chosen with `seed`) are cross-evaluated.
+    A boolean `crossval` column in the data takes precedence over both. A row found in several
+    batch files (same `row_id`, e.g. the overlap of a stratified split) is loaded once.
+    """
+    if os.path.isdir(dataset):
+        frames = []
+        paths = [path for pattern in ("batch_*.csv*", "batch_*.parquet", "batch_*.arrow")
+                 for path in glob.glob(os.path.join(dataset, pattern))]
+        for path in sorted(paths, key=_batch_number):
+            frame = read_table(path)
+            frame["batch"] = os.path.basename(path).split(".")[0]
+            if "crossval" not in frame.columns:
+                frame["crossval"] = "_crossval" in path
+            frames.append(frame)
+        if not frames:
+            raise FileNotFoundError(f"No batch_*.csv files found in {dataset}")
+        df = pd.concat(frames, ignore_index=True)
+        if "row_id" in df.columns:
+            # overlap rows of a stratified split are in several batch files: keep one copy,
+            # their `crossval_k` annotators are counted in `required`
+            df = df.drop_duplicates("row_id").reset_index(drop=True)
+    else:
+        df = read_table(dataset)
+        if "crossval" not in df.columns:
+            crossval_count = round(len(df) * crossval_percentage / 100)
+            crossval_rows = random.Random(seed).sample(range(len(df)), crossval_count)
+            df["crossval"] = False
+            df.loc[crossval_rows, "crossval"] = True
+
+    df = prepare_examples(df)
+    required = [crossval_k if crossval else 1 for crossval in df["crossval"].astype(bool)]
+    return df, required
+
+
+def completed_pairs(anns_store, df):
+    """
+    (row position, annotator) pairs already stored.
+    """
+    for pos, row in stored_rows(anns_store, df):
+        yield pos, row.get("annotator")
+
+
+def main(dataset: str = "", crossval_percentage: float = 0.0, crossval_k: int = 2, seed: int = 0,
+         lease_timeout: int = 900, store: str = "journal", prefetch: int = 5, refresh: int = 5,
+         order: str = "file", stratify_by: str = "Class", metrics_port: int = None, trace: str = None,
+         server_name: str = None, server_port: int = None):
+    """
+    Serve one annotation job to many annotators at once.
+
+    Every annotator logs in with their name and receives rows leased from a shared queue; all
+    annotations are written to `annotations/annotations_<dataset name>.csv` (the name of a
+    file without its extension). The Dashboard tab shows the progress of the job, refreshed
+    every `refresh` seconds. Rows are handed out in file `order`, or "stratified" / "adaptive"
+    over the `stratify_by` columns. Handler latencies are served at
+    http://127.0.0.1:<metrics_port>/metrics and appended to `trace` when set.
+    """
+    assert dataset, "Dataset MISSING. Pass a CSV file or a folder of batches with --dataset"
+
+    df, required = load_dataset(dataset, crossval_percentage, crossval_k, seed)
+    # the annotations of a Parquet or Arrow dataset are a CSV too: annotations_<name>.csv
+    dataset_name = os.path.basename(os.path.normpath(dataset))
+    if os.path.isfile(dataset):
+        dataset_name = os.path.splitext(dataset_name)[0]
+    dataset_name += ".csv"
+
+    anns_store = open_store(store, annotations_path(dataset_name), df.columns.tolist() + ANNOTATION_COLUMNS)
+    atexit.register(anns_store.export_csv)
+
+    queue = None
+    if order != "file":
+        stratify_by = [stratify_by] if isinstance(stratify_by, str) else list(stratify_by)
+        queue = make_order(order, range(len(df)), stratum_codes(df, stratify_by), transformations_passed,
+                           observed=stored_rows(anns_store, df))
+    # with the sqlite store, leases survive a restart of the server
+    scheduler = LeaseScheduler(required, lease_timeout, completed_pairs(anns_store, df), order=queue,
+                               leases=anns_store.lease_log(df["row_id"]))
+    print(f"Serving {len(df)} rows, {scheduler.remaining()} annotations to go")
+
+    # read once here, then updated with every stored annotation
+    stats = ProgressStats(remaining=scheduler.remaining)
+    for row in anns_store.rows():
+        stats.add(row)
+
+    def prepare_example(pos):
+        with phase("build"):
+            df_row = df.iloc[pos]
+            return [df_row['text'], df_row['Neutral'], df_row['Formal'], df_row['Friendly'], df_row.get('Class', '')]
+
+    def next_example(session):
+        """
+        Lease the next row for the session and prepare the following ones in the background.
+        """
+        session.start(lease_next(session, scheduler, prepare_example, prefetch, holder=session.annotator))
+
+    def example_outputs(session):
+        status = f"Annotator: **{session.annotator}**, {scheduler.remaining()} annotations left in the job"
+        if session.index is None:
+            return ["Nothing left to annotate", "", "", "", "", status]
+        return list(session.buffer.get(session.index)) + [status]
+
+    @instrument
+    def login(name, session):
+        name = (name or "").strip()
+        if not name:
+            return [session, gr.update(visible=True), gr.update(visible=False),
+                    "", "", "", "", "", "Please enter your annotator name"]
+        if session.annotator and session.annotator != name:
+            scheduler.release(session.annotator)
+        session.annotator = name
+        next_example(session)
+        return [session, gr.update(visible=False), gr.update(visible=True)] + example_outputs(session)
+
+    @instrument
+    def store_annotation_and_get_next(session, selected_classes, comments, selected_tone,
+                                      rating_neutral, suggested_transformation_neutral,
+                                      rating_formal, suggested_transformation_formal,
+                                      rating_friendly, suggested_transformation_friendly):
+        if session.index is None or ratings_missing(rating_neutral, rating_formal, rating_friendly):
+            return [session, gr.update(interactive=False)] + example_outputs(session) + [
+                selected_classes, comments, selected_tone,
+                rating_neutral, suggested_transformation_neutral,
+                rating_formal, suggested_transformation_formal,
+                rating_friendly, suggested_transformation_friendly]
+
+        with phase("build"):
+            annotation = make_annotation(df.iloc[session.index], session.annotator, selected_classes, comments, selected_tone,
+                                         rating_neutral, suggested_transformation_neutral,
+                                         rating_formal, suggested_transformation_formal,
+                                         rating_friendly, suggested_transformation_friendly)
+        annotation["annotation_time"] = session.elapsed()
+        anns_store.append(annotation)
+        stats.add(annotation)
+        scheduler.complete(session.annotator, session.index, annotation)
+        next_example(session)
+        return [session, gr.update(interactive=False)] + example_outputs(session) + [
+            [], '', None, None, '', None, '', None, '']
+
+    with gr.Blocks(theme=gr.themes.Soft(), css=CSS) as demo:
+        session = gr.State(AnnotationSession())
+        gr.Markdown(f"#### Annotating: {dataset_name}\n")
+
+        with gr.Tab("Annotate"):
+            with gr.Column(visible=True) as login_box:
+                annotator_name = gr.Textbox(label="Annotator name")
+                login_btn = gr.Button("Start annotating")
+
+            with gr.Column(visible=False) as form:
+                status = gr.Markdown("")
+                with gr.Row():
+                    with gr.Column():
+                        text = gr.Textbox(label="Text", interactive=False)
+                        Class = gr.Textbox(label="Class", interactive=False)
+                        suggested_class = gr.CheckboxGroup(choices=CLASS_CHOICES, label="Suggested Class")
+                        comments = gr.Textbox(label="Comments")
+                        tone_selection = gr.Radio(['Neutral', 'Friendly', 'Formal'], label='Tone of the Text')
+                        eval_btn = gr.Button("Validate", interactive=False)
+                        gr.Markdown(CLASS_DEFINITIONS)
+
+                    with gr.Column():
+                        transformed_neutral = gr.Textbox(label="Transformed Neutral", interactive=False)
+                        rating_neutral = gr.Radio(RATING_CHOICES, label="Rating Neutral")
+                        suggested_transformation_neutral = gr.Textbox(label="Suggested Transformation Neutral", interactive=True)
+
+                        transformed_formal = gr.Textbox(label="Transformed Formal", interactive=False)
+                        rating_formal = gr.Radio(RATING_CHOICES, label="Rating Formal")
+                        suggested_transformation_formal = gr.Textbox(label="Suggested Transformation Formal", interactive=True)
+
+                        transformed_friendly = gr.Textbox(label="Transformed Friendly", interactive=False)
+                        rating_friendly = gr.Radio(RATING_CHOICES, label="Rating Friendly")
+                        suggested_transformation_friendly = gr.Textbox(label="Suggested Transformation Friendly", interactive=True)
+                        gr.Markdown(RATING_DEFINITIONS)
+
+        with gr.Tab("Dashboard"):
+            add_dashboard(stats.summary, refresh)
+
+        example = [text, transformed_neutral, transformed_formal, transformed_friendly, Class, status]
+        gate_button(eval_btn, [rating_neutral, rating_formal, rating_friendly])
+
+        login_inputs = [annotator_name, session]
+        login_outputs = [session, login_box, form] + example
+        login_btn.click(login, inputs=login_inputs, outputs=login_outputs)
+        annotator_name.submit(login, inputs=login_inputs, outputs=login_outputs)
+
+        eval_btn.click(
+            store_annotation_and_get_next,
+            inputs=[
+                session, suggested_class, comments, tone_selection,
+                rating_neutral, suggested_transformation_neutral,
+                rating_formal, suggested_transformation_formal,
+                rating_friendly, suggested_transformation_friendly
+            ],
+            outputs=[session, eval_btn] + example + [
+                suggested_class, comments, tone_selection,
+                rating_neutral, suggested_transformation_neutral,
+                rating_formal, suggested_transformation_formal,
+                rating_friendly, suggested_transformation_friendly
+            ]
+        )
+
+    demo.queue(default_concurrency_limit=None)
+    launch(demo, metrics_port, trace, server_name=server_name, server_port=server_port)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
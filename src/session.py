@@ -0,0 +1,78 @@
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+
+class AnnotationSession:
+    """
+    State of one browser tab, kept in a `gr.State` so concurrent sessions never share it.
+    """
+
+    def __init__(self, annotator=""):
+        self.id = uuid.uuid4().hex
+        self.annotator = annotator
+        self.index = None
+        # rows shown together by the batched page view, and what each one displayed
+        self.page = []
+        self.shown = {}
+        self.started_at = None
+        # row version and swap decision shown to this tab (used by the V2 tool)
+        self.version = None
+        self.swapped = None
+        # rows shown before, for the Previous button of an ordered queue (V2 tool) or the
+        # rows annotated by this tab (Back button of src/main.py)
+        self.history = []
+        # position in `history` of the row shown again by the Back button, None on a new row
+        self.revisit = None
+        # Prefetcher of the examples this tab is likely to show next
+        self.buffer = None
+
+    def __deepcopy__(self, memo):
+        # gr.State deep-copies its initial value for every new session: give each one its own id
+        return AnnotationSession(self.annotator)
+
+    def start(self, index, version=None, swapped=None):
+        """
+        Remember the row now displayed and start timing it.
+        """
+        self.index = index
+        self.version = version
+        self.swapped = swapped
+        self.started_at = time.time()
+
+    def start_page(self, indices, shown=None):
+        """
+        Remember the rows of the page now displayed and start timing it.
+        """
+        self.page = list(indices)
+        self.shown = dict(shown or {})
+        self.start(self.page[0] if self.page else None)
+
+    def elapsed(self):
+        return time.time() - (self.started_at or time.time())
+
+
+class RowLocks:
+    """
+    Fixed pool of locks striped over row indices, so handlers working on different rows run
+    in parallel while two sessions touching the same row are serialized.
+    """
+
+    def __init__(self, stripes=256):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __getitem__(self, row):
+        return self._locks[hash(row) % len(self._locks)]
+
+    @contextmanager
+    def many(self, rows):
+        """
+        Hold the locks of all `rows` at once, taken in a fixed order so two pages never
+        deadlock and a stripe shared by two rows is only taken once.
+        """
+        stripes = sorted({hash(row) % len(self._locks) for row in rows})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._locks[stripe])
+            yield
@@ -0,0 +1,336 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import fire
+import pandas as pd
+
+from annotation_store import AnnotationStore, _jsonable, write_csv_atomic
+from metrics import add_bytes, phase
+from revisions import latest_revisions
+
+# name of the database shared by every dataset of an annotations folder
+DATABASE_NAME = "annotations.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    name TEXT PRIMARY KEY,
+    layout TEXT NOT NULL,          -- 'append' (one CSV line per annotation) or 'inplace' (answers in the source rows)
+    columns TEXT NOT NULL,         -- JSON list, column order of the exported CSV
+    csv_path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS source_rows (
+    dataset TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    row_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (dataset, position)
+);
+CREATE INDEX IF NOT EXISTS source_rows_row_id ON source_rows (dataset, row_id);
+CREATE TABLE IF NOT EXISTS assignments (
+    dataset TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    annotator TEXT NOT NULL,
+    status TEXT NOT NULL,          -- 'leased' or 'done'
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (dataset, row_id, annotator)
+);
+CREATE INDEX IF NOT EXISTS assignments_annotator ON assignments (dataset, annotator, status);
+CREATE INDEX IF NOT EXISTS assignments_status ON assignments (dataset, status);
+CREATE TABLE IF NOT EXISTS annotations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dataset TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    annotator TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS annotations_row ON annotations (dataset, row_id);
+CREATE INDEX IF NOT EXISTS annotations_annotator ON annotations (dataset, annotator);
+"""
+
+
+def _encode(values):
+    return json.dumps({k: _jsonable(v) for k, v in values.items()}, ensure_ascii=False)
+
+
+class AnnotationDatabase:
+    """
+    SQLite database in WAL mode holding the source rows, assignments and annotations of any
+    number of datasets, written by both tools.
+
+    Every thread gets its own connection; in WAL mode readers never block the writer, and
+    writers of several processes queue on the database lock (`busy_timeout`) for the few
+    milliseconds a commit takes instead of rewriting files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # connections of every thread (handlers, committer, prefetch), closed together
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        """
+        Connection of the current thread, in autocommit mode for reads.
+        """
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # used by this thread only, but closed by whichever thread calls `close`
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            # commits are durable once they return, like the fsync'd journal
+            db.execute("PRAGMA synchronous=FULL")
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+            with self._connections_lock:
+                self._connections.append(db)
+        return db
+
+    def transaction(self):
+        return _Transaction(self.connection())
+
+    def register_dataset(self, name, layout, columns, csv_path):
+        with self.transaction() as db:
+            db.execute("INSERT INTO datasets VALUES (?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET "
+                       "layout = excluded.layout, columns = excluded.columns, csv_path = excluded.csv_path",
+                       (name, layout, json.dumps(list(columns)), csv_path))
+
+    def datasets(self):
+        return [dict(row) for row in self.connection().execute("SELECT * FROM datasets ORDER BY name")]
+
+    def add_source_rows(self, dataset, df):
+        """
+        Store the rows of `df` once; later calls for the same dataset do nothing.
+        """
+        row_ids = df["row_id"].astype(str) if "row_id" in df.columns else pd.Series(range(len(df))).astype(str)
+        with self.transaction() as db:
+            if db.execute("SELECT 1 FROM source_rows WHERE dataset = ? LIMIT 1", (dataset,)).fetchone():
+                return
+            db.executemany("INSERT INTO source_rows VALUES (?, ?, ?, ?)",
+                           ((dataset, position, row_id, _encode(row))
+                            for position, (row_id, row) in enumerate(zip(row_ids, df.to_dict("records")))))
+
+    def add_annotation(self, dataset, row_id, annotator, values, status="done"):
+        """
+        Record `values` for a row and, for a named annotator, set their assignment `status`,
+        in one transaction.
+        """
+        self.add_annotations(dataset, [(row_id, annotator, values)], status)
+
+    def add_annotations(self, dataset, annotations, status="done"):
+        """
+        Same as `add_annotation` for a list of (row_id, annotator, values), in one transaction.
+        """
+        now = time.time()
+        records = [(dataset, str(row_id), annotator or "", now, _encode(values))
+                   for row_id, annotator, values in annotations]
+        add_bytes(written=sum(len(record[-1]) for record in records))
+        with self.transaction() as db:
+            db.executemany("INSERT INTO annotations (dataset, row_id, annotator, created_at, data) VALUES (?, ?, ?, ?, ?)",
+                           records)
+            if status:
+                db.executemany("INSERT INTO assignments VALUES (?, ?, ?, ?, ?) ON CONFLICT (dataset, row_id, annotator) "
+                               "DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+                               [(dataset, row_id, annotator, status, now)
+                                for _, row_id, annotator, _, _ in records if annotator])
+
+    def lease(self, dataset, row_ids, annotator, now):
+        """
+        Mark rows as leased to `annotator` at `now`, renewing their lease. Rows the annotator
+        is done with stay done.
+        """
+        with self.transaction() as db:
+            db.executemany("INSERT INTO assignments VALUES (?, ?, ?, 'leased', ?) ON CONFLICT (dataset, row_id, annotator) "
+                           "DO UPDATE SET updated_at = excluded.updated_at WHERE status = 'leased'",
+                           [(dataset, str(row_id), annotator, now) for row_id in row_ids])
+
+    def release(self, dataset, row_ids, annotator):
+        """
+        Drop the leases of `annotator` on rows they did not annotate.
+        """
+        with self.transaction() as db:
+            db.executemany("DELETE FROM assignments WHERE dataset = ? AND row_id = ? AND annotator = ? AND status = 'leased'",
+                           [(dataset, str(row_id), annotator) for row_id in row_ids])
+
+    def annotations(self, dataset, annotator=None):
+        """
+        Stored values of `dataset` in insertion order, optionally of one annotator only.
+        """
+        query = "SELECT data FROM annotations WHERE dataset = ?"
+        params = [dataset]
+        if annotator is not None:
+            query += " AND annotator = ?"
+            params.append(annotator)
+        return [json.loads(row["data"]) for row in self.connection().execute(query + " ORDER BY id", params)]
+
+    def count(self, dataset):
+        return self.connection().execute("SELECT COUNT(*) FROM annotations WHERE dataset = ?", (dataset,)).fetchone()[0]
+
+    def leases(self, dataset):
+        """
+        (row_id, annotator, leased at) of the rows of `dataset` leased and not annotated yet.
+        """
+        return [(row["row_id"], row["annotator"], row["updated_at"]) for row in self.connection().execute(
+            "SELECT row_id, annotator, updated_at FROM assignments WHERE dataset = ? AND status = 'leased'", (dataset,))]
+
+    def latest_values(self, dataset):
+        """
+        Latest value of every column written to each row, as {row_id: {column: value}}.
+        """
+        latest = {}
+        for row in self.connection().execute("SELECT row_id, data FROM annotations WHERE dataset = ? ORDER BY id", (dataset,)):
+            latest.setdefault(row["row_id"], {}).update(json.loads(row["data"]))
+        return latest
+
+    def to_dataframe(self, dataset):
+        """
+        The CSV layout the tools write today: annotation lines (the latest revision of each
+        row per annotator) for 'append' datasets, source rows with their latest answers for
+        'inplace' ones.
+        """
+        db = self.connection()
+        info = db.execute("SELECT layout, columns FROM datasets WHERE name = ?", (dataset,)).fetchone()
+        if info is None:
+            raise KeyError(f"Unknown dataset '{dataset}' in {self.path}")
+        columns = json.loads(info["columns"])
+        if info["layout"] == "append":
+            df = pd.DataFrame(latest_revisions(self.annotations(dataset)))
+        else:
+            latest = self.latest_values(dataset)
+            df = pd.DataFrame([dict(json.loads(row["data"]), **latest.get(row["row_id"], {}))
+                               for row in db.execute("SELECT row_id, data FROM source_rows WHERE dataset = ? "
+                                                     "ORDER BY position", (dataset,))])
+        extra = [c for c in df.columns if c not in columns]
+        return df.reindex(columns=columns + extra)
+
+    def export_csv(self, dataset, path=None):
+        if path is None:
+            path = self.connection().execute("SELECT csv_path FROM datasets WHERE name = ?", (dataset,)).fetchone()[0]
+        write_csv_atomic(self.to_dataframe(dataset), path)
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for db in connections:
+            db.close()
+        self._local = threading.local()
+
+
+class _Transaction:
+    """
+    `with` block running its statements in one immediate transaction, so a writer takes the
+    lock up front instead of failing to upgrade a read lock.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class SqliteStore(AnnotationStore):
+    """
+    Annotation backend on the SQLite database of the annotations folder (`annotations.sqlite`),
+    shared by every batch and process. Annotations already written by the CSV or journal
+    backends are imported on first use.
+    """
+
+    def __init__(self, csv_path, columns):
+        super().__init__(csv_path, columns)
+        self.dataset = os.path.basename(csv_path)
+        self.db = AnnotationDatabase(os.path.join(os.path.dirname(csv_path) or ".", DATABASE_NAME))
+        self.db.register_dataset(self.dataset, "append", self.columns, csv_path)
+        if self.db.count(self.dataset) == 0:
+            # one transaction for the whole import
+            legacy = list(self._legacy_rows())
+            if legacy:
+                self.append_many(legacy)
+
+    def _legacy_rows(self):
+        journal_path = f"{self.csv_path}.journal"
+        if os.path.exists(journal_path):
+            with open(journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+        elif os.path.exists(self.csv_path):
+            yield from pd.read_csv(self.csv_path).to_dict("records")
+
+    def _write(self, rows):
+        with phase("write"):
+            self.db.add_annotations(self.dataset, [(row.get("row_id", ""), row.get("annotator", ""), row)
+                                                   for row in rows])
+
+    def rows(self):
+        return self.db.annotations(self.dataset)
+
+    def __len__(self):
+        return self.db.count(self.dataset)
+
+    def to_dataframe(self):
+        return self.db.to_dataframe(self.dataset)
+
+    def lease_log(self, row_ids):
+        return LeaseLog(self.db, self.dataset, row_ids)
+
+    def close(self):
+        self.db.close()
+
+
+class LeaseLog:
+    """
+    Leases of a LeaseScheduler kept in the `assignments` table, so a restarted server gives
+    every annotator back the rows they held until their lease expires. The scheduler works
+    on row positions, the table on the `row_ids` of those positions.
+    """
+
+    def __init__(self, db, dataset, row_ids):
+        self.db = db
+        self.dataset = dataset
+        self.row_ids = [str(row_id) for row_id in row_ids]
+
+    def leased(self, annotator, rows, now):
+        self.db.lease(self.dataset, [self.row_ids[row] for row in rows], annotator, now)
+
+    def released(self, annotator, rows):
+        self.db.release(self.dataset, [self.row_ids[row] for row in rows], annotator)
+
+    def active(self):
+        """
+        (row position, annotator, leased at) of the stored leases.
+        """
+        positions = {row_id: pos for pos, row_id in enumerate(self.row_ids)}
+        return [(positions[row_id], annotator, leased_at) for row_id, annotator, leased_at in self.db.leases(self.dataset)
+                if row_id in positions]
+
+
+def export(db_path: str = os.path.join("annotations", DATABASE_NAME), dataset: str = None, output_dir: str = None):
+    """
+    Regenerate the CSV files of the datasets in the database (all of them unless `dataset`
+    is given), at the paths the tools write them to or in `output_dir`.
+    """
+    db = AnnotationDatabase(db_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    for info in db.datasets():
+        if dataset and info["name"] != dataset:
+            continue
+        path = os.path.join(output_dir, info["name"]) if output_dir else info["csv_path"]
+        db.export_csv(info["name"], path)
+        print(f"{info['name']} ({info['layout']}) exported to {path}")
+
+
+if __name__ == "__main__":
+    fire.Fire(export)
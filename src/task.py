@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+
+# input types of a task field, and the Gradio component each one is shown with
+FIELD_TYPES = {"choice": "Radio", "multi_choice": "CheckboxGroup", "text": "Textbox", "pair_choice": "Radio"}
+
+
+def read_config(path):
+    """
+    Read a task config from a JSON or YAML file (YAML needs the `pyyaml` package).
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            import yaml  # optional dependency, only needed for YAML configs
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _empty(value):
+    return value is None or value == "" or value == [] or value != value
+
+
+class Task:
+    """
+    Annotation task declared by a config (see tasks/*.yaml): the columns shown for every row,
+    the fields the annotator fills in, their rating scales, the optional blind pair and the
+    columns of the stored annotations.
+
+    `items` lists, in display order, what the form shows: a dataset column (`show`), a member
+    of the blind pair (`pair`, 1-based display position), an input (`field`) or a `markdown`
+    text; each item goes to `column` 1 or 2 of the layout. With a `blind_pair`, the two
+    columns it lists are shown in a random order per row, decided by a hash of the row id so
+    it needs no write and is the same on every load; `pair_choice` fields and fields tied to
+    a `pair` position are stored under the real member.
+    """
+
+    def __init__(self, config, path=""):
+        self.path = path
+        self.name = config.get("name") or os.path.splitext(os.path.basename(path))[0]
+        self.title = config.get("title", self.name)
+        self.defaults = dict(config.get("defaults") or {})
+        self.stratify_by = list(config.get("stratify_by") or [])
+        self.seed = config.get("seed", 0)
+        self.scales = dict(config.get("scales") or {})
+        self.blind_pair = config.get("blind_pair")
+        if self.blind_pair and len(self.blind_pair.get("columns") or []) != 2:
+            raise ValueError(f"The blind_pair of task {self.name!r} needs the two `columns` compared")
+        self.items = [self._check_item(dict(item)) for item in config.get("items") or []]
+        self.fields = [item for item in self.items if "field" in item]
+        if not self.fields:
+            raise ValueError(f"Task {self.name!r} declares no field to fill in")
+        self.outcome_config = config.get("outcome")
+
+        answers = []
+        positions = {}
+        for item in self.fields:
+            if "pair" in item:
+                # the two positions of the pair share their columns
+                positions.setdefault(tuple(item["field"]), []).append(item["pair"])
+                if len(positions[tuple(item["field"])]) > 1:
+                    continue
+            answers += item["field"] if isinstance(item["field"], list) else [item["field"]]
+        if len(set(answers)) != len(answers):
+            raise ValueError(f"Task {self.name!r} stores several fields in the same column")
+        for columns, shown in positions.items():
+            if sorted(shown) != [1, 2]:
+                raise ValueError(f"Fields {list(columns)} must be asked once for each pair position")
+        self.answer_columns = answers
+        metadata = ["timestamp", "annotator"] + answers + ["annotation_time"]
+        if self.blind_pair:
+            metadata.append(self.swap_column)
+        self.output_columns = list(config.get("output") or metadata)
+        missing = set(metadata) - set(self.output_columns)
+        if missing:
+            raise ValueError(f"Output columns of task {self.name!r} miss {sorted(missing)}")
+
+    def _check_item(self, item):
+        kinds = [key for key in ("show", "pair", "field", "markdown") if key in item]
+        if not kinds:
+            raise ValueError(f"Task item {item} has none of show, pair, field or markdown")
+        if "field" not in item:
+            if "pair" in item:
+                self._check_pair_position(item)
+            return item
+
+        kind = item.setdefault("type", "choice")
+        if kind not in FIELD_TYPES:
+            raise ValueError(f"Field {item['field']!r} has unknown type {kind!r}, expected one of {sorted(FIELD_TYPES)}")
+        if kind == "pair_choice" and not self.blind_pair:
+            raise ValueError(f"Field {item['field']!r} is a pair_choice but the task has no blind_pair")
+        if "pair" in item:
+            self._check_pair_position(item)
+            if not (isinstance(item["field"], list) and len(item["field"]) == 2):
+                raise ValueError(f"Field {item['field']!r} rates a pair member: list one column per member")
+        elif isinstance(item["field"], list):
+            raise ValueError(f"Field {item['field']!r} lists several columns without a pair position")
+        if "scale" in item:
+            if item["scale"] not in self.scales:
+                raise ValueError(f"Field {item['field']!r} uses the undeclared scale {item['scale']!r}")
+            item["choices"] = list(self.scales[item["scale"]]["choices"])
+        if kind == "pair_choice":
+            item["choices"] = self.pair_labels
+        if kind in ("choice", "multi_choice") and not item.get("choices"):
+            raise ValueError(f"Field {item['field']!r} needs `choices` or a `scale`")
+        item.setdefault("label", item["field"] if isinstance(item["field"], str) else item["field"][0])
+        return item
+
+    def _check_pair_position(self, item):
+        if not self.blind_pair:
+            raise ValueError(f"Task item {item} shows a pair member but the task has no blind_pair")
+        if item["pair"] not in (1, 2):
+            raise ValueError(f"Task item {item} has pair {item['pair']!r}, expected 1 or 2")
+
+    @property
+    def pair_labels(self):
+        return list(self.blind_pair.get("labels", ["Model 1", "Model 2"]))
+
+    @property
+    def required(self):
+        """
+        Fields that must be filled before the example can be validated.
+        """
+        return [item for item in self.fields if item.get("required")]
+
+    @property
+    def swap_column(self):
+        return self.blind_pair.get("swap_column", "swap_flag") if self.blind_pair else None
+
+    def swapped(self, row):
+        """
+        Whether the blind pair of the row is shown in reverse order: the swap column of the
+        dataset when it is already decided there (e.g. by the V2 tool), else a hash of the
+        row id.
+        """
+        if not self.blind_pair:
+            return False
+        decided = row.get(self.swap_column)
+        if not _empty(decided):
+            return str(decided).lower() in ("true", "1")
+        digest = hashlib.blake2b(f"{self.seed}:{row.get('row_id')}".encode("utf-8"), digest_size=1).digest()
+        return bool(digest[0] & 1)
+
+    def display(self, row, swapped):
+        """
+        Values of the shown items (`show` and `pair`) for a row, in display order.
+        """
+        values = []
+        for item in self.items:
+            if "show" in item:
+                values.append(row.get(item["show"], ""))
+            elif "pair" in item and "field" not in item:
+                member = (item["pair"] - 1) ^ swapped
+                values.append(row.get(self.blind_pair["columns"][member], ""))
+        return values
+
+    def missing(self, values):
+        """
+        Whether a required field is empty in `values` (one value per field, in order).
+        """
+        return any(item.get("required") and _empty(value) for item, value in zip(self.fields, values))
+
+    def answers(self, values, swapped):
+        """
+        Columns to store for the values given to the fields, mapped back to the real members
+        of the blind pair.
+        """
+        answers = {}
+        for item, value in zip(self.fields, values):
+            kind = item["type"]
+            if kind == "multi_choice":
+                value = "".join(item.get("format", "[{}]").format(choice) for choice in value or [])
+            elif kind == "pair_choice" and value:
+                value = self.pair_labels[self.pair_labels.index(value) ^ swapped]
+            if _empty(value):
+                value = item.get("empty", "")
+            if "pair" in item:
+                answers[item["field"][(item["pair"] - 1) ^ swapped]] = value
+            else:
+                answers[item["field"]] = value
+        return answers
+
+    def outcome(self, annotation):
+        """
+        Share of the `outcome.fields` of a stored annotation holding a `success` value, or
+        None when they are all empty or `ignore`d. Scores annotations for the adaptive order.
+        """
+        if not self.outcome_config:
+            return None
+        success = set(self.outcome_config.get("success", []))
+        ignore = set(self.outcome_config.get("ignore", []))
+        values = [annotation.get(column) for column in self.outcome_config["fields"]]
+        values = [value for value in values if not _empty(value) and value not in ignore]
+        if not values:
+            return None
+        return sum(value in success for value in values) / len(values)
+
+    def hotkeys(self):
+        """
+        (elem_id, {key: choice}) of the fields whose scale declares `keys`, for keyboard.py.
+        """
+        fields = []
+        for n, item in enumerate(self.fields):
+            keys = self.scales.get(item.get("scale"), {}).get("keys") or item.get("keys")
+            if keys:
+                fields.append((f"field_{n}", keys))
+        return fields
+
+
+def load_task(path):
+    return Task(read_config(path), path)
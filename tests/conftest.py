@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in (ROOT, os.path.join(ROOT, "src"), os.path.join(ROOT, "DetoxAnnotatorV2")):
+    sys.path.insert(0, folder)
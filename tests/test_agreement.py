@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agreement import cohen_kappa, count_matrix, fleiss_kappa, krippendorff_alpha, load_annotations
+
+
+def long_format(table):
+    """
+    Long lines of a {annotator: [value of each item, None when missing]} table.
+    """
+    return pd.DataFrame([{"item": str(item), "annotator": annotator, "value": str(value)}
+                         for annotator, values in table.items()
+                         for item, value in enumerate(values) if value is not None])
+
+
+def test_fleiss_kappa():
+    # example of Fleiss (1971) as given on Wikipedia: 10 items, 14 raters, 5 categories
+    counts = pd.DataFrame([[0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0],
+                           [2, 2, 8, 1, 1], [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2],
+                           [6, 5, 2, 1, 0], [0, 2, 2, 3, 7]])
+    assert fleiss_kappa(counts) == pytest.approx(0.210, abs=1e-3)
+
+
+def test_krippendorff_alpha_with_missing_values():
+    # nominal example of Krippendorff (2011): 4 observers, 12 units, missing values
+    long = long_format({
+        "A": [1, 2, 3, 3, 2, 1, 4, 1, 2, None, None, None],
+        "B": [1, 2, 3, 3, 2, 2, 4, 1, 2, 5, None, 3],
+        "C": [None, 3, 3, 3, 2, 3, 4, 2, 2, 5, 1, None],
+        "D": [1, 2, 3, 3, 2, 4, 4, 1, 2, 5, 1, None],
+    })
+    assert krippendorff_alpha(count_matrix(long), "nominal") == pytest.approx(0.743, abs=1e-3)
+
+
+def test_cohen_kappa():
+    # 50 items: both yes 20, yes/no 5, no/yes 10, both no 15
+    a = ["yes"] * 25 + ["no"] * 25
+    b = ["yes"] * 20 + ["no"] * 5 + ["yes"] * 10 + ["no"] * 15
+    mean, per_pair = cohen_kappa(long_format({"a": a, "b": b}))
+    assert mean == pytest.approx(0.4)
+    assert per_pair["items"].tolist() == [50]
+
+
+def test_latest_answer_per_annotator(tmp_path):
+    pd.DataFrame({
+        "row_id": ["0", "0", "0", "1", "1"],
+        "text": ["x", "x", "x", "y", "y"],
+        "annotator": ["ann", "ann", "ann", "ann", "ann"],
+        # a hand-edited line without timestamp, and an edit with the same timestamp
+        "timestamp": ["", "10", "10", "5", "6"],
+        "revision": ["", "1", "2", "1", "2"],
+        "Rating_Neutral": ["F", "A", "B", "A", "F"],
+    }).to_csv(tmp_path / "annotations_batch_1.csv", index=False)
+
+    long = load_annotations([str(tmp_path)], workers=1)
+    assert long.sort_values("item")["value"].tolist() == ["B", "F"]
+    assert np.array_equal(long["annotator"].unique(), ["ann"])
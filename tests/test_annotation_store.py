@@ -0,0 +1,64 @@
+import json
+import os
+
+import pandas as pd
+
+from annotation_store import JournalStore
+
+COLUMNS = ["row_id", "text", "timestamp", "annotator", "label"]
+
+
+def test_rows_survive_a_torn_last_line(tmp_path):
+    csv_path = str(tmp_path / "annotations_batch_1.csv")
+    store = JournalStore(csv_path, COLUMNS)
+    store.append({"row_id": 0, "text": "a", "annotator": "ann", "label": "A"})
+    store.close()
+    with open(f"{csv_path}.journal", "a", encoding="utf-8") as f:
+        f.write('{"row_id": 1, "text": "b", "ann')
+
+    store = JournalStore(csv_path, COLUMNS)
+    store.append({"row_id": 2, "text": "c", "annotator": "ann", "label": "C"})
+    assert [row["row_id"] for row in store.rows()] == [0, 2]
+    assert len(store) == 2
+    store.close()
+
+
+def test_legacy_csv_is_migrated_once(tmp_path):
+    csv_path = str(tmp_path / "annotations_batch_1.csv")
+    pd.DataFrame({"text": ["a", "b"], "annotator": "ann", "label": ["A", "B"]}).to_csv(csv_path, index=False)
+
+    store = JournalStore(csv_path, COLUMNS)
+    store.append({"row_id": 2, "text": "c", "annotator": "ann", "label": "C"})
+    store.export_csv()
+    store.close()
+    # the exported CSV is not imported again
+    store = JournalStore(csv_path, COLUMNS)
+    assert [row["text"] for row in store.rows()] == ["a", "b", "c"]
+    store.close()
+
+    exported = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    assert exported["label"].tolist() == ["A", "B", "C"]
+
+
+def test_edits_are_new_revisions(tmp_path):
+    csv_path = str(tmp_path / "annotations_batch_1.csv")
+    store = JournalStore(csv_path, COLUMNS)
+    store.append({"row_id": 0, "annotator": "ann", "label": "A"})
+    store.append({"row_id": 0, "annotator": "bob", "label": "B"})
+    store.append({"row_id": 0, "annotator": "ann", "label": "F"})
+    assert [row["revision"] for row in store.rows()] == [1, 1, 2]
+    store.export_csv()
+    store.close()
+
+    exported = pd.read_csv(csv_path, dtype=str)
+    assert list(zip(exported["annotator"], exported["label"])) == [("ann", "F"), ("bob", "B")]
+    with open(f"{csv_path}.journal", encoding="utf-8") as f:
+        assert len([json.loads(line) for line in f]) == 3
+
+
+def test_nothing_is_exported_without_annotations(tmp_path):
+    csv_path = str(tmp_path / "annotations_batch_1.csv")
+    store = JournalStore(csv_path, COLUMNS)
+    store.export_csv()
+    store.close()
+    assert not os.path.exists(csv_path)
@@ -0,0 +1,43 @@
+import json
+import time
+
+from committer import BackgroundCommitter
+
+
+def failing(batch):
+    raise OSError("disk full")
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_batches_are_committed_in_order():
+    committed = []
+    committer = BackgroundCommitter(committed.extend)
+    for n in range(20):
+        committer.put(n)
+    assert committer.flush(5)
+    committer.close()
+    assert committed == list(range(20))
+
+
+def test_retries_are_capped_and_fall_back_to_a_file(tmp_path):
+    fallback = tmp_path / "annotations.unsaved.jsonl"
+    committer = BackgroundCommitter(failing, fallback_path=str(fallback), retry_delay=0.01, max_retries=3)
+    committer.put({"row_id": 1})
+    assert committer.flush(5)
+    committer.close()
+    assert read_jsonl(fallback) == [{"row_id": 1}]
+
+
+def test_close_does_not_wait_for_the_retries(tmp_path):
+    fallback = tmp_path / "annotations.unsaved.jsonl"
+    committer = BackgroundCommitter(failing, fallback_path=str(fallback), retry_delay=60)
+    committer.put((3, {"label": "A"}))
+    time.sleep(0.1)
+    start = time.perf_counter()
+    committer.close()
+    assert time.perf_counter() - start < 5
+    assert read_jsonl(fallback) == [[3, {"label": "A"}]]
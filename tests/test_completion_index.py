@@ -0,0 +1,48 @@
+from completion_index import CompletionIndex
+
+
+def test_cursor_follows_rows_done_in_any_order(tmp_path):
+    index = CompletionIndex(str(tmp_path / "batch.done"), 5)
+    assert index.next_pending() == 0
+    index.mark(1)
+    index.mark(0)
+    assert index.next_pending() == 2
+    assert index.next_pending(start=3) == 3
+    index.mark(3)
+    index.mark(4)
+    # wraps around to the rows left before `start`
+    assert index.next_pending(start=3) == 2
+    assert index.pending_after(0, 5) == [2]
+    index.mark(2)
+    assert index.next_pending() is None
+    index.mark(1, done=False)
+    assert index.next_pending() == 1
+    assert index.done_count == 4
+    index.close()
+
+
+def test_marks_are_persisted(tmp_path):
+    path = str(tmp_path / "batch.done")
+    index = CompletionIndex(path, 4)
+    index.mark(2)
+    index.close()
+
+    # the sidecar is read as is, `done_positions` is only used to rebuild it
+    reopened = CompletionIndex(path, 4, done_positions=lambda: [0, 1])
+    assert [reopened.is_done(pos) for pos in range(4)] == [False, False, True, False]
+    reopened.close()
+
+
+def test_rebuild(tmp_path):
+    path = str(tmp_path / "batch.done")
+    index = CompletionIndex(path, 3)
+    index.close()
+
+    # a sidecar of another size is rebuilt from the stored annotations
+    index = CompletionIndex(path, 4, done_positions=lambda: [0, 2])
+    assert (index.done_count, index.next_pending()) == (2, 1)
+    index.rebuild([0, 1, 2, 3])
+    assert (index.done_count, index.next_pending()) == (4, None)
+    index.close()
+    with open(path, "rb") as f:
+        assert f.read() == bytes([1, 1, 1, 1])
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from dedup import find_duplicates, propagate
+
+BASE = "you are a complete idiot and everyone in this thread knows it"
+
+
+def test_exact_and_near_duplicates():
+    texts = [
+        BASE,
+        "Thanks for the help with the article, much appreciated.",
+        "  You are a COMPLETE idiot and everyone in this thread knows it ",
+        BASE + " too",
+        "Thanks for the help with the article, much appreciated.",
+    ]
+    clusters = find_duplicates(texts, threshold=0.7)
+    assert clusters["representative"].tolist() == [0, 1, 0, 0, 1]
+    assert clusters["match"].tolist() == ["", "", "exact", "near", "exact"]
+
+
+def test_unrelated_texts_stay_apart():
+    texts = [f"comment number {i} about topic {i * 7919 % 1000}" for i in range(50)]
+    clusters = find_duplicates(texts, threshold=0.9)
+    assert (clusters["match"] == "").all()
+
+
+def test_propagate_copies_the_annotations_to_the_duplicates(tmp_path):
+    annotations = tmp_path / "annotations_batch_1.csv"
+    pd.DataFrame({"row_id": ["0", "1", ""], "annotator": "ann", "label": ["A", "B", "legacy"]}) \
+        .to_csv(annotations, index=False)
+    clusters = tmp_path / "clusters.csv"
+    pd.DataFrame({"row_id": ["0", "1", "2", "3"], "representative_id": ["0", "1", "0", "0"],
+                  "match": ["", "", "exact", "near"]}).to_csv(clusters, index=False)
+
+    output = propagate(str(annotations), str(clusters))
+    result = pd.read_csv(output, dtype=str, keep_default_na=False)
+    assert list(zip(result["row_id"], result["label"], result["propagated_from"])) == \
+        [("0", "A", ""), ("1", "B", ""), ("", "legacy", ""), ("2", "A", "0"), ("3", "A", "0")]
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from annotation_store import JournalStore
+from merge import merge
+
+COLUMNS = ["text", "Class", "timestamp", "annotator", "Rating_Neutral"]
+
+
+def read_merged(path):
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def test_journal_with_migrated_legacy_rows(tmp_path):
+    dataset = tmp_path / "dataset.csv"
+    pd.DataFrame({"text": [f"text {i}" for i in range(6)], "Class": "insult"}).to_csv(dataset, index=False)
+    folder = tmp_path / "annotations"
+    folder.mkdir()
+    # annotations of rows 0-1 in the layout written before row ids were recorded
+    csv_path = str(folder / "annotations_batch_1.csv")
+    pd.DataFrame({"text": ["text 0", "text 1"], "Class": "insult", "timestamp": [1.0, 2.0],
+                  "annotator": "ann", "Rating_Neutral": ["A", "B"]}).to_csv(csv_path, index=False)
+
+    store = JournalStore(csv_path, COLUMNS + ["row_id"])
+    store.append({"text": "text 2", "Class": "insult", "row_id": 2, "timestamp": 3.0,
+                  "annotator": "ann", "Rating_Neutral": "F"})
+    store.close()
+
+    output = str(tmp_path / "merged.csv")
+    merge(str(dataset), [str(folder)], output)
+    merged = read_merged(output)
+    assert merged["Rating_Neutral"].tolist() == ["A", "B", "F", "", "", ""]
+
+
+def test_latest_revision_per_annotator(tmp_path):
+    dataset = tmp_path / "dataset.csv"
+    pd.DataFrame({"row_id": ["a", "b"], "text": ["x", "y"]}).to_csv(dataset, index=False)
+    annotations = tmp_path / "annotations_batch_1.csv"
+    pd.DataFrame({
+        "row_id": ["a", "a", "a", "b"],
+        "annotator": ["ann", "ann", "bob", "ann"],
+        "timestamp": ["5", "5", "1", ""],
+        "revision": ["2", "1", "1", "1"],
+        "label": ["edited", "first", "bob", "y"],
+    }).to_csv(annotations, index=False)
+
+    output = str(tmp_path / "merged.csv")
+    merge(str(dataset), [str(annotations)], output)
+    merged = read_merged(output)
+    assert list(zip(merged["row_id"], merged["annotator"], merged["label"])) == \
+        [("a", "ann", "edited"), ("a", "bob", "bob"), ("b", "ann", "y")]
+    assert set(merged["annotation_file"]) == {"annotations_batch_1.csv"}
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from ordering import AdaptiveOrder, StratifiedOrder, make_order
+from scheduler import LeaseScheduler
+
+STRATA = np.array([0, 0, 0, 1, 1, 2, 0, 1])
+
+
+def test_rows_are_dealt_round_robin_over_the_strata():
+    order = StratifiedOrder(STRATA, range(8))
+    assert list(order) == [0, 3, 5, 1, 4, 2, 7, 6]
+    assert [order.popleft() for _ in range(3)] == [0, 3, 5]
+    order.appendleft(5)
+    order.append(0)
+    assert len(order) == 7
+    assert list(order) == [5, 1, 4, 2, 7, 6, 0]
+    assert [order.popleft() for _ in range(7)] == [5, 1, 4, 2, 7, 6, 0]
+    with pytest.raises(IndexError):
+        order.popleft()
+
+
+def test_adaptive_order_serves_the_least_settled_stratum_first():
+    def outcome(annotation):
+        return annotation.get("win")
+
+    # stratum 0 is settled, stratum 1 is split, stratum 2 has no observation
+    observed = [(0, {"win": 1})] * 6 + [(3, {"win": 1}), (4, {"win": 0}), (0, {})]
+    order = AdaptiveOrder(STRATA, [1, 2, 6, 7, 5], outcome, observed)
+    assert order.uncertainty(0) < order.uncertainty(1) <= order.uncertainty(2) == 0.5
+    assert [order.popleft() for _ in range(2)] == [5, 7]
+    # the settled stratum comes last
+    assert list(order) == [1, 2, 6]
+
+    order.observe(1, {"win": 0})
+    order.observe(1, {"win": 0})
+    assert order.popleft() == 1
+
+
+def test_orders_drive_the_scheduler():
+    scheduler = LeaseScheduler([1] * 8, order=make_order("stratified", range(8), STRATA))
+    leased = []
+    while (row := scheduler.lease("ann")) is not None:
+        leased.append(row)
+        scheduler.complete("ann", row, {})
+    assert leased == [0, 3, 5, 1, 4, 2, 7, 6]
+    assert list(make_order("file", [2, 1])) == [2, 1]
+    with pytest.raises(ValueError):
+        make_order("random", range(8), STRATA)
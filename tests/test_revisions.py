@@ -0,0 +1,48 @@
+from revisions import RevisionIndex, latest_revisions
+
+
+def test_edits_get_the_next_revision():
+    index = RevisionIndex()
+    first = {"row_id": 3, "annotator": "ann", "label": "A"}
+    other = {"row_id": 3, "annotator": "bob", "label": "B"}
+    edit = {"row_id": "3", "annotator": "ann", "label": "F"}
+    index.assign([first, other])
+    index.assign([edit])
+    assert (first["revision"], other["revision"], edit["revision"]) == (1, 1, 2)
+    assert index.latest(3, "ann") is edit
+    assert index.revision("3", "bob") == 1
+    assert index.revision(4, "ann") == 0
+    assert index.row_ids() == {"3"}
+    assert len(index) == 2
+
+
+def test_retried_rows_keep_their_revision():
+    index = RevisionIndex([{"row_id": 1, "annotator": "ann", "revision": 1}])
+    retried = {"row_id": 1, "annotator": "ann", "revision": 2}
+    index.assign([retried, dict(retried)])
+    assert index.revision(1, "ann") == 2
+
+
+def test_rows_without_revision_or_row_id():
+    rows = [
+        {"row_id": 0, "annotator": "ann", "label": "A"},
+        {"text": "legacy", "annotator": "ann", "label": "B"},
+        {"row_id": 0, "annotator": "ann", "label": "C"},
+    ]
+    index = RevisionIndex(rows)
+    # numbered in the order stored
+    assert index.revision(0, "ann") == 2
+    assert index.latest(0, "ann")["label"] == "C"
+    assert len(index) == 2
+
+
+def test_latest_revisions_keep_the_place_of_the_first_one():
+    rows = [
+        {"row_id": 0, "annotator": "ann", "revision": 1, "label": "A"},
+        {"row_id": 1, "annotator": "ann", "revision": 1, "label": "B"},
+        {"text": "legacy", "annotator": "ann", "label": "L"},
+        {"row_id": 0, "annotator": "ann", "revision": 2, "label": "F"},
+        {"row_id": 0, "annotator": "bob", "revision": 1, "label": "B"},
+    ]
+    assert [(row.get("row_id"), row["annotator"], row["label"]) for row in latest_revisions(rows)] == \
+        [(0, "ann", "F"), (1, "ann", "B"), (None, "ann", "L"), (0, "bob", "B")]
@@ -0,0 +1,81 @@
+import time
+
+from annotation_store import JournalStore
+from scheduler import LeaseScheduler
+from sqlite_store import SqliteStore
+
+COLUMNS = ["row_id", "annotator", "label"]
+
+
+def test_leases_survive_a_restart_with_the_sqlite_store(tmp_path):
+    row_ids = [f"r{i}" for i in range(5)]
+    store = SqliteStore(str(tmp_path / "annotations_batch_1.csv"), COLUMNS)
+    scheduler = LeaseScheduler([1] * 5, lease_timeout=60, leases=store.lease_log(row_ids))
+    assert scheduler.lease_many("ann", 2) == [0, 1]
+    assert scheduler.lease("bob") == 2
+    store.append({"row_id": "r0", "annotator": "ann", "label": "A"})
+    scheduler.complete("ann", 0)
+    scheduler.release("bob")
+    store.close()
+
+    # restarted: ann gets row 1 back, rows 0 (done) and 1 (leased) are not handed to bob
+    store = SqliteStore(str(tmp_path / "annotations_batch_1.csv"), COLUMNS)
+    scheduler = LeaseScheduler([0, 1, 1, 1, 1], lease_timeout=60, completed=[(0, "ann")],
+                               leases=store.lease_log(row_ids))
+    assert scheduler.lease("bob") == 2
+    assert scheduler.lease("ann") == 1
+    store.close()
+
+
+def test_expired_leases_are_not_restored(tmp_path):
+    row_ids = ["a", "b"]
+    store = SqliteStore(str(tmp_path / "annotations_batch_1.csv"), COLUMNS)
+    store.lease_log(row_ids).leased("ann", [0], time.time() - 120)
+    scheduler = LeaseScheduler([1, 1], lease_timeout=60, leases=store.lease_log(row_ids))
+    assert scheduler.lease("bob") == 0
+    store.close()
+
+
+def test_other_stores_keep_leases_in_memory(tmp_path):
+    store = JournalStore(str(tmp_path / "annotations_batch_1.csv"), COLUMNS)
+    assert store.lease_log(["a"]) is None
+    store.close()
+
+
+def test_every_row_gets_its_distinct_annotators():
+    scheduler = LeaseScheduler([1, 2, 1])
+    assert scheduler.lease("ann") == 0
+    assert scheduler.lease("ann") == 0, "leasing again renews the lease"
+    assert scheduler.lease("bob") == 1
+    assert scheduler.lease("eve") == 1
+    scheduler.complete("ann", 0)
+    scheduler.complete("bob", 1)
+    assert scheduler.lease("ann") == 2
+    scheduler.complete("eve", 1)
+    scheduler.complete("ann", 2)
+    assert scheduler.lease("ann") is None
+    assert scheduler.remaining() == 0
+
+
+def test_expired_leases_go_back_to_the_front(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    scheduler = LeaseScheduler([1, 1, 1], lease_timeout=60)
+    assert scheduler.lease("ann") == 0
+    now[0] += 30
+    assert scheduler.lease("bob") == 1
+    now[0] += 31
+    # only the lease of ann expired
+    assert scheduler.lease("eve") == 0
+    # a late annotation still counts
+    scheduler.complete("bob", 1)
+    assert scheduler.peek("ann", 3) == [2]
+    assert scheduler.remaining() == 2
+
+
+def test_release_gives_the_rows_back():
+    scheduler = LeaseScheduler([1, 1, 1])
+    assert scheduler.lease_many("ann", 2) == [0, 1]
+    assert scheduler.lease("bob") == 2
+    scheduler.release("ann")
+    assert scheduler.lease_many("bob", 3) == [2, 0, 1]
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from scheduler import LeaseScheduler
+from server import load_dataset
+from split import split_stratified
+
+
+def test_stratified_folder_loads_overlap_rows_once(tmp_path):
+    dataset = tmp_path / "dataset.csv"
+    pd.DataFrame({
+        "text": [f"text {i}" for i in range(100)],
+        "Neutral": "n", "Formal": "f", "Friendly": "fr",
+        "Class": np.repeat(["insult", "threat"], 50),
+    }).to_csv(dataset, index=False)
+    batches = tmp_path / "batches"
+    split_stratified(str(dataset), 4, str(batches), stratify_by=["Class"], seed=0, overlap_fraction=0.2, overlap_k=2)
+
+    df, required = load_dataset(str(batches), crossval_k=2)
+    assert len(df) == 100
+    assert df["row_id"].is_unique
+    assert sum(required) == 120
+
+    # an annotator never gets the same source row twice
+    scheduler = LeaseScheduler(required)
+    leased = []
+    while (pos := scheduler.lease("ann")) is not None:
+        leased.append(df["row_id"].iloc[pos])
+        scheduler.complete("ann", pos)
+    assert len(leased) == len(set(leased)) == 100
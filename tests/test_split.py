@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from assignment import assign_batches
+from split import split_into_batches, split_stratified
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "dataset.csv"
+    pd.DataFrame({
+        "text": [f"text, {i}" for i in range(103)],
+        "Class": np.tile(["insult", "threat", "obscene"], 35)[:103],
+        # kept byte for byte: leading zeros, empty cells and floats are not parsed
+        "score": ["007", "", "1.50"] * 34 + ["NA"],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def read_files(folder):
+    contents = {}
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), "rb") as f:
+            contents[name] = f.read()
+    return contents
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_contiguous_streaming_is_identical(dataset, tmp_path, compression):
+    split_into_batches(dataset, 4, str(tmp_path / "loaded"), 25, seed=1, compression=compression)
+    split_into_batches(dataset, 4, str(tmp_path / "streamed"), 25, seed=1, chunksize=10, compression=compression)
+    loaded = read_files(tmp_path / "loaded")
+    assert loaded == read_files(tmp_path / "streamed")
+    assert len(loaded) == 4
+
+
+def test_contiguous_batches_keep_the_values(dataset, tmp_path):
+    split_into_batches(dataset, 4, str(tmp_path / "batches"), 0, seed=0)
+    names = sorted(os.listdir(tmp_path / "batches"), key=lambda name: int(name.split("_")[1].split(".")[0]))
+    batches = [pd.read_csv(tmp_path / "batches" / name, dtype=str, keep_default_na=False) for name in names]
+    assert [len(batch) for batch in batches] == [26, 26, 26, 25]
+    assert pd.concat(batches, ignore_index=True).equals(pd.read_csv(dataset, dtype=str, keep_default_na=False))
+
+
+def test_stratified_streaming_is_identical(dataset, tmp_path):
+    options = dict(stratify_by=["Class"], seed=3, overlap_fraction=0.2, overlap_k=3)
+    split_stratified(dataset, 4, str(tmp_path / "loaded"), **options)
+    split_stratified(dataset, 4, str(tmp_path / "streamed"), chunksize=7, **options)
+    assert read_files(tmp_path / "loaded") == read_files(tmp_path / "streamed")
+
+
+def test_overlapping_rows_go_to_distinct_batches():
+    strata = pd.Series(np.repeat(["a", "b", "c"], [50, 30, 20]))
+    assignments = assign_batches(100, 5, strata, seed=2, overlap_fraction=0.3, overlap_k=3)
+
+    per_row = assignments.groupby("row")["batch"]
+    assert per_row.nunique().equals(per_row.size())
+    crossval = assignments.groupby("row")["crossval"].first()
+    assert (per_row.size()[crossval] == 3).all()
+    assert (per_row.size()[~crossval] == 1).all()
+    assert crossval.groupby(strata).sum().tolist() == [15, 9, 6]
+
+
+
+def test_batches_get_the_same_share_of_each_stratum():
+    strata = pd.Series(np.repeat(["a", "b", "c"], [50, 30, 21]))
+    assignments = assign_batches(101, 5, strata, seed=2)
+    assert assignments["row"].tolist() == list(range(101))
+    shares = pd.crosstab(strata[assignments["row"]].to_numpy(), assignments["batch"])
+    assert (shares.max(axis=1) - shares.min(axis=1) <= 1).all()
+
+
+def test_assignment_is_reproducible():
+    strata = pd.Series(np.arange(40) % 4)
+    first = assign_batches(40, 3, strata, seed=5, overlap_fraction=0.5, overlap_k=2)
+    assert first.equals(assign_batches(40, 3, strata, seed=5, overlap_fraction=0.5, overlap_k=2))
+    with pytest.raises(ValueError):
+        assign_batches(40, 3, strata, overlap_fraction=0.5, overlap_k=4)
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from persistence import SqlitePersistence
+
+
+def test_answers_keyed_by_dataset_row_id(tmp_path):
+    csv_path = str(tmp_path / "batch_1.csv")
+    df = pd.DataFrame({"row_id": ["10", "11", "12"], "comment": ["a", "b", "c"], "rating_model_detox_mian": ""})
+    df.to_csv(csv_path, index=False)
+
+    store = SqlitePersistence(df.copy(), csv_path)
+    store.update(0, {"rating_model_detox_mian": "A", "annotator": "ann"})
+    store.close()
+
+    exported = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    assert exported["rating_model_detox_mian"].tolist() == ["A", "", ""]
+    assert store.db.latest_values("batch_1.csv") == {"10": {"rating_model_detox_mian": "A", "annotator": "ann"}}
+
+    # reopening replays the answers onto the right rows
+    reopened = SqlitePersistence(df.copy(), csv_path)
+    assert reopened.df["rating_model_detox_mian"].tolist() == ["A", "", ""]
+    reopened.close()
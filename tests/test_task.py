@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from task import Task, load_task
+
+TASKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tasks")
+PAIR = {"columns": ["model_a", "model_b"]}
+
+
+def config(*fields, **options):
+    return dict({"name": "test", "items": [{"show": "text"}] + list(fields)}, **options)
+
+
+@pytest.mark.parametrize("name", sorted(os.listdir(TASKS)))
+def test_shipped_tasks_load(name):
+    task = load_task(os.path.join(TASKS, name))
+    assert task.fields
+    assert set(task.answer_columns) <= set(task.output_columns)
+
+
+@pytest.mark.parametrize("bad, message", [
+    (config(), "no field"),
+    (config({"field": "label", "type": "slider"}), "unknown type"),
+    (config({"field": "label"}), "needs `choices`"),
+    (config({"field": "label", "scale": "grades"}), "undeclared scale"),
+    (config({"field": "label", "type": "pair_choice"}), "no blind_pair"),
+    (config({"field": "label", "type": "text"}, {"field": "label", "type": "text"}), "same column"),
+    (config({"field": ["a_rating", "b_rating"], "pair": 1, "choices": ["A", "B"]}, blind_pair=PAIR),
+     "once for each pair position"),
+    (config({"field": "label", "type": "text"}, output=["label"]), "miss"),
+    (config({"field": "label", "type": "text"}, blind_pair={"columns": ["model_a"]}), "two `columns`"),
+    (config({"label": "nothing"}, {"field": "label", "type": "text"}), "none of show"),
+])
+def test_invalid_configs_are_rejected(bad, message):
+    with pytest.raises(ValueError, match=message):
+        Task(bad)
+
+
+def test_blind_pair_answers_are_stored_under_the_real_member():
+    task = Task(config(
+        {"pair": 1}, {"pair": 2},
+        {"field": ["a_rating", "b_rating"], "pair": 1, "scale": "grades", "required": True},
+        {"field": ["a_rating", "b_rating"], "pair": 2, "scale": "grades", "required": True},
+        {"field": "preferred", "type": "pair_choice"},
+        {"field": "classes", "type": "multi_choice", "choices": ["x", "y"], "empty": "[none]"},
+        scales={"grades": {"choices": ["A", "B"]}}, blind_pair=PAIR))
+    row = {"text": "t", "model_a": "first", "model_b": "second", "row_id": 4}
+    assert task.display(row, True) == ["t", "second", "first"]
+    assert task.missing(["A", None, "Model 1", []])
+    assert task.answers(["A", "B", "Model 1", []], True) == \
+        {"b_rating": "A", "a_rating": "B", "preferred": "Model 2", "classes": "[none]"}
+    assert task.answers(["A", "B", "Model 1", ["x", "y"]], False)["classes"] == "[x][y]"
+    # decided once per row, or read from the swap column
+    assert task.swapped(row) == task.swapped(dict(row))
+    assert task.swapped(dict(row, swap_flag="True")) is True
+    assert task.output_columns[-1] == "swap_flag"